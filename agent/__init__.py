@@ -1,3 +1,15 @@
-from .agent import root_agent
+"""Holiday Gift Savior agent package."""
 
-__all__ = ['root_agent']
+__all__ = ['app', 'root_agent']
+
+
+def __getattr__(name):
+    # Build the agent tree on first access so tools such as agent.benchmark can
+    # import submodules without constructing it
+    if name == 'root_agent':
+        from .agent import get_root_agent
+        return get_root_agent()
+    if name == 'app':
+        from .agent import get_app
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,563 @@
+"""Admission control and per-user fair queueing in front of the concierge.
+
+The agent runs as a single small instance, so a household firing off many
+sessions at once could take every model call and push everyone else into the
+503 apology. `AdmissionController` sits in front of the root agent as a runner
+plugin:
+
+- at most `max_sessions` runs are in flight; further runs wait in one queue per
+  user_id, served by weighted round-robin, so a busy user only delays their own
+  requests;
+- a run is turned away immediately, with its place in line, when its user
+  already has `max_queue_per_user` runs waiting, the queues are full, or the
+  predicted wait exceeds `max_wait`; a queued run that still waits `max_wait`
+  is turned away too;
+- `ModelCallGate` caps concurrent model calls across all sessions (used by
+  ResilientLlm around every backend call, including hedges and retries).
+
+Queue depth, wait times and shed counts are available from `stats()` and, when
+telemetry is enabled, as `hgs.admission.*` metrics.
+
+Configuration (environment):
+    HGS_ADMISSION=0                  # disable admission control
+    HGS_MAX_SESSIONS=6               # runs in flight
+    HGS_MAX_MODEL_CALLS=12           # concurrent model calls (more than HGS_MAX_SESSIONS)
+    HGS_MAX_QUEUE=48                 # queued runs in total
+    HGS_MAX_QUEUE_PER_USER=3         # queued runs per user_id
+    HGS_MAX_QUEUE_WAIT=30            # seconds a run may wait for a slot
+    HGS_ADMISSION_LEASE_SECONDS=270  # reclaim slots held longer (default 3x HGS_REQUEST_DEADLINE_SECONDS)
+    HGS_USER_WEIGHTS="family_smith_123=2,support=3"
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.models import LlmResponse
+from google.genai.types import Content, Part
+
+from .telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+def parse_user_weights(spec: str) -> Dict[str, int]:
+    """Parse "user=2,other=3" into {user: 2, other: 3}."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        user_id, _, weight = item.partition("=")
+        weights[user_id.strip()] = max(1, int(weight or 1))
+    return weights
+
+
+@dataclass
+class AdmissionPolicy:
+    """Limits enforced by the AdmissionController."""
+
+    max_sessions: int = 6
+    max_model_calls: int = 12
+    max_queue: int = 48
+    max_queue_per_user: int = 3
+    max_wait: float = 30.0
+    """Seconds; runs predicted or found to wait longer are turned away."""
+
+    user_weights: Dict[str, int] = field(default_factory=dict)
+    """Round-robin weight per user_id (default 1): runs admitted per turn."""
+
+    expected_session_seconds: float = 10.0
+    """Session duration assumed for wait predictions until real ones are observed."""
+
+    lease_timeout: float = 270.0
+    """Slots held longer than this (a run whose release was lost) are reclaimed; 3x the request deadline."""
+
+    def __post_init__(self):
+        if self.max_model_calls <= self.max_sessions:
+            # Every admitted run fans out into parallel researcher calls
+            raise ValueError(
+                f"max_model_calls ({self.max_model_calls}) must be greater than "
+                f"max_sessions ({self.max_sessions})"
+            )
+
+    @classmethod
+    def from_env(cls) -> "AdmissionPolicy":
+        return cls(
+            max_sessions=int(os.getenv("HGS_MAX_SESSIONS", "6")),
+            max_model_calls=int(os.getenv("HGS_MAX_MODEL_CALLS", "12")),
+            max_queue=int(os.getenv("HGS_MAX_QUEUE", "48")),
+            max_queue_per_user=int(os.getenv("HGS_MAX_QUEUE_PER_USER", "3")),
+            max_wait=float(os.getenv("HGS_MAX_QUEUE_WAIT", "30")),
+            user_weights=parse_user_weights(os.getenv("HGS_USER_WEIGHTS", "")),
+            lease_timeout=float(
+                os.getenv("HGS_ADMISSION_LEASE_SECONDS")
+                or 3 * float(os.getenv("HGS_REQUEST_DEADLINE_SECONDS", "90"))
+                or 600
+            ),
+        )
+
+
+@dataclass
+class AdmissionDecision:
+    """Outcome of asking for a session slot."""
+
+    admitted: bool
+    reason: str
+    """"immediate", "queued", or why the run was shed ("user_queue_full", "queue_full", "predicted_wait", "timeout")."""
+
+    position: int = 0
+    """1-based place in line when the run was queued or shed."""
+
+    wait: float = 0.0
+    """Seconds spent waiting for the slot."""
+
+    estimated_wait: float = 0.0
+
+    @property
+    def message(self) -> str:
+        """What the user is told when the run is turned away."""
+        if self.reason == "user_queue_full":
+            return (
+                "🎁 You already have a few gift plans in the works! I'll be ready for this one as soon as "
+                "they finish, so please send it again in a moment. 🎄"
+            )
+        return (
+            f"🎁 The Holiday Gift Savior is very popular right now: you'd be number {self.position} in line "
+            f"(about {max(1, round(self.estimated_wait))} seconds). Please try again in a minute, "
+            "your gift recommendations will be worth the wait! 🎄"
+        )
+
+
+@dataclass
+class _Waiter:
+    key: str
+    user_id: str
+    future: asyncio.Future
+
+
+def _percentiles(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 3)
+
+    return {"count": len(ordered), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+class ModelCallSlot:
+    """One granted model call slot; releasing it more than once is a no-op."""
+
+    def __init__(self, gate: "ModelCallGate"):
+        self._gate = gate
+        self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            self._gate._release()
+
+
+class ModelCallGate:
+    """
+    FIFO limit on concurrent model calls.
+
+    Waiters are plain futures on the caller's event loop, so one gate can serve
+    consecutive asyncio.run() calls (benchmarks, batch runs).
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits: Deque[float] = deque(maxlen=2048)
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> ModelCallSlot:
+        """Wait for a model call slot; the caller must release it (or hand it to `wrap`)."""
+        started = time.monotonic()
+        with self._lock:
+            granted = self._in_flight < self.limit and not self._waiters
+            if granted:
+                self._in_flight += 1
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self._waiters.append(future)
+                _record_depth("model_call", 1)
+        if not granted:
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if future in self._waiters:
+                        self._waiters.remove(future)
+                        _record_depth("model_call", -1)
+                if future.done() and not future.cancelled():
+                    # The slot was passed to us just as we were cancelled
+                    self._release()
+                raise
+        wait = time.monotonic() - started
+        with self._lock:
+            self._waits.append(wait)
+        _record_wait("model_call", "admitted", wait)
+        return ModelCallSlot(self)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncGenerator[None, None]:
+        """Hold one model call slot for the duration of the block."""
+        slot = await self.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    async def wrap(
+        self, responses: AsyncGenerator[LlmResponse, None], slot: Optional[ModelCallSlot] = None
+    ) -> AsyncGenerator[LlmResponse, None]:
+        """
+        Stream `responses`, holding a slot only while the backend produces them.
+
+        Each response is passed on once the next one has arrived, so the last one
+        is yielded after the stream is used up and the slot released. ADK runs the
+        response's function calls while that last yield is suspended, including
+        transfer_to_agent, which runs the whole sub-agent workflow; those must not
+        hold the caller's slot.
+
+        Args:
+            responses: The backend call's responses
+            slot: A slot already acquired for this call, released here; without one
+                a slot is acquired on the first read
+        """
+        pending: Optional[LlmResponse] = None
+        slot = slot or await self.acquire()
+        try:
+            async for response in responses:
+                if pending is not None:
+                    yield pending
+                pending = response
+        finally:
+            await responses.aclose()
+            slot.release()
+        if pending is not None:
+            yield pending
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                future = self._waiters.popleft()
+                _record_depth("model_call", -1)
+                if not future.done():
+                    # The slot passes straight to the next waiter
+                    future.set_result(None)
+                    return
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiters),
+                "wait": _percentiles(list(self._waits)),
+            }
+
+
+class AdmissionController:
+    """
+    Session slots with per-user weighted round-robin queues and early load shedding.
+
+    Args:
+        policy: Limits and weights (defaults from the environment)
+    """
+
+    def __init__(self, policy: Optional[AdmissionPolicy] = None):
+        self.policy = policy or AdmissionPolicy.from_env()
+        self.model_calls = ModelCallGate(self.policy.max_model_calls)
+        # key -> (user_id, admitted at)
+        self._active: Dict[str, Tuple[str, float]] = {}
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        # Users with queued runs, in round-robin order; the head has `_credit` turns left
+        self._ring: Deque[str] = deque()
+        self._credit = 0
+        self._queued = 0
+        self._session_seconds = self.policy.expected_session_seconds
+        self._waits: Deque[float] = deque(maxlen=2048)
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def weight(self, user_id: str) -> int:
+        return self.policy.user_weights.get(user_id, 1)
+
+    async def acquire(self, user_id: str, key: str) -> AdmissionDecision:
+        """
+        Wait for a session slot, or decide to turn the run away.
+
+        Args:
+            user_id: The session's user; each user has their own queue
+            key: Unique id of the run (the invocation id), passed to `release`
+
+        Returns:
+            AdmissionDecision; when `admitted` is True the caller must call `release(key)`
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._reclaim_expired(started)
+            if len(self._active) < self.policy.max_sessions and not self._queued:
+                self._active[key] = (user_id, started)
+                decision = AdmissionDecision(admitted=True, reason="immediate")
+            else:
+                decision = self._check_queue(user_id)
+                if decision is None:
+                    waiter = _Waiter(key, user_id, asyncio.get_running_loop().create_future())
+                    self._enqueue(waiter)
+                    position, estimated_wait = self._position_locked(user_id)
+        if decision is not None:
+            self._report(decision)
+            return decision
+
+        try:
+            # Shielded: only _admit_waiting resolves the future, so a timeout cannot lose a granted slot
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.policy.max_wait)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not waiter.future.done():
+                    self._dequeue(waiter)
+            if not waiter.future.done():
+                decision = AdmissionDecision(
+                    admitted=False, reason="timeout", position=position,
+                    wait=time.monotonic() - started, estimated_wait=estimated_wait,
+                )
+                self._report(decision)
+                return decision
+        except asyncio.CancelledError:
+            # The caller went away; give up the place in line (or the slot just granted)
+            with self._lock:
+                if not waiter.future.done():
+                    self._dequeue(waiter)
+            if waiter.future.done():
+                self.release(key)
+            raise
+
+        decision = AdmissionDecision(
+            admitted=True, reason="queued", position=position,
+            wait=time.monotonic() - started, estimated_wait=estimated_wait,
+        )
+        self._report(decision)
+        return decision
+
+    def release(self, key: str) -> None:
+        """Free the slot held by a run (no-op for runs that were never admitted) and admit the next."""
+        with self._lock:
+            lease = self._active.pop(key, None)
+            if lease is None:
+                return
+            # Smoothed session duration for wait predictions
+            self._session_seconds += 0.2 * (time.monotonic() - lease[1] - self._session_seconds)
+            self._admit_waiting()
+
+    def _check_queue(self, user_id: str) -> Optional[AdmissionDecision]:
+        """A shed decision if the run may not queue, else None (caller holds the lock)."""
+        own = len(self._queues.get(user_id, ()))
+        if own >= self.policy.max_queue_per_user:
+            reason = "user_queue_full"
+        elif self._queued >= self.policy.max_queue:
+            reason = "queue_full"
+        else:
+            position, estimated_wait = self._position_locked(user_id, extra=1)
+            if estimated_wait <= self.policy.max_wait:
+                return None
+            return AdmissionDecision(
+                admitted=False, reason="predicted_wait", position=position, estimated_wait=estimated_wait
+            )
+        position, estimated_wait = self._position_locked(user_id, extra=1)
+        return AdmissionDecision(admitted=False, reason=reason, position=position, estimated_wait=estimated_wait)
+
+    def _position_locked(self, user_id: str, extra: int = 0) -> Tuple[int, float]:
+        """
+        Estimated (place in line, seconds to wait) of the user's last queued run.
+
+        Under weighted round-robin, the other users are served at most their weight
+        per round for every round this user needs.
+        """
+        own = len(self._queues.get(user_id, ())) + extra
+        rounds = math.ceil(own / self.weight(user_id)) if own else 0
+        position = own + sum(
+            min(len(queue), rounds * self.weight(other))
+            for other, queue in self._queues.items() if other != user_id
+        )
+        estimated_wait = math.ceil(position / self.policy.max_sessions) * self._session_seconds
+        return position, estimated_wait
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queue = self._queues.setdefault(waiter.user_id, deque())
+        if not queue:
+            self._ring.append(waiter.user_id)
+            if len(self._ring) == 1:
+                self._credit = self.weight(waiter.user_id)
+        queue.append(waiter)
+        self._queued += 1
+        _record_depth("session", 1)
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        _record_depth("session", -1)
+        if not queue:
+            self._drop_user(waiter.user_id)
+
+    def _drop_user(self, user_id: str) -> None:
+        del self._queues[user_id]
+        was_head = self._ring and self._ring[0] == user_id
+        self._ring.remove(user_id)
+        if was_head and self._ring:
+            self._credit = self.weight(self._ring[0])
+
+    def _admit_waiting(self) -> None:
+        """Hand free slots to queued runs in weighted round-robin order (caller holds the lock)."""
+        while len(self._active) < self.policy.max_sessions and self._ring:
+            user_id = self._ring[0]
+            queue = self._queues[user_id]
+            waiter = queue.popleft()
+            self._queued -= 1
+            self._credit -= 1
+            _record_depth("session", -1)
+            if not queue:
+                self._drop_user(user_id)
+            elif self._credit <= 0:
+                self._ring.rotate(-1)
+                self._credit = self.weight(self._ring[0])
+            self._active[waiter.key] = (user_id, time.monotonic())
+            waiter.future.set_result(None)
+
+    def _reclaim_expired(self, now: float) -> None:
+        """Drop leases of runs that never released their slot (caller holds the lock)."""
+        expired = [
+            key for key, (_, admitted_at) in self._active.items() if now - admitted_at > self.policy.lease_timeout
+        ]
+        for key in expired:
+            user_id, _ = self._active.pop(key)
+            logger.warning("Reclaiming admission slot of %s held for over %.0fs", user_id, self.policy.lease_timeout)
+        if expired:
+            self._admit_waiting()
+
+    def _report(self, decision: AdmissionDecision) -> None:
+        with self._lock:
+            self._counts[decision.reason] = self._counts.get(decision.reason, 0) + 1
+            if decision.admitted:
+                self._waits.append(decision.wait)
+        if not decision.admitted:
+            logger.info(
+                "Shedding run (%s): position %d, estimated wait %.1fs",
+                decision.reason, decision.position, decision.estimated_wait,
+            )
+        _record_wait("session", decision.reason, decision.wait)
+
+    def stats(self) -> dict:
+        """Slots in use, queue depth per user, wait-time percentiles and decision counts."""
+        with self._lock:
+            return {
+                "in_flight": len(self._active),
+                "queued": self._queued,
+                "queued_per_user": {user_id: len(queue) for user_id, queue in self._queues.items()},
+                "wait": _percentiles(list(self._waits)),
+                "session_seconds": round(self._session_seconds, 3),
+                "decisions": dict(sorted(self._counts.items())),
+                "model_calls": self.model_calls.stats(),
+            }
+
+
+def _record_depth(kind: str, delta: int) -> None:
+    telemetry = get_telemetry()
+    if telemetry is not None:
+        telemetry.record_queue_depth(kind, delta)
+
+
+def _record_wait(kind: str, outcome: str, wait: float) -> None:
+    telemetry = get_telemetry()
+    if telemetry is not None:
+        telemetry.record_admission(kind, outcome, wait)
+
+
+class AdmissionPlugin(BasePlugin):
+    """
+    Runner plugin that holds each run until the controller admits it, or answers with its place in line.
+
+    ADK calls neither after_run nor on_run_error when a run is cancelled (e.g. the
+    client disconnected while streaming), so an admitted run's slot is also
+    released when the task driving it ends.
+    """
+
+    def __init__(self, controller: AdmissionController):
+        super().__init__(name="hgs_admission")
+        self.controller = controller
+        # invocation id -> (task driving the run, its done callback)
+        self._watched: Dict[str, Tuple[asyncio.Task, object]] = {}
+
+    async def before_run_callback(self, *, invocation_context) -> Optional[Content]:
+        key = invocation_context.invocation_id
+        decision = await self.controller.acquire(invocation_context.user_id, key)
+        if not decision.admitted:
+            return Content(role="model", parts=[Part(text=decision.message)])
+        task = asyncio.current_task()
+        if task is not None:
+            callback = functools.partial(self._on_task_done, key)
+            task.add_done_callback(callback)
+            self._watched[key] = (task, callback)
+        return None
+
+    async def after_run_callback(self, *, invocation_context) -> None:
+        self._release(invocation_context.invocation_id)
+
+    async def on_run_error_callback(self, *, invocation_context, error: Exception) -> None:
+        # after_run is skipped when the run fails
+        self._release(invocation_context.invocation_id)
+
+    def _release(self, key: str) -> None:
+        watched = self._watched.pop(key, None)
+        if watched is not None:
+            task, callback = watched
+            task.remove_done_callback(callback)
+        self.controller.release(key)
+
+    def _on_task_done(self, key: str, task: asyncio.Task) -> None:
+        if self._watched.pop(key, None) is not None:
+            logger.info("Run %s ended without after_run (cancelled); releasing its admission slot", key)
+            self.controller.release(key)
+
+
+_admission_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def admission_enabled() -> bool:
+    return os.getenv("HGS_ADMISSION", "1").lower() not in ("0", "false", "off", "")
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller (limits from the environment)."""
+    global _admission_controller
+    with _controller_lock:
+        if _admission_controller is None:
+            _admission_controller = AdmissionController()
+    return _admission_controller
+
+
+def model_call_gate() -> Optional[ModelCallGate]:
+    """The shared model call limit, or None when admission control is disabled."""
+    return get_admission_controller().model_calls if admission_enabled() else None
+
+
+def admission_plugins() -> List[BasePlugin]:
+    """Plugins to register on the App/Runner, first so shed runs skip everything else."""
+    return [AdmissionPlugin(get_admission_controller())] if admission_enabled() else []
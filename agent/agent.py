@@ -1,21 +1,61 @@
 """Holiday Gift Savior - Multi-agent gift recommendation system."""
 
-from google.adk.agents import LlmAgent, SequentialAgent, ParallelAgent
+from google.adk.agents import LlmAgent, SequentialAgent
 from google.adk.tools import google_search
-import vertexai
+import functools
+import logging
 import os
-
-from .custom_tools import check_budget_compliance, get_recipient_profiles
-from .error_handling import GracefulErrorAgent
-
-vertexai.init(
-    project=os.environ["GOOGLE_CLOUD_PROJECT"],
-    location=os.environ["GOOGLE_CLOUD_LOCATION"],
+from typing import List
+
+from .admission import admission_plugins
+from .context_scope import aggregator_context_callback, researcher_context_callback
+from .custom_tools import (
+    check_budget_compliance,
+    check_budget_compliance_batch,
+    get_recipient_profiles,
+    record_learned_preferences,
 )
+from .data_models import GiftIdea
+from .dynamic_research import DynamicResearchAgent
+from .error_handling import GracefulErrorAgent
+from .fast_collector import collector_fast_path
+from .gift_dedup import GiftDedupAgent
+from .gift_filter import GiftFilterAgent
+from .preference_log import get_preference_writer
+from .plan_cache import PLAN_STATE_KEY, plan_cache, plan_cache_callbacks
+from .model_router import MODEL_TIERS, stage_model
+from .request_budget import attach_request_budget, budget_researcher
+from .search_cache import researcher_cache_callbacks
+from .streaming_research import StreamingResearchAgent
+from .structured_output import recipient_state_key, researcher_output_callback
+from .telemetry import instrument_agent, telemetry_plugins
+
+logger = logging.getLogger(__name__)
 
 # Configuration
-MODEL_NAME = "gemini-2.5-flash-preview-09-2025"
-NUM_PARALLEL_RESEARCHERS = 3
+# Primary model; each stage's model tiers are configured in model_router.py
+MODEL_NAME = MODEL_TIERS["primary"]
+
+# Researchers are created per recipient brief; these bound how many run at once
+# and how long a single researcher may take (override via environment variables)
+MAX_CONCURRENT_RESEARCHERS = int(os.getenv("MAX_CONCURRENT_RESEARCHERS", "3"))
+RESEARCHER_TIMEOUT_SECONDS = float(os.getenv("RESEARCHER_TIMEOUT_SECONDS", "90"))
+
+# Researchers send a hedged duplicate request when the first one is slower than this
+# (disabled unless set, since it can double the cost of slow grounded searches)
+RESEARCHER_HEDGE_SECONDS = float(os.getenv("RESEARCHER_HEDGE_SECONDS", "0")) or None
+
+# Stream each recipient's checked ideas as soon as its researcher finishes instead of
+# waiting for every researcher and the Aggregator (STREAM_RESULTS=1)
+STREAM_RESULTS = os.getenv("STREAM_RESULTS", "").lower() in ("1", "true", "yes")
+
+# Build briefs in code for structured requests ("Dad $50, Mom €40") and only ask the
+# model when the request is ambiguous (COLLECTOR_FAST_PATH=0 always uses the model)
+COLLECTOR_FAST_PATH = os.getenv("COLLECTOR_FAST_PATH", "1").lower() not in ("0", "false", "no")
+
+# The Vertex AI SDK (~2.5s to import) is only initialized when Gemini is served via
+# Vertex AI; google.genai itself reads GOOGLE_CLOUD_PROJECT / GOOGLE_CLOUD_LOCATION
+USE_VERTEXAI = os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "").lower() in ("1", "true", "yes")
 
 # Default user for demo purposes (can be overridden via CURRENT_USER_ID environment variable)
 DEFAULT_USER_ID = "family_smith_123"
@@ -30,7 +70,11 @@ def create_collector_agent(**kwargs) -> LlmAgent:
 
     Takes user input + recipient memory profiles and outputs structured JSON briefs
     containing recipient_name, max_budget, and search_query for each person.
+    The briefs are stored in session state under 'recipient_briefs'. Structured
+    requests are answered by the fast path in code (see fast_collector.py).
     """
+    if COLLECTOR_FAST_PATH:
+        kwargs.setdefault("before_model_callback", collector_fast_path)
     return LlmAgent(
         instruction=(
             "You are the Gift Briefing Specialist. For each gift request:\n"
@@ -39,28 +83,46 @@ def create_collector_agent(**kwargs) -> LlmAgent:
             "3. Create structured search briefs as a JSON array where each object contains:\n"
             "   - 'recipient_name': The person's name\n"
             "   - 'max_budget': Budget from user's request\n"
+            "   - 'currency': ISO currency code of the budget (e.g. 'USD', 'EUR')\n"
             "   - 'search_query': Synthesized query using interests from memory + user preferences\n\n"
-            "IMPORTANT: Use ACTUAL data from MemoryBank, not hallucinated information."
+            "IMPORTANT: Use ACTUAL data from MemoryBank, not hallucinated information.\n"
+            "Output ONLY the JSON array, with one object per recipient."
         ),
+        output_key="recipient_briefs",
         **kwargs
     )
 
 
-def create_researcher_agent(**kwargs) -> LlmAgent:
+def create_researcher_agent(brief: dict, **kwargs) -> LlmAgent:
     """
     Creates a Gift Researcher Agent that finds gifts using Google Search.
 
-    Designed for parallel execution - each instance handles one recipient brief.
-    Returns 3 gift ideas as JSON with titles, prices, and links.
+    Designed for parallel execution - each instance handles exactly one recipient brief.
+    Returns 3 gift ideas in the List[GiftIdea] output schema, validated in code and
+    stored under the recipient's own state key (see structured_output.py). Answers
+    are served from the shared search cache when an equivalent brief was researched
+    recently. The model only sees this brief and the recipient's profile (see context_scope.py).
+
+    Args:
+        brief: The recipient brief (recipient_name, max_budget, search_query) to research
+        **kwargs: Additional agent configuration
     """
+    cache_callbacks = researcher_cache_callbacks(brief)
     return LlmAgent(
         instruction=(
-            "You are a Gift Researcher. Take the recipient brief (name, budget, search query) "
-            "and use Google Search to find 3 highly-rated, appropriate gifts. Ensure gifts "
-            "align with interests and avoid disliked categories. Output a JSON list of GiftIdea objects "
-            "with fields: recipient, gift_title, description, estimated_price, product_link, currency."
+            "You are a Gift Researcher. Take the recipient brief (name, budget, search query, "
+            "interests, past gifts, dislikes) and use Google Search to find 3 highly-rated, "
+            "appropriate gifts. Ensure gifts align with interests and avoid disliked categories "
+            "and past gifts. Give each gift's price as a number and its currency as an ISO code."
         ),
         tools=[google_search],
+        output_schema=List[GiftIdea],
+        output_key=recipient_state_key(brief["recipient_name"]),
+        # Only this brief and profile, not the conversation (see context_scope.py)
+        include_contents="none",
+        before_model_callback=[cache_callbacks["before_model_callback"], researcher_context_callback(brief)],
+        # Validate first so the cache stores the cleaned answer
+        after_model_callback=[researcher_output_callback(brief), cache_callbacks["after_model_callback"]],
         **kwargs
     )
 
@@ -69,22 +131,33 @@ def create_aggregator_agent(**kwargs) -> LlmAgent:
     """
     Creates the Aggregator Agent that validates and delivers final recommendations.
 
-    Validates budgets using check_budget_compliance tool, filters unwanted items,
-    formats output as markdown table, and updates long-term memory with new preferences.
+    Validates all budgets in one check_budget_compliance_batch call, formats output as
+    markdown table, and records new preferences with record_learned_preferences.
+    Disliked and previously gifted items are already removed by the GiftFilter stage,
+    and duplicate products by the GiftDedup stage. The model sees the request, the
+    filtered ideas and the budgets rather than the whole conversation.
     """
     return LlmAgent(
         name="AggregatorAgent",
-        model=MODEL_NAME,
         instruction=(
             "You are the Final Reviewer. Process the gift ideas from researchers:\n"
-            "1. Use 'check_budget_compliance' tool to validate each gift price vs budget\n"
+            "1. Call 'check_budget_compliance_batch' ONCE with all gift ideas, a map of\n"
+            "   recipient name -> budget and a map of recipient name -> budget currency to validate\n"
+            "   every gift price in a single step. Prices are converted to the budget currency by the\n"
+            "   tool; never convert currencies yourself, use the converted prices it returns\n"
             "2. If a gift fails budget check, suggest a cheaper alternative\n"
-            "3. Check the recipient profiles (available in context) for disliked_categories\n"
-            "4. Filter out items that match disliked categories from the profiles\n"
-            "5. Format approved gifts as a clear Markdown table\n"
-            "6. Note any new preferences learned from the conversation"
+            "3. Format approved gifts as a clear Markdown table\n"
+            "4. Briefly mention any items that were filtered out and why\n"
+            "5. If the request reveals new preferences (likes, dislikes, past gifts that were a hit),\n"
+            "   call 'record_learned_preferences' once per recipient to remember them\n\n"
+            "The research results include the user's request, the gift ideas (already filtered for disliked categories\n"
+            "and past gifts), the items filtered out, and each recipient's budget and currency."
         ),
-        tools=[check_budget_compliance],
+        tools=[check_budget_compliance_batch, check_budget_compliance, record_learned_preferences],
+        # Only the compact results and budgets, not the conversation (see context_scope.py)
+        include_contents="none",
+        before_model_callback=aggregator_context_callback(),
+        output_key=PLAN_STATE_KEY,
         **kwargs
     )
 
@@ -92,53 +165,82 @@ def create_aggregator_agent(**kwargs) -> LlmAgent:
 # Workflow Orchestration
 # ============================================================================
 
-def create_gift_planning_workflow(**kwargs) -> SequentialAgent:
+def create_gift_planning_workflow(model=None, stream_results: bool = STREAM_RESULTS, **kwargs) -> SequentialAgent:
     """
-    Creates the main sequential workflow: Collection -> Parallel Research -> Aggregation.
+    Creates the main sequential workflow: Collection -> Parallel Research -> Filtering -> Dedup -> Aggregation.
 
     Architecture:
         1. Collector structures user input into recipient briefs
-        2. Parallel researchers (3 instances) find gifts concurrently
-        3. Aggregator validates budgets and formats final output
+        2. Parallel researchers (one per brief, at most MAX_CONCURRENT_RESEARCHERS
+           at a time) find gifts concurrently
+        3. Gift filter drops disliked / previously gifted items in code
+        4. Gift dedup collapses the same product suggested by several researchers
+        5. Aggregator validates budgets and formats final output
+
+    In streaming mode stages 3 to 5 happen per recipient inside the research
+    stage, which emits a partial table row as each researcher finishes and a
+    closing summary instead of the Aggregator's table.
 
     Args:
+        model: Model (name or BaseLlm) for every agent; defaults to each stage's routed model tiers
+        stream_results: Use the streaming research stage (defaults to STREAM_RESULTS)
         **kwargs: Additional agent configuration
 
     Returns:
-        SequentialAgent configured with the three-stage workflow
+        SequentialAgent configured with the five-stage workflow
     """
     # Stage 1: Structure input into recipient briefs
     collector = create_collector_agent(
         name="CollectorAgent",
-        model=MODEL_NAME
+        model=model or stage_model("collector")
     )
 
-    # Stage 2: Parallel research - one researcher per recipient
-    parallel_research = ParallelAgent(
+    # Stage 2: Parallel research - one researcher per recipient brief, created at run time
+    researcher_model = model or stage_model("researcher", hedge_after=RESEARCHER_HEDGE_SECONDS)
+    research_class = StreamingResearchAgent if stream_results else DynamicResearchAgent
+    parallel_research = research_class(
         name="ParallelResearch",
-        sub_agents=[
-            create_researcher_agent(
-                name=f"Researcher_{i}",
-                model=MODEL_NAME
-            )
-            for i in range(NUM_PARALLEL_RESEARCHERS)
-        ]
+        researcher_factory=lambda brief, name: instrument_agent(budget_researcher(create_researcher_agent(
+            brief=brief,
+            name=name,
+            model=researcher_model
+        ))),
+        max_concurrency=MAX_CONCURRENT_RESEARCHERS,
+        researcher_timeout=RESEARCHER_TIMEOUT_SECONDS
     )
 
-    # Stage 3: Aggregate, validate, and deliver results
-    aggregator = create_aggregator_agent()
+    # Repeated requests are answered with the last plan (PLAN_CACHE_TTL_SECONDS=0 disables this)
+    if plan_cache.ttl_seconds > 0:
+        kwargs = {**plan_cache_callbacks(), **kwargs}
+
+    # Every run gets a token / call / deadline budget (see request_budget.py)
+    if stream_results:
+        return attach_request_budget(SequentialAgent(
+            name="GiftPlanningWorkflow",
+            sub_agents=[collector, parallel_research],
+            **kwargs
+        ))
+
+    # Stage 3: Deterministically drop disliked and previously gifted items
+    gift_filter = GiftFilterAgent(name="GiftFilter")
 
-    return SequentialAgent(
+    # Stage 4: Collapse duplicate products across researchers
+    gift_dedup = GiftDedupAgent(name="GiftDedup")
+
+    # Stage 5: Aggregate, validate, and deliver results
+    aggregator = create_aggregator_agent(model=model or stage_model("aggregator"))
+
+    return attach_request_budget(SequentialAgent(
         name="GiftPlanningWorkflow",
-        sub_agents=[collector, parallel_research, aggregator],
+        sub_agents=[collector, parallel_research, gift_filter, gift_dedup, aggregator],
         **kwargs
-    )
+    ))
 
 # ============================================================================
 # Main Entry Point Agent
 # ============================================================================
 
-def create_concierge_agent(**kwargs) -> GracefulErrorAgent:
+def create_concierge_agent(model=None, stream_results: bool = STREAM_RESULTS, **kwargs) -> GracefulErrorAgent:
     """
     Creates the top-level Concierge Agent that routes requests and manages memory.
 
@@ -148,16 +250,18 @@ def create_concierge_agent(**kwargs) -> GracefulErrorAgent:
     Uses GracefulErrorAgent to provide user-friendly messages when the model is overloaded.
 
     Args:
+        model: Model (name or BaseLlm) for every agent; defaults to each stage's routed model tiers
+        stream_results: Stream per-recipient results (see create_gift_planning_workflow)
         **kwargs: Additional agent configuration
 
     Returns:
         GracefulErrorAgent configured as the system's main router
     """
-    gift_workflow = create_gift_planning_workflow()
+    gift_workflow = create_gift_planning_workflow(model=model, stream_results=stream_results)
 
     return GracefulErrorAgent(
         name="HGSConciergeAgent",
-        model=MODEL_NAME,
+        model=model or stage_model("concierge"),
         instruction=(
             "You are the Holiday Gift Savior Concierge - a warm, helpful assistant specializing in gift recommendations.\n\n"
 
@@ -185,12 +289,17 @@ def create_concierge_agent(**kwargs) -> GracefulErrorAgent:
             "FOR GIFT REQUESTS:\n"
             "- Acknowledge the request positively\n"
             "- Delegate to the 'GiftPlanningWorkflow' sub-agent\n"
+            "- If the user asks to refresh a plan or for new ideas, delegate again; the workflow skips its cache\n"
             "- The workflow will use the loaded profile data for personalized recommendations\n\n"
 
+            "LEARNED PREFERENCES:\n"
+            "- When the user mentions what someone likes or dislikes, or which past gift was a hit,\n"
+            "  call 'record_learned_preferences' for that recipient so future plans use it\n\n"
+
             "FOR OTHER QUESTIONS:\n"
             "- Politely redirect: 'My sleigh bells are only calibrated for gift requests! How can I help you find the perfect gift today?'"
         ),
-        tools=[get_recipient_profiles],
+        tools=[get_recipient_profiles, record_learned_preferences],
         sub_agents=[gift_workflow],
         **kwargs
     )
@@ -205,13 +314,47 @@ def create_agent() -> GracefulErrorAgent:
     Returns:
         The root GracefulErrorAgent (concierge) ready to handle user requests with error handling
     """
-    print("\n🎁 Initializing Holiday Gift Savior (profiles will be loaded dynamically per session)")
-    return create_concierge_agent()
+    init_vertexai()
+    # Replays learned preferences into the profile store before the first request
+    get_preference_writer()
+    logger.info("🎁 Initializing Holiday Gift Savior (profiles will be loaded dynamically per session)")
+    # Adds workflow spans and metrics when HGS_TELEMETRY is set
+    return instrument_agent(create_concierge_agent())
+
+
+@functools.lru_cache(maxsize=None)
+def init_vertexai() -> None:
+    """Initialize the Vertex AI SDK once, and only when Gemini is served via Vertex AI."""
+    if not USE_VERTEXAI:
+        return
+    import vertexai  # Deferred: importing the SDK dominates cold start
+
+    vertexai.init(
+        project=os.environ["GOOGLE_CLOUD_PROJECT"],
+        location=os.environ["GOOGLE_CLOUD_LOCATION"],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_root_agent() -> GracefulErrorAgent:
+    """Build the root agent on first use and reuse it afterwards."""
+    return create_agent()
+
 
+@functools.lru_cache(maxsize=None)
+def get_app():
+    """Build the ADK App (root agent plus runner plugins) on first use."""
+    from google.adk.apps.app import App
 
-# Root agent instance - ADK framework expects this variable
-root_agent = create_agent()
+    # Admission control goes first so runs it turns away skip the other plugins
+    return App(root_agent=get_root_agent(), name="app", plugins=[*admission_plugins(), *telemetry_plugins()])
 
-from google.adk.apps.app import App
 
-app = App(root_agent=root_agent, name="app")
+def __getattr__(name):
+    # ADK's loader reads `app` / `root_agent`; they are built on first access
+    # rather than at import so importing this module stays cheap
+    if name == "root_agent":
+        return get_root_agent()
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
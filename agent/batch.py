@@ -0,0 +1,261 @@
+"""Offline batch planning: stream a JSONL file of gift requests through the workflow.
+
+Each input line is one request:
+    {"request_id": "hr-001", "user_id": "corporate_hr_789",
+     "recipients": [{"name": "Team Lead Sarah", "budget": 75, "currency": "USD"}, ...]}
+`budgets` ({"Team Lead Sarah": 75, ...}) or a free-text `message` may be given
+instead of `recipients`. Lines without a request_id are identified by line number.
+
+Requests are read lazily into a bounded queue and planned by `--concurrency`
+workers, each in its own session that is deleted afterwards, so memory stays
+flat regardless of input size. Every result is appended to the output JSONL as
+soon as it is ready; the output doubles as the checkpoint, so rerunning the
+same command resumes with the requests that have no result yet.
+
+Usage:
+    python -m agent.batch requests.jsonl --output plans.jsonl --concurrency 8
+    python -m agent.batch requests.jsonl --output plans.jsonl --fake   # offline dry run
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Set, Tuple
+
+from google.adk.runners import InMemoryRunner
+from google.genai.types import Content, Part
+
+from .agent import create_gift_planning_workflow
+from .custom_tools import PROFILE_USER_ID_KEY
+from .fx_rates import currency_symbol
+from .parsing import extract_json_payload
+from .preference_log import get_preference_writer
+from .telemetry import instrument_agent, telemetry_plugins
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "hgs-batch"
+
+# Authors whose text makes up the plan delivered to the user
+PLAN_AUTHORS = ("ParallelResearch", "GiftFilter", "AggregatorAgent")
+
+_STOP = object()
+
+
+def build_message(request: dict) -> str:
+    """
+    Turn a batch request into the chat message the workflow expects.
+
+    Structured requests are rendered as "Dad $50, Mom €40", which the
+    Collector's fast path turns into briefs without a model call.
+    """
+    # "refresh": true bypasses the plan cache for this request
+    suffix = " (refresh)" if request.get("refresh") else ""
+    if request.get("message"):
+        return str(request["message"]) + suffix
+
+    recipients = request.get("recipients")
+    if recipients is None:
+        recipients = [{"name": name, "budget": budget} for name, budget in (request.get("budgets") or {}).items()]
+    parts = []
+    for recipient in recipients:
+        name = recipient.get("name") or recipient.get("recipient_name")
+        budget = recipient.get("budget", recipient.get("max_budget"))
+        currency = str(recipient.get("currency") or request.get("currency") or "USD").upper()
+        if not name or budget is None:
+            raise ValueError(f"Recipient needs a name and a budget: {recipient}")
+        symbol = currency_symbol(currency)
+        parts.append(f"{name} {symbol}{budget}" if symbol else f"{name} {budget} {currency}")
+    if not parts:
+        raise ValueError("Request has no recipients, budgets or message")
+    return "Please find gifts for " + ", ".join(parts) + suffix
+
+
+def completed_request_ids(output_path: str, retry_errors: bool = False) -> Set[str]:
+    """Request ids that already have a result in the output file (the checkpoint)."""
+    done: Set[str] = set()
+    try:
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted run; that request is redone
+                    continue
+                if retry_errors and result.get("status") != "ok":
+                    continue
+                done.add(result.get("request_id"))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+async def read_requests(input_path: str, skip: Set[str]) -> AsyncIterator[Tuple[str, dict]]:
+    """Yield (request_id, request) pairs one line at a time, skipping completed ids."""
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = {"_invalid": line[:200]}
+            request_id = str(request.get("request_id") or f"line-{line_number}")
+            if request_id in skip:
+                continue
+            yield request_id, request
+
+
+class BatchPlanner:
+    """Runs batch requests through one shared workflow with bounded in-flight sessions."""
+
+    def __init__(self, model=None, concurrency: int = 4, stream_results: bool = False):
+        # Learned preferences from earlier runs apply to this batch too
+        get_preference_writer()
+        workflow = instrument_agent(create_gift_planning_workflow(model=model, stream_results=stream_results))
+        self.runner = InMemoryRunner(agent=workflow, app_name=APP_NAME, plugins=telemetry_plugins())
+        self.concurrency = max(1, concurrency)
+        self.stats = {"ok": 0, "error": 0}
+
+    async def plan(self, request_id: str, request: dict) -> dict:
+        """Plan one request and return its JSON-serializable result."""
+        started = time.perf_counter()
+        user_id = str(request.get("user_id") or "")
+        result = {"request_id": request_id, "user_id": user_id}
+        session = None
+        try:
+            if "_invalid" in request:
+                raise ValueError(f"Invalid JSON: {request['_invalid']}")
+            if not user_id:
+                raise ValueError("Request has no user_id")
+            message = build_message(request)
+            session = await self.runner.session_service.create_session(
+                app_name=APP_NAME, user_id=user_id, state={PROFILE_USER_ID_KEY: user_id}
+            )
+            texts = []
+            async for event in self.runner.run_async(
+                user_id=user_id,
+                session_id=session.id,
+                new_message=Content(role="user", parts=[Part(text=message)]),
+            ):
+                if event.author in PLAN_AUTHORS and event.content and event.content.parts:
+                    text = "".join(part.text or "" for part in event.content.parts)
+                    if text:
+                        texts.append(text)
+
+            final = await self.runner.session_service.get_session(
+                app_name=APP_NAME, user_id=user_id, session_id=session.id
+            )
+            state = final.state if final else {}
+            result.update({
+                "status": "ok",
+                "plan": "\n\n".join(texts),
+                "gift_ideas": extract_json_payload(str(state.get("gift_ideas", "[]"))) or [],
+                "rejected": extract_json_payload(str(state.get("rejected_gift_ideas", "[]"))) or [],
+            })
+        except Exception as e:
+            logger.warning("Batch request %s failed: %s: %s", request_id, type(e).__name__, e)
+            result.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            if session is not None:
+                # Keep memory flat: finished sessions are not needed again
+                await self.runner.session_service.delete_session(
+                    app_name=APP_NAME, user_id=user_id, session_id=session.id
+                )
+        result["elapsed_s"] = round(time.perf_counter() - started, 3)
+        self.stats[result["status"]] += 1
+        return result
+
+    async def run(self, input_path: str, output_path: str, retry_errors: bool = False,
+                  progress_every: int = 50) -> dict:
+        """
+        Plan every pending request in input_path, appending results to output_path.
+
+        Args:
+            input_path: JSONL file of requests
+            output_path: JSONL file receiving one result per request (also the checkpoint)
+            retry_errors: Redo requests whose previous result was an error
+            progress_every: Log progress after this many results
+
+        Returns:
+            Run summary (counts, wall time, throughput)
+        """
+        skip = completed_request_ids(output_path, retry_errors)
+        if skip:
+            logger.info("Resuming: %d requests already have results", len(skip))
+
+        # Bounded queues keep the reader at most a few requests ahead of the workers
+        requests: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        started = time.perf_counter()
+
+        async def reader() -> None:
+            async for item in read_requests(input_path, skip):
+                await requests.put(item)
+            for _ in range(self.concurrency):
+                await requests.put(_STOP)
+
+        async def worker() -> None:
+            while (item := await requests.get()) is not _STOP:
+                await results.put(await self.plan(*item))
+
+        async def writer() -> int:
+            written = 0
+            with open(output_path, "a", encoding="utf-8") as out:
+                while (result := await results.get()) is not _STOP:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    # Flushed per line so an interrupted run loses at most the in-flight requests
+                    out.flush()
+                    written += 1
+                    if progress_every and written % progress_every == 0:
+                        elapsed = time.perf_counter() - started
+                        logger.info("%d results written (%.2f req/s)", written, written / elapsed)
+            return written
+
+        writer_task = asyncio.create_task(writer())
+        await asyncio.gather(reader(), *(worker() for _ in range(self.concurrency)))
+        await results.put(_STOP)
+        written = await writer_task
+
+        wall_time = time.perf_counter() - started
+        return {
+            "written": written,
+            "skipped": len(skip),
+            **self.stats,
+            "wall_time_s": round(wall_time, 3),
+            "throughput_rps": round(written / wall_time, 3) if wall_time else 0.0,
+        }
+
+
+def _fake_model(seed: int = 0):
+    """Offline model for dry runs (see fake_llm.py)."""
+    from .fake_llm import FakeGiftModel, FakeSearchBackend
+
+    return FakeGiftModel(search_backend=FakeSearchBackend(seed=seed), seed=seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Plan gifts for a JSONL file of requests")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("--output", required=True, help="JSONL file for results; reruns resume from it")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests planned at the same time")
+    parser.add_argument("--retry-errors", action="store_true", help="Redo requests that previously failed")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming workflow (no Aggregator call)")
+    parser.add_argument("--fake", action="store_true", help="Use the offline fake model and search backend")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    planner = BatchPlanner(
+        model=_fake_model() if args.fake else None,
+        concurrency=args.concurrency,
+        stream_results=args.stream,
+    )
+    summary = asyncio.run(planner.run(args.input, args.output, retry_errors=args.retry_errors))
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Offline benchmark for the gift planning workflow.
+
+Runs the full agent tree against FakeGiftModel and FakeSearchBackend (no Gemini,
+no Google Search), replays a corpus of requests across all demo users and
+reports per-stage and end-to-end latency percentiles, throughput and token
+counts as JSON, so regressions can be compared between releases.
+
+Usage:
+    python -m agent.benchmark --requests 40 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from google.adk.runners import InMemoryRunner
+from google.genai.types import Content, Part
+
+from .agent import create_concierge_agent
+from .callbacks import add_callback, walk_agents
+from .fake_llm import FakeGiftModel, FakeSearchBackend, LatencyDistribution
+from .model_router import ModelRouter, RoutedLlm, RoutingPolicy
+from .resilience import CircuitBreaker, ResilientLlm, RetryPolicy
+from .sample_data import USER_PROFILES_DB
+from .plan_cache import plan_cache
+from .request_budget import USAGE_STATE_KEY
+from .search_cache import search_cache
+from .streaming_research import PARTIAL_RESULT_KEY
+from .telemetry import instrument_agent, telemetry_plugins
+
+# Agent name -> stage label reported in the results
+STAGES = {
+    "CollectorAgent": "Collector",
+    "ParallelResearch": "ParallelResearch",
+    "AggregatorAgent": "Aggregator",
+}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of a list of seconds, rounded to milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50": round(pick(0.50), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "mean": round(statistics.fmean(ordered), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def build_corpus(num_requests: int, seed: int = 0) -> List[dict]:
+    """Deterministic gift requests cycling through every user in USER_PROFILES_DB."""
+    rng = random.Random(seed)
+    users = sorted(USER_PROFILES_DB)
+    corpus = []
+    for i in range(num_requests):
+        user_id = users[i % len(users)]
+        parts = [
+            f"{profile.recipient_name} ${rng.choice([25, 40, 50, 75, 100])}"
+            for profile in USER_PROFILES_DB[user_id]
+        ]
+        corpus.append({
+            "request_id": f"bench-{i}",
+            "user_id": user_id,
+            "message": f"Please find gifts for {', '.join(parts)} (user_id: {user_id})",
+        })
+    return corpus
+
+
+class StageTimer:
+    """Records per-stage wall time via before/after agent callbacks."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._started: Dict[tuple, float] = {}
+
+    def install(self, root_agent) -> None:
+        for agent in walk_agents(root_agent):
+            if agent.name in STAGES:
+                add_callback(agent, "before_agent_callback", self._before)
+                add_callback(agent, "after_agent_callback", self._after)
+
+    def _before(self, callback_context):
+        self._started[(callback_context.invocation_id, callback_context.agent_name)] = time.perf_counter()
+        return None
+
+    def _after(self, callback_context):
+        started = self._started.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if started is not None:
+            self.samples[STAGES[callback_context.agent_name]].append(time.perf_counter() - started)
+        return None
+
+
+async def run_benchmark(
+    num_requests: int = 40,
+    concurrency: int = 4,
+    model_latency: str = "lognormal:0.05,0.5",
+    search_latency: str = "lognormal:0.2,0.6",
+    error_rate: float = 0.0,
+    seed: int = 0,
+    cold_cache: bool = True,
+    stream_results: bool = False,
+    light_model_latency: Optional[str] = None,
+    route_p95: float = 1.0,
+) -> dict:
+    """
+    Run the workflow against fake backends and return the benchmark report.
+
+    Args:
+        num_requests: Number of requests replayed
+        concurrency: Maximum number of sessions in flight
+        model_latency: Latency spec for every model call (see LatencyDistribution.parse)
+        search_latency: Latency spec for every grounded search
+        error_rate: Probability of an injected 503 per model call
+        seed: Seed for the corpus and latency sampling
+        cold_cache: Clear the shared search and plan caches before starting
+        stream_results: Benchmark the streaming workflow (per-recipient partial results)
+        light_model_latency: If set, add a light fake model with this latency spec and
+            route between the two tiers
+        route_p95: p95 latency (seconds) above which the router prefers the light tier
+
+    Returns:
+        JSON-serializable report
+    """
+    if cold_cache:
+        search_cache.clear()
+        plan_cache.clear()
+
+    search_backend = FakeSearchBackend(LatencyDistribution.parse(search_latency), seed=seed)
+    fake_model = FakeGiftModel(
+        search_backend=search_backend,
+        latency_distribution=LatencyDistribution.parse(model_latency),
+        error_rate=error_rate,
+        seed=seed,
+    )
+    model = ResilientLlm(
+        model=fake_model.model,
+        inner=fake_model,
+        retry_policy=RetryPolicy(base_delay=0.05, max_delay=0.5),
+        circuit_breaker=CircuitBreaker(failure_threshold=50),
+    )
+    router = ModelRouter()
+    if light_model_latency is not None:
+        light_model = FakeGiftModel(
+            model="gemini-fake-light",
+            search_backend=search_backend,
+            latency_distribution=LatencyDistribution.parse(light_model_latency),
+            seed=seed + 1,
+        )
+        model = RoutedLlm(
+            model=model.model,
+            stage="benchmark",
+            candidates=[model, ResilientLlm(
+                model=light_model.model,
+                inner=light_model,
+                retry_policy=RetryPolicy(base_delay=0.05, max_delay=0.5),
+                circuit_breaker=CircuitBreaker(failure_threshold=50),
+            )],
+            policy=RoutingPolicy(p95_threshold=route_p95, window_seconds=30.0),
+            router=router,
+        )
+    root_agent = instrument_agent(create_concierge_agent(model=model, stream_results=stream_results))
+    timer = StageTimer()
+    timer.install(root_agent)
+
+    runner = InMemoryRunner(agent=root_agent, app_name="hgs-benchmark", plugins=telemetry_plugins())
+    corpus = build_corpus(num_requests, seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    end_to_end: List[float] = []
+    first_result: List[float] = []
+    tokens = {"prompt": 0, "output": 0}
+    # Prompt tokens of each researcher / aggregator call; with context scoping they
+    # should not grow with the number of recipients
+    prompt_per_call: Dict[str, List[int]] = {"researcher": [], "aggregator": []}
+    # Per-request budget reports (see request_budget.py)
+    request_usage: List[dict] = []
+    errors: List[str] = []
+
+    async def run_one(request: dict) -> None:
+        async with semaphore:
+            session = await runner.session_service.create_session(
+                app_name="hgs-benchmark", user_id=request["user_id"]
+            )
+            started = time.perf_counter()
+            first_seen = False
+            try:
+                async for event in runner.run_async(
+                    user_id=request["user_id"],
+                    session_id=session.id,
+                    new_message=Content(role="user", parts=[Part(text=request["message"])]),
+                ):
+                    # First recommendation the user sees: a streamed row, or the Aggregator's table
+                    if not first_seen and (
+                        PARTIAL_RESULT_KEY in (event.custom_metadata or {})
+                        or (event.author == "AggregatorAgent" and event.is_final_response())
+                    ):
+                        first_seen = True
+                        first_result.append(time.perf_counter() - started)
+                    usage: Optional[object] = event.usage_metadata
+                    if usage is not None:
+                        tokens["prompt"] += usage.prompt_token_count or 0
+                        tokens["output"] += usage.candidates_token_count or 0
+                        role = "researcher" if event.author.startswith("Researcher_") else (
+                            "aggregator" if event.author == "AggregatorAgent" else None
+                        )
+                        if role is not None:
+                            prompt_per_call[role].append(usage.prompt_token_count or 0)
+            except Exception as e:
+                errors.append(f"{request['request_id']}: {type(e).__name__}: {e}")
+                return
+            end_to_end.append(time.perf_counter() - started)
+            session = await runner.session_service.get_session(
+                app_name="hgs-benchmark", user_id=request["user_id"], session_id=session.id
+            )
+            usage = session.state.get(USAGE_STATE_KEY)
+            if usage:
+                request_usage.append(usage)
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(run_one(request) for request in corpus))
+    wall_time = time.perf_counter() - wall_started
+
+    return {
+        "config": {
+            "requests": num_requests,
+            "concurrency": concurrency,
+            "model_latency": model_latency,
+            "search_latency": search_latency,
+            "error_rate": error_rate,
+            "seed": seed,
+            "stream_results": stream_results,
+            "light_model_latency": light_model_latency,
+            "route_p95": route_p95,
+        },
+        "end_to_end": percentiles(end_to_end),
+        "time_to_first_result": percentiles(first_result),
+        "stages": {stage: percentiles(timer.samples.get(stage, [])) for stage in STAGES.values()},
+        "throughput_rps": round(len(end_to_end) / wall_time, 3) if wall_time else 0.0,
+        "wall_time_s": round(wall_time, 3),
+        "tokens": {
+            **tokens,
+            "per_request": round((tokens["prompt"] + tokens["output"]) / max(1, len(end_to_end)), 1),
+            "prompt_per_call": {
+                role: {"count": len(counts), "mean": round(sum(counts) / len(counts), 1), "max": max(counts)}
+                if counts else {"count": 0}
+                for role, counts in prompt_per_call.items()
+            },
+        },
+        "request_usage": {
+            "tokens": percentiles([float(usage["tokens"]["total"]) for usage in request_usage]),
+            "model_calls": percentiles([float(usage["model_calls"]) for usage in request_usage]),
+            "degraded": sum(1 for usage in request_usage if usage["degraded"]),
+        },
+        "model_calls": fake_model.calls + (light_model.calls if light_model_latency is not None else 0),
+        "search_calls": search_backend.calls,
+        "search_cache": search_cache.stats(),
+        "plan_cache": plan_cache.stats(),
+        "resilience": {
+            candidate.model: candidate.stats()
+            for candidate in (model.candidates if isinstance(model, RoutedLlm) else [model])
+        },
+        "routing": router.stats(),
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the gift planning workflow")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--model-latency", default="lognormal:0.05,0.5",
+                        help='e.g. "0.1", "uniform:0.05,0.2", "lognormal:0.05,0.5"')
+    parser.add_argument("--search-latency", default="lognormal:0.2,0.6")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-cache", action="store_true", help="Keep existing search and plan cache entries")
+    parser.add_argument("--light-model-latency",
+                        help="Add a light model tier with this latency and route between the tiers")
+    parser.add_argument("--route-p95", type=float, default=1.0,
+                        help="p95 seconds above which the router prefers the light tier")
+    parser.add_argument("--stream", action="store_true", help="Benchmark the streaming workflow")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(
+        num_requests=args.requests,
+        concurrency=args.concurrency,
+        model_latency=args.model_latency,
+        search_latency=args.search_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        cold_cache=not args.warm_cache,
+        stream_results=args.stream,
+        light_model_latency=args.light_model_latency,
+        route_p95=args.route_p95,
+    ))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
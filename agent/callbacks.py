@@ -0,0 +1,34 @@
+"""Helpers for attaching ADK callbacks to agents that may already have some."""
+
+from typing import Callable, Iterator
+
+from google.adk.agents import BaseAgent
+
+
+def add_callback(agent: BaseAgent, field_name: str, callback: Callable, first: bool = False) -> None:
+    """
+    Add a callback to one of an agent's callback fields.
+
+    ADK accepts a single callable or a list for before/after agent, model and tool
+    callbacks, and stops at the first callback returning a value. Existing
+    callbacks are kept; the new one runs last unless `first` is set.
+
+    Args:
+        agent: Agent to modify
+        field_name: Callback field, e.g. "before_agent_callback"
+        callback: Callback to add
+        first: Run the new callback before the existing ones
+    """
+    existing = getattr(agent, field_name, None)
+    if existing is None:
+        existing = []
+    elif not isinstance(existing, list):
+        existing = [existing]
+    setattr(agent, field_name, [callback, *existing] if first else [*existing, callback])
+
+
+def walk_agents(agent: BaseAgent) -> Iterator[BaseAgent]:
+    """Yield an agent and all of its (static) sub-agents, depth first."""
+    yield agent
+    for sub_agent in agent.sub_agents:
+        yield from walk_agents(sub_agent)
@@ -0,0 +1,128 @@
+"""Per-agent context scoping for the researchers and the Aggregator.
+
+By default every LlmAgent in the workflow sees the whole conversation: the
+concierge greeting, the get_recipient_profiles result with every recipient's
+profile, and the Collector's briefs for all recipients. None of that is needed
+by a researcher working on one recipient, and it makes prompt size (and
+latency) grow with household size and conversation length.
+
+The before_model callbacks built here replace that inherited history with a
+single compact message: a researcher gets its own brief plus that recipient's
+profile fields, the Aggregator gets the user's request, the filtered gift
+ideas, the rejection report and the budgets. The agent's own tool calls and
+responses from the current turn are kept, so function-calling loops still work. Combined with
+include_contents="none" (no earlier turns), a researcher's prompt no longer
+depends on how many recipients or turns there are.
+"""
+
+import json
+import logging
+from typing import Callable, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai.types import Content, Part
+
+from .custom_tools import resolve_user_id
+from .data_models import RecipientProfile
+from .parsing import extract_json_payload, parse_budget, parse_recipient_briefs
+from .profile_store import get_profile_store
+
+logger = logging.getLogger(__name__)
+
+# GiftIdea fields the Aggregator does not need (the budget check fills the status in)
+_AGGREGATOR_OMITTED_FIELDS = ("budget_check_status",)
+
+
+def _compact(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _find_profile(profiles: List[RecipientProfile], recipient_name: str) -> Optional[RecipientProfile]:
+    wanted = recipient_name.strip().lower()
+    return next((profile for profile in profiles if profile.recipient_name.strip().lower() == wanted), None)
+
+
+def researcher_scope(brief: dict, profile: Optional[RecipientProfile]) -> dict:
+    """The brief plus the recipient's profile fields: everything one researcher needs."""
+    scope = {key: brief[key] for key in ("recipient_name", "max_budget", "currency", "search_query") if key in brief}
+    if profile is not None:
+        scope.update({
+            "interests": profile.persistent_interests,
+            "past_gifts": profile.past_successful_gifts,
+            "disliked": profile.disliked_categories,
+        })
+    return scope
+
+
+def aggregator_scope(state, request: str = "") -> dict:
+    """The user's request plus the filtered gift ideas, rejection report and budgets from session state."""
+    ideas = extract_json_payload(str(state.get("gift_ideas") or "[]")) or []
+    rejected = extract_json_payload(str(state.get("rejected_gift_ideas") or "[]")) or []
+    budgets, currencies = {}, {}
+    for brief in parse_recipient_briefs(str(state.get("recipient_briefs") or "")):
+        budget = parse_budget(brief.get("max_budget"))
+        if budget is not None:
+            budgets[brief["recipient_name"]] = budget
+            currencies[brief["recipient_name"]] = brief.get("currency") or "USD"
+    return {
+        # Kept so preferences the user mentions can still be recorded
+        "request": request,
+        "recipient_budgets": budgets,
+        "budget_currencies": currencies,
+        "gift_ideas": [
+            {key: value for key, value in idea.items() if key not in _AGGREGATOR_OMITTED_FIELDS}
+            for idea in ideas if isinstance(idea, dict)
+        ],
+        "filtered_out": rejected,
+    }
+
+
+def scope_contents(llm_request: LlmRequest, message: str) -> None:
+    """
+    Replace inherited context in the request with one user message.
+
+    Keeps the agent's own model turns and tool responses (role "model", or user
+    contents carrying function responses); other agents' messages, which ADK
+    presents as user contents, are dropped.
+    """
+    own = [
+        content for content in llm_request.contents
+        if content.role == "model" or any(part.function_response for part in content.parts or [])
+    ]
+    llm_request.contents = [Content(role="user", parts=[Part(text=message)]), *own]
+
+
+def _scoping_callback(build_message: Callable[[CallbackContext], str]) -> Callable:
+    def before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        dropped = len(llm_request.contents)
+        scope_contents(llm_request, build_message(callback_context))
+        logger.debug(
+            "%s: scoped context from %d to %d contents",
+            callback_context.agent_name, dropped, len(llm_request.contents),
+        )
+        return None
+
+    return before_model
+
+
+def researcher_context_callback(brief: dict) -> Callable:
+    """before_model callback giving a researcher only its brief and recipient profile."""
+
+    def build_message(callback_context: CallbackContext) -> str:
+        profiles = get_profile_store().get_profiles(resolve_user_id(callback_context.state))
+        scope = researcher_scope(brief, _find_profile(profiles, brief.get("recipient_name", "")))
+        return f"Recipient brief: {_compact(scope)}"
+
+    return _scoping_callback(build_message)
+
+
+def aggregator_context_callback() -> Callable:
+    """before_model callback giving the Aggregator only the request, compact results and budgets."""
+
+    def build_message(callback_context: CallbackContext) -> str:
+        content = callback_context.user_content
+        request = "".join(part.text or "" for part in (content.parts if content else None) or [])
+        return f"Research results: {_compact(aggregator_scope(callback_context.state, request))}"
+
+    return _scoping_callback(build_message)
@@ -2,15 +2,39 @@
 
 import json
 import os
+from typing import Dict, List, Mapping, Optional, Tuple
 from google.adk.tools import FunctionTool
-from .sample_data import USER_PROFILES_DB
+from google.adk.tools.tool_context import ToolContext
+from pydantic import ValidationError
+from .data_models import GiftIdea
+from .fx_rates import FxTable, format_amount, get_fx_table
+from .parsing import parse_budget
+from .preference_log import get_preference_writer
+from .profile_store import get_profile_store
+
+# Session state key remembering whose profiles were loaded in this session
+PROFILE_USER_ID_KEY = "profile_user_id"
+
+# Prices up to 5% over budget are flagged as a Warning instead of a Fail
+BUDGET_GRACE_MARGIN = 0.05
+
+
+def _evaluate_budget(gift_price: float, recipient_budget: float) -> Tuple[str, float]:
+    """Return the (status, budget_difference) pair for a single price/budget comparison."""
+    difference = round(recipient_budget - gift_price, 2)
+    if gift_price <= recipient_budget:
+        return "Pass", difference
+    if gift_price <= recipient_budget * (1 + BUDGET_GRACE_MARGIN):
+        return "Warning", difference
+    return "Fail", difference
 
 
 @FunctionTool
 def check_budget_compliance(
     gift_price: float,
     recipient_budget: float,
-    currency: str
+    currency: str,
+    budget_currency: str = ""
 ) -> str:
     """
     Check if a gift price is within budget (allows 5% grace margin).
@@ -18,49 +42,198 @@ def check_budget_compliance(
     Args:
         gift_price: The estimated price of the gift.
         recipient_budget: The maximum budget allocated for the recipient.
-        currency: The ISO currency code (e.g., "USD" or "EUR").
+        currency: The ISO currency code of the gift price (e.g., "USD" or "EUR").
+        budget_currency: The ISO currency code of the budget, if different from the price's.
+            The price is converted with the local FX table; do not convert it yourself.
 
     Returns:
         JSON string with compliance status and details.
     """
     currency = currency.upper()
-    symbol = "€" if currency == "EUR" else "$"
-    difference = round(recipient_budget - gift_price, 2)
+    budget_currency = (budget_currency or currency).upper()
+    original_price = gift_price
+    if budget_currency != currency:
+        gift_price = get_fx_table().convert(gift_price, currency, budget_currency)
+        if gift_price is None:
+            return json.dumps({"error": f"No exchange rate from {currency} to {budget_currency}"})
+    status, difference = _evaluate_budget(gift_price, recipient_budget)
+    price = format_amount(gift_price, budget_currency)
+    if budget_currency != currency:
+        price += f" ({format_amount(original_price, currency)})"
+    budget = format_amount(recipient_budget, budget_currency)
 
-    # Determine compliance status
-    if gift_price <= recipient_budget:
-        status = "Pass"
+    # Describe compliance status
+    if status == "Pass":
         message = (
-            f"Compliance SUCCESS: Gift price is {symbol}{gift_price:.2f}, "
-            f"which is {symbol}{difference:.2f} under budget of {symbol}{recipient_budget:.2f}."
+            f"Compliance SUCCESS: Gift price is {price}, "
+            f"which is {format_amount(difference, budget_currency)} under budget of {budget}."
         )
-    elif gift_price <= recipient_budget * 1.05:
-        status = "Warning"
+    elif status == "Warning":
         message = (
-            f"Compliance WARNING: Gift price is {symbol}{gift_price:.2f}, "
-            f"exceeding budget of {symbol}{recipient_budget:.2f} by less than 5%."
+            f"Compliance WARNING: Gift price is {price}, "
+            f"exceeding budget of {budget} by less than 5%."
         )
     else:
-        status = "Fail"
         message = (
-            f"Compliance FAILURE: Gift price is {symbol}{gift_price:.2f}, "
-            f"exceeding budget of {symbol}{recipient_budget:.2f} by {symbol}{abs(difference):.2f}."
+            f"Compliance FAILURE: Gift price is {price}, "
+            f"exceeding budget of {budget} by {format_amount(abs(difference), budget_currency)}."
         )
 
-    return json.dumps({
+    result = {
         "compliance_status": status,
         "gift_price": round(gift_price, 2),
         "recipient_budget": round(recipient_budget, 2),
-        "currency": currency,
+        "currency": budget_currency,
         "budget_difference": difference,
         "compliance_message": message
-    })
+    }
+    if budget_currency != currency:
+        result.update(original_price=round(original_price, 2), original_currency=currency)
+    return json.dumps(result)
+
+
+@FunctionTool
+def check_budget_compliance_batch(
+    gift_ideas: List[dict],
+    recipient_budgets: Dict[str, float],
+    budget_currencies: Optional[Dict[str, str]] = None
+) -> str:
+    """
+    Check every gift idea against its recipient's budget in a single call (5% grace margin).
+
+    Prefer this over calling check_budget_compliance once per gift. Prices in another
+    currency than the budget are converted with the local FX table; do not convert
+    them yourself.
+
+    Args:
+        gift_ideas: All GiftIdea objects from the researchers (recipient, gift_title,
+            description, estimated_price, product_link, currency).
+        recipient_budgets: Maximum budget per recipient name, e.g. {"Dad": 50, "Mom": 40}.
+        budget_currencies: ISO currency code of each budget, e.g. {"Dad": "USD", "Mom": "EUR"}.
+
+    Returns:
+        Compact JSON string with a status summary and one row per gift idea.
+    """
+    checked = evaluate_gift_budgets(gift_ideas, recipient_budgets, budget_currencies)
+    return json.dumps(checked, separators=(",", ":"))
+
+
+def evaluate_gift_budgets(
+    gift_ideas: List[dict],
+    recipient_budgets: Mapping[str, object],
+    budget_currencies: Optional[Dict[str, str]] = None,
+    fx_table: Optional[FxTable] = None,
+) -> dict:
+    """
+    Validate a batch of gift ideas against a per-recipient budget map.
+
+    Applies the same Pass/Warning/Fail rules as check_budget_compliance. Recipient
+    names are matched case-insensitively; ideas that fail validation, have no
+    budget, have a budget that is not an amount or are priced in a currency
+    missing from the FX table are reported under 'errors' instead of aborting
+    the batch.
+
+    Prices are first normalized to each recipient's budget currency in one pass
+    over the batch; a recipient without a budget currency keeps the idea's own.
+    Converted rows carry the original price and currency in their last two columns.
+
+    Args:
+        gift_ideas: GiftIdea objects or their dict representation.
+        recipient_budgets: Maximum budget per recipient name, as a number or
+            text such as "$50" or "1.500 €".
+        budget_currencies: ISO currency code per recipient name.
+        fx_table: Rate table (defaults to the process-wide one).
+
+    Returns:
+        Dict with 'summary', 'columns', 'rows' and 'errors', plus 'fx' (the rate
+        table's base and date) when any price was converted.
+    """
+    budgets = {name.strip().lower(): (budget, parse_budget(budget)) for name, budget in recipient_budgets.items()}
+    currencies = {name.strip().lower(): code.upper() for name, code in (budget_currencies or {}).items() if code}
+    summary = {"Pass": 0, "Warning": 0, "Fail": 0}
+    rows = []
+    errors = []
+
+    # Validate and match budgets first, so prices are converted as one column
+    matched = []
+    for index, raw_idea in enumerate(gift_ideas):
+        try:
+            idea = raw_idea if isinstance(raw_idea, GiftIdea) else GiftIdea.model_validate(raw_idea)
+        except ValidationError as e:
+            errors.append({"index": index, "error": f"Invalid gift idea: {e.error_count()} field error(s)"})
+            continue
+
+        key = idea.recipient.strip().lower()
+        if key not in budgets:
+            errors.append({"index": index, "error": f"No budget for recipient: {idea.recipient}"})
+            continue
+        raw_budget, budget = budgets[key]
+        if budget is None:
+            errors.append({"index": index, "error": f"Unreadable budget for {idea.recipient}: {raw_budget!r}"})
+            continue
+        matched.append((index, idea, budget, idea.currency.upper(), currencies.get(key, idea.currency.upper())))
+
+    fx = None
+    prices = [idea.estimated_price for _, idea, _, _, _ in matched]
+    if any(currency != budget_currency for _, _, _, currency, budget_currency in matched):
+        fx = fx_table or get_fx_table()
+        prices = fx.convert_many(
+            prices,
+            [currency for _, _, _, currency, _ in matched],
+            [budget_currency for _, _, _, _, budget_currency in matched],
+        )
+
+    for (index, idea, budget, currency, budget_currency), price in zip(matched, prices):
+        if price is None:
+            errors.append({"index": index, "error": f"No exchange rate from {currency} to {budget_currency}"})
+            continue
+        converted = currency != budget_currency
+        status, difference = _evaluate_budget(price, budget)
+        summary[status] += 1
+        rows.append([
+            idea.recipient,
+            idea.gift_title,
+            round(price, 2),
+            round(budget, 2),
+            budget_currency,
+            status,
+            difference,
+            round(idea.estimated_price, 2) if converted else None,
+            currency if converted else None,
+        ])
+
+    checked = {
+        "summary": summary,
+        "columns": ["recipient", "gift_title", "gift_price", "recipient_budget", "currency",
+                    "compliance_status", "budget_difference", "original_price", "original_currency"],
+        "rows": rows,
+        "errors": errors,
+    }
+    if fx is not None:
+        snapshot = fx.snapshot()
+        checked["fx"] = {"base": snapshot.base, "as_of": snapshot.as_of}
+    return checked
+
+
+TABLE_HEADER = "| Recipient | Gift | Price | Budget | Budget check |\n|---|---|---|---|---|"
+
+_STATUS_LABELS = {"Pass": "✅ Pass", "Warning": "⚠️ Slightly over", "Fail": "❌ Over budget"}
+
+
+def budget_table_rows(checked: dict) -> List[str]:
+    """Markdown table rows (under TABLE_HEADER) for the result of evaluate_gift_budgets."""
+    return [
+        f"| {recipient} | {title} | {price:.2f} {currency}"
+        + (f" ({original_price:.2f} {original_currency})" if original_currency else "")
+        + f" | {budget:.2f} {currency} | {_STATUS_LABELS.get(status, status)} |"
+        for recipient, title, price, budget, currency, status, _, original_price, original_currency in checked["rows"]
+    ]
 
 
 @FunctionTool
-def get_recipient_profiles(user_id: str = "") -> str:
+def get_recipient_profiles(user_id: str = "", tool_context: ToolContext = None) -> str:
     """
-    Retrieve recipient profiles for the current user from the profile database.
+    Retrieve recipient profiles for the current user from the profile store.
 
     This tool loads personalized recipient profiles including interests,
     past successful gifts, and dislikes for each person the user shops for.
@@ -75,26 +248,63 @@ def get_recipient_profiles(user_id: str = "") -> str:
     if not user_id:
         user_id = os.getenv("CURRENT_USER_ID", "family_smith_123")
 
-    profiles = USER_PROFILES_DB.get(user_id, [])
+    # Remember the user so later workflow stages can look up the same profiles
+    if tool_context is not None:
+        tool_context.state[PROFILE_USER_ID_KEY] = user_id
 
-    if not profiles:
+    store = get_profile_store()
+    payload = store.get_profiles_json(user_id)
+
+    if payload is None:
         return json.dumps({
             "error": f"No profiles found for user_id: {user_id}",
-            "available_users": list(USER_PROFILES_DB.keys())
+            "available_users": store.user_ids(limit=20)
         })
 
-    # Convert profiles to serializable format
-    profiles_data = []
-    for profile in profiles:
-        profiles_data.append({
-            "recipient_name": profile.recipient_name,
-            "persistent_interests": profile.persistent_interests,
-            "past_successful_gifts": profile.past_successful_gifts,
-            "disliked_categories": profile.disliked_categories
-        })
+    # Pre-serialized by the profile store and cached until the profiles change
+    return payload
+
+
+@FunctionTool
+def record_learned_preferences(
+    recipient_name: str,
+    new_interests: Optional[List[str]] = None,
+    new_dislikes: Optional[List[str]] = None,
+    successful_gifts: Optional[List[str]] = None,
+    tool_context: ToolContext = None,
+) -> str:
+    """
+    Remember preferences the user revealed about a recipient for future gift plans.
 
+    Call this when the user says what a recipient likes or dislikes, or which
+    past gift was a hit. Updates are queued and saved in the background.
+
+    Args:
+        recipient_name: The recipient's name as in their profile, e.g. "Dad".
+        new_interests: Interests to add, e.g. ["Pour-over coffee"].
+        new_dislikes: Categories to avoid from now on, e.g. ["Socks"].
+        successful_gifts: Gifts the recipient loved, e.g. ["Kindle Paperwhite"].
+
+    Returns:
+        JSON string confirming what was recorded.
+    """
+    user_id = resolve_user_id(tool_context.state if tool_context is not None else {})
+    get_preference_writer().record(
+        user_id,
+        recipient_name,
+        interests=new_interests or [],
+        dislikes=new_dislikes or [],
+        successful_gifts=successful_gifts or [],
+    )
     return json.dumps({
-        "user_id": user_id,
-        "total_recipients": len(profiles),
-        "profiles": profiles_data
+        "status": "recorded",
+        "recipient_name": recipient_name,
+        "new_interests": new_interests or [],
+        "new_dislikes": new_dislikes or [],
+        "successful_gifts": successful_gifts or [],
     })
+
+
+def resolve_user_id(state: Mapping) -> str:
+    """Return the user whose profiles were loaded in this session, falling back to CURRENT_USER_ID."""
+    return state.get(PROFILE_USER_ID_KEY) or os.getenv("CURRENT_USER_ID", "family_smith_123")
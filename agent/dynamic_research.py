@@ -0,0 +1,191 @@
+"""Run-time researcher fan-out sized to the Collector's recipient briefs."""
+
+import asyncio
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Dict, List, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai.types import Content, Part
+
+from .parsing import parse_recipient_briefs
+from .request_budget import get_request_budget
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class ResearchRun:
+    """Per-invocation state of one fan-out (the agent itself is shared across sessions)."""
+
+    briefs: List[dict]
+    results: Dict[str, str] = field(default_factory=dict)
+    """{recipient_name: final researcher output}"""
+
+
+class DynamicResearchAgent(BaseAgent):
+    """
+    Parallel research stage that creates one researcher per recipient brief.
+
+    Unlike a static ParallelAgent, the researchers are built at run time from the
+    JSON array the Collector wrote to session state, so a household with 2 or 200
+    recipients gets exactly that many researchers. At most `max_concurrency` of
+    them run at once and each one is bounded by `researcher_timeout` seconds.
+    The request budget is sized to the number of briefs before they start.
+    """
+
+    researcher_factory: Callable[..., BaseAgent]
+    """Factory called as researcher_factory(brief=..., name=...) for each brief."""
+
+    briefs_key: str = "recipient_briefs"
+    """Session state key holding the Collector's output."""
+
+    results_key: str = "research_results"
+    """Session state key receiving {recipient_name: researcher output}."""
+
+    max_concurrency: int = 3
+    researcher_timeout: float = 90.0
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        briefs = parse_recipient_briefs(str(ctx.session.state.get(self.briefs_key, "")))
+        if not briefs:
+            logger.warning("No recipient briefs found in state key '%s'", self.briefs_key)
+            return
+        # Every researcher needs calls, searches and time of its own
+        budget = get_request_budget(ctx.invocation_id)
+        if budget is not None:
+            budget.set_recipients(len(briefs))
+
+        researchers = [
+            self.researcher_factory(brief=brief, name=f"Researcher_{i}")
+            for i, brief in enumerate(briefs)
+        ]
+        logger.info(
+            "Fanning out %d researchers (concurrency=%d)", len(researchers), self.max_concurrency
+        )
+
+        queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        run = self._start_run(ctx, briefs)
+        tasks = [
+            asyncio.create_task(self._run_researcher(ctx, researcher, brief, semaphore, queue, run))
+            for researcher, brief in zip(researchers, briefs)
+        ]
+
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event, resume = await queue.get()
+                if event is _DONE:
+                    remaining -= 1
+                    continue
+                yield event
+                # Let the researcher continue only once the runner has applied the event
+                resume.set()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield self._final_event(ctx, run)
+
+    def _start_run(self, ctx: InvocationContext, briefs: List[dict]) -> ResearchRun:
+        """Create the state shared by this invocation's researchers."""
+        return ResearchRun(briefs=briefs)
+
+    def _on_researcher_done(
+        self, ctx: InvocationContext, run: ResearchRun, brief: dict, text: str
+    ) -> Optional[Event]:
+        """Called as each researcher completes; may return an extra event to stream."""
+        return None
+
+    def _final_event(self, ctx: InvocationContext, run: ResearchRun) -> Event:
+        """Event closing the stage; stores every researcher's output in session state."""
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={self.results_key: run.results}),
+        )
+
+    async def _run_researcher(
+        self,
+        ctx: InvocationContext,
+        researcher: BaseAgent,
+        brief: dict,
+        semaphore: asyncio.Semaphore,
+        queue: asyncio.Queue,
+        run: ResearchRun,
+    ) -> None:
+        """Run one researcher under the concurrency cap and timeout, forwarding its events."""
+        timeout = self.researcher_timeout
+        try:
+            async with semaphore:
+                # Never run past the request's deadline
+                budget = get_request_budget(ctx.invocation_id)
+                seconds_left = budget.seconds_left() if budget is not None else None
+                if seconds_left is not None and seconds_left < timeout:
+                    timeout = seconds_left
+                async with asyncio.timeout(timeout), \
+                        aclosing(researcher.run_async(self._branch_ctx(ctx, researcher))) as events:
+                    async for event in events:
+                        if event.author == researcher.name and event.is_final_response():
+                            text = "".join(
+                                part.text for part in (event.content.parts if event.content else []) or []
+                                if part.text
+                            )
+                            if text:
+                                run.results[brief["recipient_name"]] = text
+                        await self._forward(queue, event)
+        except TimeoutError:
+            logger.warning(
+                "%s timed out after %.0fs for %s",
+                researcher.name, timeout, brief.get("recipient_name"),
+            )
+            if timeout < self.researcher_timeout:
+                budget.degrade(f"{researcher.name}: stopped at the request deadline")
+            await self._forward(queue, self._notice(
+                ctx, f"Research for {brief.get('recipient_name')} timed out; "
+                "no gift ideas are available for this recipient."
+            ))
+        except Exception as e:
+            # One failing researcher should not discard the other recipients' results
+            logger.error(f"{researcher.name} failed: {type(e).__name__}: {e}", exc_info=True)
+            await self._forward(queue, self._notice(
+                ctx, f"Research for {brief.get('recipient_name')} failed; "
+                "no gift ideas are available for this recipient."
+            ))
+        else:
+            follow_up = self._on_researcher_done(ctx, run, brief, run.results.get(brief["recipient_name"], ""))
+            if follow_up is not None:
+                await self._forward(queue, follow_up)
+        finally:
+            await queue.put((_DONE, None))
+
+    @staticmethod
+    async def _forward(queue: asyncio.Queue, event: Event) -> None:
+        """Hand an event to the consumer and wait until it has been processed."""
+        resume = asyncio.Event()
+        await queue.put((event, resume))
+        await resume.wait()
+
+    def _notice(self, ctx: InvocationContext, text: str) -> Event:
+        """Build a text event authored by this stage."""
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=Content(parts=[Part(text=text)], role="model"),
+        )
+
+    def _branch_ctx(self, ctx: InvocationContext, researcher: BaseAgent) -> InvocationContext:
+        """Give each researcher its own branch so their histories stay separate."""
+        branch_ctx = ctx.model_copy()
+        suffix = f"{self.name}.{researcher.name}"
+        branch_ctx.branch = f"{ctx.branch}.{suffix}" if ctx.branch else suffix
+        return branch_ctx
+
@@ -1,9 +1,14 @@
 """Error handling utilities for graceful degradation when models are overloaded."""
 
 import logging
+from contextlib import aclosing
 from typing import AsyncGenerator, Any
 from google.adk.agents import LlmAgent
+from google.adk.events import Event
 from google.genai.errors import ServerError
+from google.genai.types import Content, Part
+
+from .resilience import CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +18,9 @@ class GracefulErrorAgent(LlmAgent):
     Wrapper around LlmAgent that catches model overload errors and returns user-friendly messages.
 
     This agent catches 503 UNAVAILABLE errors from the Gemini API and converts them
-    into graceful user-facing messages instead of showing stack traces.
+    into graceful user-facing messages instead of showing stack traces. Transient
+    errors are already retried by ResilientLlm (see resilience.py), so this only
+    triggers once retries are exhausted or the circuit breaker is open.
     """
 
     async def run_async(self, *args, **kwargs) -> AsyncGenerator[Any, None]:
@@ -24,11 +31,13 @@ class GracefulErrorAgent(LlmAgent):
             Events from the underlying agent, or an error message event if the model is overloaded
         """
         try:
-            async for event in super().run_async(*args, **kwargs):
-                yield event
-        except ServerError as e:
-            # Check if this is a model overload error (503)
-            if e.status_code == 503:
+            # aclosing() closes the inner generator in this task, keeping ADK's tracing contexts balanced
+            async with aclosing(super().run_async(*args, **kwargs)) as events:
+                async for event in events:
+                    yield event
+        except (ServerError, CircuitOpenError) as e:
+            # Check if this is a model overload error (503) or the backend is known to be down
+            if isinstance(e, CircuitOpenError) or e.code == 503:
                 logger.warning(f"Model overloaded (503): {e}")
                 # Create a user-friendly error message event
                 error_message = (
@@ -38,9 +47,6 @@ class GracefulErrorAgent(LlmAgent):
                 )
 
                 # Yield a text event similar to what the agent would normally produce
-                from google.genai.types import Part, Content
-                from google.adk.events import Event
-
                 yield Event(
                     content=Content(
                         parts=[Part(text=error_message)],
@@ -62,9 +68,6 @@ class GracefulErrorAgent(LlmAgent):
                 "Please try again or contact support if the problem persists."
             )
 
-            from google.genai.types import Part, Content
-            from google.adk.events import Event
-
             yield Event(
                 content=Content(
                     parts=[Part(text=error_message)],
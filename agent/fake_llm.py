@@ -0,0 +1,335 @@
+"""Local stand-in model and search backends for running the workflow offline.
+
+`FakeLlm` returns canned text after a configurable delay and can inject 503
+ServerErrors, which makes retries, circuit breaking and hedging observable
+without a network connection. `FakeGiftModel` plays every role of the gift
+workflow (concierge, collector, researcher, aggregator) deterministically, and
+`FakeSearchBackend` stands in for grounded Google Search, so the full pipeline
+can be benchmarked without calling Gemini.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+from dataclasses import dataclass
+from typing import AsyncGenerator, Callable, Iterator, List, Optional
+
+from google.adk.models import BaseLlm, LlmCapabilities, LlmRequest, LlmResponse
+from google.genai.errors import ServerError
+from google.genai.types import (
+    Content,
+    FunctionCall,
+    GenerateContentResponseUsageMetadata,
+    Part,
+)
+from pydantic import PrivateAttr
+
+from .profile_store import get_profile_store
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    Latency model in seconds.
+
+    kind is "constant" (a), "uniform" (between a and b) or "lognormal"
+    (median a, shape sigma b).
+    """
+
+    kind: str = "constant"
+    a: float = 0.0
+    b: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        return self.a
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """Parse "0.5", "uniform:0.2,0.8" or "lognormal:0.6,0.4"."""
+        kind, _, params = spec.rpartition(":")
+        values = [float(value) for value in params.split(",") if value]
+        return cls(kind or "constant", *values)
+
+
+class FakeSearchBackend:
+    """Deterministic product catalog standing in for grounded Google Search."""
+
+    def __init__(self, latency: Optional[LatencyDistribution] = None, seed: int = 0):
+        self.latency = latency or LatencyDistribution()
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    async def search(self, query: str, max_budget: float, currency: str = "USD", count: int = 3) -> List[dict]:
+        """Return `count` products for the query priced around the budget."""
+        self.calls += 1
+        delay = self.latency.sample(self._rng)
+        if delay:
+            await asyncio.sleep(delay)
+
+        digest = hashlib.sha256(query.lower().encode()).digest()
+        words = [word.capitalize() for word in re.findall(r"[a-zA-Z]+", query)] or ["Gift"]
+        products = []
+        for i in range(count):
+            # Mostly under budget, occasionally a little over to exercise the grace margin
+            ratio = 0.55 + (digest[i] / 255) * 0.55
+            title = f"{words[i % len(words)]} {('Deluxe Set', 'Starter Kit', 'Premium Edition')[i % 3]}"
+            # One page per product title, so overlapping queries return the same product
+            # under different tracking parameters, as real search results do
+            product_id = hashlib.sha256(title.lower().encode()).hexdigest()[:10]
+            products.append({
+                "gift_title": title,
+                "description": f"Highly rated pick for fans of {query}.",
+                "estimated_price": round(max_budget * ratio, 2),
+                "product_link": f"https://www.shop.example.com/p/{product_id}?utm_source=search&srsltid={digest.hex()[:6]}",
+                "currency": currency,
+            })
+        return products
+
+
+class FakeLlm(BaseLlm):
+    """Deterministic (seeded) fake model with injectable latency and 503 errors."""
+
+    # Must look like a Gemini model name, otherwise built-in tools such as google_search refuse it
+    model: str = "gemini-fake"
+    reply: str = "OK"
+    responder: Optional[Callable[[LlmRequest], LlmResponse]] = None
+    """Optional function building the response from the request (overrides `reply`)."""
+
+    latency: float = 0.0
+    """Base delay in seconds before responding."""
+
+    latency_distribution: Optional[LatencyDistribution] = None
+    """If set, sampled per call and added to `latency`."""
+
+    tail_latency: float = 0.0
+    tail_probability: float = 0.0
+    """With `tail_probability`, `tail_latency` seconds are added to the delay."""
+
+    error_rate: float = 0.0
+    fail_first: int = 0
+    """Probability of a 503 per call, and a number of initial calls that always fail."""
+
+    capacity: int = 0
+    """Calls served at full speed at once; with more in flight every call slows down in proportion (0: unlimited)."""
+
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _calls: int = PrivateAttr(default=0)
+    _in_flight: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        # Answers with JSON text directly, like a model that takes a response schema alongside tools
+        return LlmCapabilities(output_schema_and_tools=True)
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self._calls += 1
+        delay = self.latency
+        if self.latency_distribution is not None:
+            delay += self.latency_distribution.sample(self._rng)
+        if self.tail_probability and self._rng.random() < self.tail_probability:
+            delay += self.tail_latency
+        if self.capacity and self._in_flight >= self.capacity:
+            # An overloaded backend shares its capacity between all calls in flight
+            delay *= (self._in_flight + 1) / self.capacity
+        if delay:
+            self._in_flight += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._in_flight -= 1
+
+        if self._calls <= self.fail_first or (self.error_rate and self._rng.random() < self.error_rate):
+            raise ServerError(503, {"error": {
+                "code": 503, "status": "UNAVAILABLE", "message": "The model is overloaded (fake)."
+            }})
+
+        response = await self._respond(llm_request)
+        if response.usage_metadata is None:
+            response.usage_metadata = _estimate_usage(llm_request, response)
+        yield response
+
+    async def _respond(self, llm_request: LlmRequest) -> LlmResponse:
+        if self.responder is not None:
+            return self.responder(llm_request)
+        return _text_response(self.reply)
+
+
+class FakeGiftModel(FakeLlm):
+    """
+    Fake model that plays every role of the gift workflow.
+
+    The role is recognised from the agent instruction; requests are expected to
+    carry the user id as "(user_id: <id>)" so the fake concierge can load the
+    right profiles.
+    """
+
+    search_backend: FakeSearchBackend
+
+    async def _respond(self, llm_request: LlmRequest) -> LlmResponse:
+        instruction = _system_text(llm_request)
+        if "Concierge" in instruction:
+            return self._concierge(llm_request)
+        if "Gift Briefing Specialist" in instruction:
+            return self._collector(llm_request)
+        if "Gift Researcher" in instruction:
+            return await self._researcher(llm_request)
+        if "Final Reviewer" in instruction:
+            return self._aggregator(llm_request)
+        return _text_response(self.reply)
+
+    def _concierge(self, llm_request: LlmRequest) -> LlmResponse:
+        if _last_function_response(llm_request, "get_recipient_profiles") is not None:
+            return _call_response("transfer_to_agent", {"agent_name": "GiftPlanningWorkflow"})
+        return _call_response("get_recipient_profiles", {"user_id": _user_id(llm_request)})
+
+    def _collector(self, llm_request: LlmRequest) -> LlmResponse:
+        message = _request_text(llm_request)
+        briefs = []
+        for profile in get_profile_store().get_profiles(_user_id(llm_request)):
+            match = re.search(re.escape(profile.recipient_name) + r"[^\w$€£]*([$€£]?)\s*(\d+(?:\.\d+)?)", message)
+            if match is None:
+                continue
+            briefs.append({
+                "recipient_name": profile.recipient_name,
+                "max_budget": float(match.group(2)),
+                "currency": "EUR" if match.group(1) == "€" else "GBP" if match.group(1) == "£" else "USD",
+                "search_query": " ".join(profile.persistent_interests) + " gift",
+            })
+        return _text_response(json.dumps(briefs))
+
+    async def _researcher(self, llm_request: LlmRequest) -> LlmResponse:
+        brief = next((found for text in _texts(llm_request) for found in _json_values(text, dict, "search_query")), {})
+        budget = float(brief.get("max_budget", 50))
+        currency = brief.get("currency", "USD")
+        if _uses_google_search(llm_request):
+            products = await self.search_backend.search(brief.get("search_query", "gift"), budget, currency)
+        else:
+            products = []
+        ideas = [{"recipient": brief.get("recipient_name", ""), **product} for product in products]
+        return _text_response(json.dumps(ideas))
+
+    def _aggregator(self, llm_request: LlmRequest) -> LlmResponse:
+        result = _last_function_response(llm_request, "check_budget_compliance_batch")
+        if result is not None:
+            payload = json.loads(result.get("result", "{}")) if isinstance(result.get("result"), str) else result
+            rows = "\n".join(
+                f"| {row[0]} | {row[1]} | {row[2]:.2f} {row[4]} | {row[5]} |"
+                for row in payload.get("rows", [])
+            )
+            return _text_response(
+                "🎁 Your gift plan\n\n| Recipient | Gift | Price | Budget check |\n|---|---|---|---|\n" + rows
+            )
+
+        scope = next((found for text in _texts(llm_request) for found in _json_values(text, dict, "recipient_budgets")), {})
+        return _call_response("check_budget_compliance_batch", {
+            "gift_ideas": scope.get("gift_ideas", []),
+            "recipient_budgets": scope.get("recipient_budgets", {}),
+            "budget_currencies": scope.get("budget_currencies", {}),
+        })
+
+
+def _text_response(text: str) -> LlmResponse:
+    return LlmResponse(content=Content(role="model", parts=[Part(text=text)]))
+
+
+def _call_response(name: str, args: dict) -> LlmResponse:
+    return LlmResponse(content=Content(role="model", parts=[Part(function_call=FunctionCall(name=name, args=args))]))
+
+
+def _system_text(llm_request: LlmRequest) -> str:
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if instruction is None:
+        return ""
+    if isinstance(instruction, str):
+        return instruction
+    return "".join(part.text or "" for part in getattr(instruction, "parts", None) or [])
+
+
+def _texts(llm_request: LlmRequest) -> List[str]:
+    """The system instruction and every text part of the request."""
+    return [_system_text(llm_request)] + [
+        part.text for content in llm_request.contents for part in content.parts or [] if part.text
+    ]
+
+
+def _request_text(llm_request: LlmRequest) -> str:
+    """The most recent user message carrying a user_id (the actual gift request)."""
+    for content in reversed(llm_request.contents):
+        text = "".join(part.text or "" for part in content.parts or [])
+        if content.role == "user" and "user_id:" in text:
+            return text
+    return ""
+
+
+def _user_id(llm_request: LlmRequest) -> str:
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            match = re.search(r"user_id:\s*([\w-]+)", part.text or "")
+            if match:
+                return match.group(1)
+    return ""
+
+
+def _last_function_response(llm_request: LlmRequest, name: str) -> Optional[dict]:
+    """The response of `name` if it is in the most recent content, else None."""
+    if not llm_request.contents:
+        return None
+    for part in llm_request.contents[-1].parts or []:
+        if part.function_response and part.function_response.name == name:
+            return part.function_response.response or {}
+    return None
+
+
+def _uses_google_search(llm_request: LlmRequest) -> bool:
+    tools = llm_request.config.tools if llm_request.config else None
+    return any(getattr(tool, "google_search", None) is not None for tool in tools or [])
+
+
+def _json_values(text: str, kind: type, required_key: str) -> Iterator:
+    """Yield JSON values of `kind` embedded in text whose (first) object has `required_key`."""
+    decoder = json.JSONDecoder()
+    opener = "[" if kind is list else "{"
+    for match in re.finditer(re.escape(opener), text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        sample = value[0] if isinstance(value, list) and value else value
+        if isinstance(value, kind) and isinstance(sample, dict) and required_key in sample:
+            yield value
+
+
+def _estimate_usage(llm_request: LlmRequest, response: LlmResponse) -> GenerateContentResponseUsageMetadata:
+    """Approximate token counts at ~4 characters per token."""
+    prompt_chars = len(_system_text(llm_request)) + sum(
+        len(part.text or "") + len(str(part.function_response.response) if part.function_response else "")
+        for content in llm_request.contents for part in content.parts or []
+    )
+    output_chars = sum(
+        len(part.text or "") + len(str(part.function_call.args) if part.function_call else "")
+        for part in (response.content.parts if response.content else None) or []
+    )
+    prompt_tokens, output_tokens = max(1, prompt_chars // 4), max(1, output_chars // 4)
+    return GenerateContentResponseUsageMetadata(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
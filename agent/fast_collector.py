@@ -0,0 +1,208 @@
+"""Deterministic fast path for the Collector stage.
+
+Most gift requests are simple lists such as "Dad $50, Mom €40": known recipient
+names, each followed by a budget. Turning those into recipient briefs does not
+need a model round trip, so the Collector's before_model callback parses them
+in code, builds the search query from the recipient's profile and answers with
+the same JSON brief schema the model would produce. Anything ambiguous
+(unknown names, shared or missing budgets, ranges, repeated names) falls
+through to the LLM Collector, and so does any request that says more than
+names and budgets ("no coffee this year"), since the profile-derived briefs
+would drop it.
+"""
+
+import json
+import logging
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai.types import Content, Part
+
+from .custom_tools import resolve_user_id
+from .data_models import RecipientProfile
+from .fx_rates import CURRENCY_SYMBOLS, CURRENCY_WORDS
+from .profile_store import get_profile_store
+
+logger = logging.getLogger(__name__)
+
+# Longest symbols first so "C$50" is not read as "$50"
+_SYMBOLS = "|".join(re.escape(symbol) for symbol in sorted(CURRENCY_SYMBOLS, key=len, reverse=True))
+_SYMBOL_CODES = {symbol.lower(): code for symbol, code in CURRENCY_SYMBOLS.items()}
+_AMOUNT = re.compile(
+    rf"(?<![\w.])(?:(?P<symbol>{_SYMBOLS})\s*)?"
+    r"(?P<amount>\d{1,3}(?:,\d{3})+|\d+)(?:\.(?P<cents>\d{1,2}))?(?![\w.])"
+    rf"(?:\s*(?P<suffix>{_SYMBOLS}|(?:{'|'.join(CURRENCY_WORDS)})\b))?",
+    re.IGNORECASE,
+)
+_USER_ID = re.compile(r"\(?\buser_id:\s*[\w-]+\)?", re.IGNORECASE)
+_WORD = re.compile(r"[^\W\d_]+")
+# Words that may surround names and budgets without saying anything about the gifts
+# ("no", "not" and the like are left out: they always qualify something)
+FILLER_WORDS = frozenset("""
+    a an and the for my our of to in on with at this each per s is are be
+    please pls find get pick choose suggest recommend need want looking help me us i we can could would you
+    gift gifts present presents idea ideas something some
+    budget budgets max maximum up under around about roughly
+    hi hello hey thanks thank christmas xmas holiday holidays year
+    refresh refreshed
+""".split())
+# "$50 for Dad" attaches the amount to the following name
+_FOR_NEXT = re.compile(r"^\s*(?:each\s+)?for\s+(?:my\s+|our\s+)?$", re.IGNORECASE)
+
+
+def build_search_query(profile: RecipientProfile) -> str:
+    """Search query synthesized from the recipient's persistent interests."""
+    return " ".join([*profile.persistent_interests, "gift"])
+
+
+def _aliases(profiles: Sequence[RecipientProfile]) -> Dict[str, RecipientProfile]:
+    """
+    Lowercased names a user may use for each recipient.
+
+    Besides the full name, the last word of multi-word names ("Team Lead Sarah"
+    -> "sarah") is accepted when no other recipient shares it.
+    """
+    aliases = {profile.recipient_name.strip().lower(): profile for profile in profiles}
+    short: Dict[str, List[RecipientProfile]] = {}
+    for profile in profiles:
+        words = profile.recipient_name.split()
+        if len(words) > 1:
+            short.setdefault(words[-1].lower(), []).append(profile)
+    for alias, owners in short.items():
+        if len(owners) == 1 and alias not in aliases:
+            aliases[alias] = owners[0]
+    return aliases
+
+
+def _find_mentions(text: str, profiles: Sequence[RecipientProfile]) -> Optional[List[Tuple[int, int, RecipientProfile]]]:
+    """Recipient mentions as (start, end, profile), or None if a recipient is named twice."""
+    aliases = _aliases(profiles)
+    taken = [False] * len(text)
+    mentions = []
+    # Longest aliases first so "Team Lead Sarah" wins over "Sarah"
+    for alias in sorted(aliases, key=len, reverse=True):
+        for match in re.finditer(rf"\b{re.escape(alias)}(?:'s)?\b", text, re.IGNORECASE):
+            if any(taken[match.start():match.end()]):
+                continue
+            taken[match.start():match.end()] = [True] * (match.end() - match.start())
+            mentions.append((match.start(), match.end(), aliases[alias]))
+    mentions.sort(key=lambda mention: mention[0])
+    names = [profile.recipient_name for _, _, profile in mentions]
+    if len(names) != len(set(names)):
+        return None
+    return mentions
+
+
+def _find_amounts(
+    text: str, mentions: List[Tuple[int, int, RecipientProfile]]
+) -> List[Tuple[int, int, float, Optional[str]]]:
+    """Amounts in the text as (start, end, value, currency), skipping numbers inside recipient names."""
+    amounts = []
+    for match in _AMOUNT.finditer(text):
+        if any(start <= match.start() < end for start, end, _ in mentions):
+            continue
+        marker = (match.group("symbol") or match.group("suffix") or "").lower()
+        currency = _SYMBOL_CODES.get(marker) or CURRENCY_WORDS.get(marker)
+        value = float(match.group("amount").replace(",", "") + "." + (match.group("cents") or "0"))
+        amounts.append((match.start(), match.end(), value, currency))
+    return amounts
+
+
+def unparsed_words(text: str, profiles: Sequence[RecipientProfile]) -> List[str]:
+    """
+    Lowercased words of the request besides recipient names, budgets and FILLER_WORDS.
+
+    These carry what a structured parse cannot capture ("he now loves golf, no
+    coffee this year"), so a request with any of them needs the model.
+    """
+    text = _USER_ID.sub(" ", text or "")
+    mentions = _find_mentions(text, profiles) or []
+    spans = [(start, end) for start, end, _ in mentions]
+    spans.extend((start, end) for start, end, _, _ in _find_amounts(text, mentions))
+    chars = list(text)
+    for start, end in spans:
+        chars[start:end] = " " * (end - start)
+    return [word for word in _WORD.findall("".join(chars).lower()) if word not in FILLER_WORDS]
+
+
+def parse_structured_request(text: str, profiles: Sequence[RecipientProfile]) -> Optional[List[dict]]:
+    """
+    Parse "<recipient> <budget>" style requests into recipient briefs.
+
+    Args:
+        text: The user's gift request.
+        profiles: The user's recipient profiles; only these names are recognised.
+
+    Returns:
+        Briefs (recipient_name, max_budget, currency, search_query) in the order
+        the recipients were mentioned, or None when the request is ambiguous and
+        should go to the LLM Collector.
+    """
+    text = _USER_ID.sub(" ", text or "")
+    mentions = _find_mentions(text, profiles)
+    if not mentions:
+        return None
+
+    amounts = _find_amounts(text, mentions)
+    if not amounts:
+        return None
+
+    # Attach each amount to the mention before it, or to the next one for "$50 for Dad"
+    budgets: Dict[int, List[Tuple[float, Optional[str]]]] = {}
+    for start, end, value, currency in amounts:
+        following = next((i for i, mention in enumerate(mentions) if mention[0] >= end), None)
+        if following is not None and _FOR_NEXT.match(text[end:mentions[following][0]]):
+            owner = following
+        else:
+            owner = max((i for i, mention in enumerate(mentions) if mention[1] <= start), default=None)
+        if owner is None:
+            return None
+        budgets.setdefault(owner, []).append((value, currency))
+
+    if len(budgets) != len(mentions) or any(len(found) != 1 for found in budgets.values()):
+        return None
+
+    # Bare numbers take the request's currency when it only uses one
+    currencies = {currency for found in budgets.values() for _, currency in found if currency}
+    if len(currencies) > 1 and any(currency is None for found in budgets.values() for _, currency in found):
+        return None
+    default_currency = next(iter(currencies), "USD")
+
+    briefs = []
+    for index, (_, _, profile) in enumerate(mentions):
+        value, currency = budgets[index][0]
+        briefs.append({
+            "recipient_name": profile.recipient_name,
+            "max_budget": value,
+            "currency": currency or default_currency,
+            "search_query": build_search_query(profile),
+        })
+    return briefs
+
+
+def collector_fast_path(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """
+    before_model_callback for the Collector that answers structured requests in code.
+
+    Returns:
+        The briefs as the model's JSON answer, or None to let the model handle the request
+    """
+    content = callback_context.user_content
+    text = "".join(part.text or "" for part in (content.parts if content else None) or [])
+    profiles = get_profile_store().get_profiles(resolve_user_id(callback_context.state))
+    if not text or not profiles:
+        return None
+
+    briefs = parse_structured_request(text, profiles)
+    if briefs is None:
+        logger.debug("Collector fast path declined; using the model")
+        return None
+    extra = unparsed_words(text, profiles)
+    if extra:
+        # Stated preferences or constraints would be lost in profile-derived briefs
+        logger.debug("Collector fast path declined for extra words %s; using the model", extra)
+        return None
+    logger.info("Collector fast path built %d briefs without a model call", len(briefs))
+    return LlmResponse(content=Content(role="model", parts=[Part(text=json.dumps(briefs, ensure_ascii=False))]))
@@ -0,0 +1,220 @@
+"""Currency catalogue and the local FX rate table used by the budget checks.
+
+Gift ideas come back priced in whatever currency the shop uses ("£35",
+"4,990 ¥", "R$ 120"), while each recipient's budget has its own currency.
+Comparing those used to be left to the model. Instead, prices are converted
+in code with a rate table read from a JSON file (the bundled fx_rates.json or
+HGS_FX_RATES_PATH):
+
+    {"base": "USD", "as_of": "2026-10-01", "rates": {"USD": 1.0, "EUR": 0.862, ...}}
+
+where each rate is units of that currency per one unit of the base. The table
+is loaded once and kept in memory as an immutable snapshot. At most every
+HGS_FX_REFRESH_SECONDS the file's modification time is checked, and a changed
+file is reloaded and swapped in atomically, so rates can be updated without a
+restart. A file that fails to parse is logged and the previous snapshot kept.
+Conversions only use the table, so the same inputs always give the same
+amounts.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Longest first, so "C$" or "US$" is matched before "$"
+CURRENCY_SYMBOLS = {
+    "US$": "USD", "CA$": "CAD", "AU$": "AUD", "NZ$": "NZD", "HK$": "HKD", "MX$": "MXN", "CN¥": "CNY",
+    "C$": "CAD", "A$": "AUD", "S$": "SGD", "R$": "BRL", "zł": "PLN", "Kč": "CZK",
+    "$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "₩": "KRW",
+    "₺": "TRY", "₪": "ILS", "฿": "THB", "₱": "PHP",
+}
+ISO_CURRENCY_CODES = (
+    "USD", "EUR", "GBP", "CAD", "AUD", "NZD", "JPY", "CHF", "CNY", "INR",
+    "SEK", "NOK", "DKK", "PLN", "MXN", "BRL", "SGD", "HKD", "ZAR", "KRW",
+    "TRY", "ILS", "THB", "PHP", "CZK", "HUF", "AED", "MYR", "IDR",
+)
+CURRENCY_WORDS = {
+    # "TRY" is left out: "Mom 40 try something" is not a lira budget
+    **{code.lower(): code for code in ISO_CURRENCY_CODES if code != "TRY"},
+    "dollar": "USD", "dollars": "USD", "bucks": "USD",
+    "euro": "EUR", "euros": "EUR",
+    "pound": "GBP", "pounds": "GBP",
+    "yen": "JPY", "yuan": "CNY", "renminbi": "CNY",
+    "rupee": "INR", "rupees": "INR", "rupiah": "IDR",
+    "franc": "CHF", "francs": "CHF", "zloty": "PLN", "zlotys": "PLN",
+    "krona": "SEK", "kronor": "SEK", "reais": "BRL", "rand": "ZAR",
+    "lira": "TRY", "shekel": "ILS", "shekels": "ILS", "baht": "THB", "ringgit": "MYR",
+}
+
+# Symbol written before an amount when displaying a price
+_DISPLAY_SYMBOLS = {
+    "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "INR": "₹", "KRW": "₩",
+    "CAD": "C$", "AUD": "A$", "NZD": "NZ$", "HKD": "HK$", "SGD": "S$", "MXN": "MX$",
+    "BRL": "R$", "CNY": "CN¥", "TRY": "₺", "ILS": "₪", "THB": "฿", "PHP": "₱",
+}
+
+DEFAULT_RATES_PATH = os.path.join(os.path.dirname(__file__), "fx_rates.json")
+
+
+def currency_symbol(currency: str) -> Optional[str]:
+    """Symbol to write before an amount in this currency, or None to write the code after it."""
+    return _DISPLAY_SYMBOLS.get(currency.upper())
+
+
+def format_amount(amount: float, currency: str) -> str:
+    """'$39.99' or '39.99 CHF'."""
+    symbol = currency_symbol(currency)
+    return f"{symbol}{amount:.2f}" if symbol else f"{amount:.2f} {currency.upper()}"
+
+
+@dataclass(frozen=True)
+class FxSnapshot:
+    """One immutable version of the rate table."""
+
+    base: str
+    as_of: str
+    rates: Mapping[str, float]
+    """Units of each currency per one unit of the base currency."""
+    source: str
+    mtime_ns: int = 0
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """Multiplier from one currency to another, or None if either is not in the table."""
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        if from_currency == to_currency:
+            return 1.0
+        source, target = self.rates.get(from_currency), self.rates.get(to_currency)
+        if source is None or target is None:
+            return None
+        return target / source
+
+
+def load_snapshot(path: str) -> FxSnapshot:
+    """Read and validate a rate table file."""
+    with open(path, encoding="utf-8") as f:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        data = json.load(f)
+    base = str(data.get("base") or "USD").upper()
+    rates = {}
+    for code, rate in (data.get("rates") or {}).items():
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError(f"Rate for {code} must be positive, got {rate}")
+        rates[str(code).upper()] = rate
+    rates.setdefault(base, 1.0)
+    if rates[base] != 1.0:
+        raise ValueError(f"Base currency {base} must have rate 1.0, got {rates[base]}")
+    return FxSnapshot(base=base, as_of=str(data.get("as_of") or ""), rates=rates, source=path, mtime_ns=mtime_ns)
+
+
+class FxTable:
+    """
+    Memory-resident FX rates backed by a JSON file, reloaded when the file changes.
+
+    Args:
+        path: Rate table file
+        refresh_interval: Seconds between checks of the file's modification time (0 checks on every use)
+    """
+
+    def __init__(self, path: str = DEFAULT_RATES_PATH, refresh_interval: float = 60.0):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._snapshot = load_snapshot(path)
+        self._checked_at = time.monotonic()
+        self._failed_mtime_ns: Optional[int] = None
+        self._stats = {"reloads": 0, "reload_errors": 0, "conversions": 0}
+
+    def snapshot(self) -> FxSnapshot:
+        """The current table, reloading it first if the file changed since the last check."""
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh(force=False)
+        return self._snapshot
+
+    def refresh(self, force: bool = True) -> FxSnapshot:
+        """
+        Reload the file (only if its modification time changed, unless `force`).
+
+        Returns:
+            The snapshot now in use; the previous one if the file could not be loaded
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            mtime_ns = None
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+                # Unchanged, or the same broken version that failed to load last time
+                if not force and mtime_ns in (self._snapshot.mtime_ns, self._failed_mtime_ns):
+                    return self._snapshot
+                snapshot = load_snapshot(self.path)
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                self._failed_mtime_ns = mtime_ns
+                self._stats["reload_errors"] += 1
+                logger.error("Keeping FX rates as of %s; reloading %s failed: %s", self._snapshot.as_of, self.path, e)
+                return self._snapshot
+            self._snapshot = snapshot
+            self._stats["reloads"] += 1
+            logger.info("Loaded %d FX rates as of %s from %s", len(snapshot.rates), snapshot.as_of, self.path)
+            return snapshot
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        return self.snapshot().rate(from_currency, to_currency)
+
+    def convert(self, amount: float, from_currency: str, to_currency: str) -> Optional[float]:
+        """`amount` in `to_currency`, rounded to cents, or None if a currency is not in the table."""
+        return self.convert_many([amount], [from_currency], [to_currency])[0]
+
+    def convert_many(
+        self,
+        amounts: Sequence[float],
+        from_currencies: Sequence[str],
+        to_currencies: Sequence[str],
+    ) -> List[Optional[float]]:
+        """
+        Convert a whole column of amounts against one snapshot of the table.
+
+        Each distinct currency pair is resolved once and the rates are then applied
+        across the column, so a batch never mixes two versions of the table.
+
+        Returns:
+            Converted amounts rounded to cents; None where a currency is not in the table
+        """
+        snapshot = self.snapshot()
+        pairs = list(zip((c.upper() for c in from_currencies), (c.upper() for c in to_currencies)))
+        rates: Dict[Tuple[str, str], Optional[float]] = {pair: snapshot.rate(*pair) for pair in set(pairs)}
+        self._stats["conversions"] += len(pairs)
+        return [
+            None if rate is None else round(amount * rate, 2)
+            for amount, rate in zip(amounts, map(rates.__getitem__, pairs))
+        ]
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {**self._stats, "base": snapshot.base, "as_of": snapshot.as_of, "currencies": len(snapshot.rates)}
+
+
+_fx_table: Optional[FxTable] = None
+_fx_lock = threading.Lock()
+
+
+def get_fx_table() -> FxTable:
+    """
+    Return the process-wide FX table, loading it on first use.
+
+    Rates come from HGS_FX_RATES_PATH (default: the bundled agent/fx_rates.json);
+    HGS_FX_REFRESH_SECONDS (default 60) sets how often the file is checked for changes.
+    """
+    global _fx_table
+    with _fx_lock:
+        if _fx_table is None:
+            _fx_table = FxTable(
+                path=os.getenv("HGS_FX_RATES_PATH") or DEFAULT_RATES_PATH,
+                refresh_interval=float(os.getenv("HGS_FX_REFRESH_SECONDS", "60")),
+            )
+    return _fx_table
@@ -0,0 +1,315 @@
+"""Cross-researcher deduplication of gift ideas.
+
+Recipients with overlapping interests send different researchers to the same
+products, which come back under slightly different titles or tracking links.
+Each idea is indexed once: its product_link is canonicalized (tracking
+parameters, host and path noise removed) and its title is reduced to a MinHash
+signature over character shingles, split into LSH bands. A new idea is only
+compared with the few ideas sharing its link or one of its band buckets, so the
+whole pass stays linear in the number of ideas. Only links that point at a
+product page (an Amazon-style /dp/<id> or a path at least two segments deep)
+count as the same product, and only for reasonably similar titles; store
+homepages and shallow category pages are shared by unrelated gifts.
+
+Duplicates for the same recipient are collapsed. A product already suggested
+for a recipient named earlier in the request is dropped for later ones, who keep their other ideas
+as the alternative, unless it is the only idea they have left.
+"""
+
+import json
+import logging
+import random
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+
+from .data_models import GiftIdea
+from .gift_filter import normalize_tokens
+from .parsing import parse_gift_ideas, parse_recipient_briefs
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that identify the visit rather than the product
+TRACKING_PARAMS = frozenset({
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid",
+    "ref", "ref_", "referrer", "source", "srsltid", "tag", "affiliate", "aff_id",
+    "_ga", "_gl", "igshid", "spm", "psc", "th", "smid", "crid", "sprefix", "qid", "sr",
+})
+_HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+# Amazon-style product paths carry the product id plus SEO and tracking segments
+_PRODUCT_ID_PATH = re.compile(r"/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})", re.IGNORECASE)
+# Canonical paths that name one product rather than a store or category page
+_PRODUCT_PATH = re.compile(r"^/dp/[A-Z0-9]{10}$|^/[^/]+/[^/]+")
+
+NUM_PERMUTATIONS = 32
+BANDS = 16
+"""BANDS x rows = NUM_PERMUTATIONS; 16 bands of 2 rows catch titles from ~0.5 Jaccard similarity."""
+
+TITLE_THRESHOLD = 0.75
+"""Title shingle Jaccard at which two ideas are the same product."""
+
+TITLE_FLOOR = 0.55
+DESCRIPTION_THRESHOLD = 0.6
+"""Titles between the floor and the threshold also need similar descriptions."""
+
+PRICE_TOLERANCE = 0.2
+"""Text-similar ideas are only merged when their prices differ by at most this fraction."""
+
+MAX_BUCKET_CHECKS = 8
+"""Ideas compared per LSH bucket, which bounds the work per idea."""
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def canonical_link(url: str) -> str:
+    """
+    Normalize a product URL so links to the same page compare equal.
+
+    Lowercases scheme and host, drops "www."/"m." prefixes, default ports,
+    fragments, trailing slashes, utm_* and other tracking parameters, sorts the
+    remaining parameters, and reduces Amazon-style /dp/<id> paths to the id.
+    """
+    url = (url or "").strip()
+    if not url:
+        return ""
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    host = (parts.hostname or "").lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    product = _PRODUCT_ID_PATH.search(parts.path)
+    path = f"/dp/{product.group(1).upper()}" if product else (parts.path.rstrip("/") or "/")
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit(("https", host, path, "" if product else query, ""))
+
+
+def is_product_link(link: str) -> bool:
+    """Whether a canonical link identifies one product, so ideas sharing it are the same gift."""
+    return bool(link) and bool(_PRODUCT_PATH.match(urlsplit(link).path))
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """Character shingles of each normalized token; word order does not matter."""
+    result = set()
+    for token in normalize_tokens(text):
+        padded = f" {token} "
+        result.update(padded[i:i + size] for i in range(max(1, len(padded) - size + 1)))
+    return frozenset(result)
+
+
+def jaccard(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class MinHasher:
+    """MinHash signatures from seeded universal hash permutations."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, seed: int = 1):
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+    def signature(self, items: Iterable[str]) -> Tuple[int, ...]:
+        hashes = [zlib.crc32(item.encode()) for item in items]
+        if not hashes:
+            return ()
+        return tuple(
+            min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+            for a, b in self._permutations
+        )
+
+
+_minhasher = MinHasher()
+
+
+@dataclass
+class _Entry:
+    idea: GiftIdea
+    link: str
+    title: FrozenSet[str]
+    description: FrozenSet[str]
+
+
+class DedupIndex:
+    """Incremental index of kept ideas; `find` returns the kept idea a new one duplicates."""
+
+    def __init__(self, bands: int = BANDS):
+        self._bands = bands
+        self._rows = NUM_PERMUTATIONS // bands
+        self._entries: List[_Entry] = []
+        self._by_link: Dict[str, List[int]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+
+    def _entry(self, idea: GiftIdea) -> _Entry:
+        return _Entry(
+            idea=idea,
+            link=canonical_link(idea.product_link),
+            title=shingles(idea.gift_title),
+            description=frozenset(normalize_tokens(idea.description)),
+        )
+
+    def _band_keys(self, entry: _Entry) -> List[Tuple[int, Tuple[int, ...]]]:
+        signature = _minhasher.signature(entry.title)
+        if not signature:
+            return []
+        return [
+            (band, signature[band * self._rows:(band + 1) * self._rows])
+            for band in range(self._bands)
+        ]
+
+    @staticmethod
+    def _same_product(new: _Entry, kept: _Entry) -> bool:
+        if new.idea.currency.upper() != kept.idea.currency.upper():
+            return False
+        low, high = sorted((new.idea.estimated_price, kept.idea.estimated_price))
+        if high and (high - low) / high > PRICE_TOLERANCE:
+            return False
+        similarity = jaccard(new.title, kept.title)
+        return similarity >= TITLE_THRESHOLD or (
+            similarity >= TITLE_FLOOR and jaccard(new.description, kept.description) >= DESCRIPTION_THRESHOLD
+        )
+
+    def find(self, idea: GiftIdea) -> Tuple[Optional[GiftIdea], _Entry, List[Tuple[int, Tuple[int, ...]]]]:
+        """(kept duplicate or None, the idea's index entry, its band keys) for `add`."""
+        entry = self._entry(idea)
+        for position in self._by_link.get(entry.link, ()):
+            # The link names the product; prices and currencies may differ between shops' regions
+            kept = self._entries[position]
+            if jaccard(entry.title, kept.title) >= TITLE_FLOOR:
+                return kept.idea, entry, []
+        keys = self._band_keys(entry)
+        checked = set()
+        for key in keys:
+            for position in self._buckets.get(key, ())[:MAX_BUCKET_CHECKS]:
+                if position in checked:
+                    continue
+                checked.add(position)
+                if self._same_product(entry, self._entries[position]):
+                    return self._entries[position].idea, entry, keys
+        return None, entry, keys
+
+    def add(self, entry: _Entry, keys: List[Tuple[int, Tuple[int, ...]]]) -> None:
+        position = len(self._entries)
+        self._entries.append(entry)
+        if is_product_link(entry.link):
+            self._by_link.setdefault(entry.link, []).append(position)
+        for key in keys or self._band_keys(entry):
+            self._buckets.setdefault(key, []).append(position)
+
+
+@dataclass
+class DedupResult:
+    """Outcome of deduplicating a batch of gift ideas."""
+
+    accepted: List[GiftIdea] = field(default_factory=list)
+    duplicates: List[dict] = field(default_factory=list)
+
+
+def dedup_gift_ideas(
+    ideas: Iterable[GiftIdea],
+    index: Optional[DedupIndex] = None,
+    recipient_order: Sequence[str] = (),
+) -> DedupResult:
+    """
+    Collapse duplicate gift ideas, earlier recipients keeping shared products.
+
+    Args:
+        ideas: Gift ideas grouped by recipient.
+        index: Index of ideas kept so far; pass the same one across calls to
+            deduplicate incrementally (e.g. per streamed recipient, where the
+            order is the order researchers finish in).
+        recipient_order: Recipient names in request order. Groups are processed
+            in this order rather than the order of `ideas` (which follows
+            researcher completion), so a shared product always stays with the
+            same recipient. Recipients not listed come last.
+
+    Returns:
+        DedupResult with the kept ideas and one report entry per dropped duplicate.
+    """
+    index = index or DedupIndex()
+    result = DedupResult()
+
+    by_recipient: Dict[str, List[GiftIdea]] = {}
+    for idea in ideas:
+        by_recipient.setdefault(idea.recipient.strip().lower(), []).append(idea)
+
+    rank = {name.strip().lower(): position for position, name in enumerate(recipient_order)}
+    groups = sorted(by_recipient.items(), key=lambda item: rank.get(item[0], len(rank)))
+    for _, group in groups:
+        kept_any = False
+        deferred = []
+        for idea in group:
+            duplicate_of, entry, keys = index.find(idea)
+            if duplicate_of is None:
+                index.add(entry, keys)
+                result.accepted.append(idea)
+                kept_any = True
+            elif duplicate_of.recipient.strip().lower() == idea.recipient.strip().lower():
+                result.duplicates.append(_report(idea, duplicate_of))
+            else:
+                deferred.append((idea, duplicate_of, entry, keys))
+        for position, (idea, duplicate_of, entry, keys) in enumerate(deferred):
+            if not kept_any and position == 0:
+                # Shared product, but nothing else for this recipient: keep it
+                index.add(entry, keys)
+                result.accepted.append(idea)
+                kept_any = True
+            else:
+                result.duplicates.append(_report(idea, duplicate_of))
+    return result
+
+
+def _report(idea: GiftIdea, duplicate_of: GiftIdea) -> dict:
+    return {
+        "recipient": idea.recipient,
+        "gift_title": idea.gift_title,
+        "duplicate_of": {"recipient": duplicate_of.recipient, "gift_title": duplicate_of.gift_title},
+    }
+
+
+class GiftDedupAgent(BaseAgent):
+    """
+    Workflow stage that removes duplicate gift ideas before the Aggregator sees them.
+
+    Reads the filtered ideas (JSON) from `input_key`, writes the deduplicated
+    ideas back to `output_key` and the merged duplicates to `duplicates_key`.
+    Shared products go to the recipient named first in the briefs at `briefs_key`.
+    """
+
+    input_key: str = "gift_ideas"
+    output_key: str = "gift_ideas"
+    duplicates_key: str = "duplicate_gift_ideas"
+    briefs_key: str = "recipient_briefs"
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        ideas = parse_gift_ideas(str(ctx.session.state.get(self.input_key) or "[]"))
+        briefs = parse_recipient_briefs(str(ctx.session.state.get(self.briefs_key) or ""))
+        result = dedup_gift_ideas(ideas, recipient_order=[brief["recipient_name"] for brief in briefs])
+        logger.info("Gift dedup kept %d of %d ideas", len(result.accepted), len(ideas))
+
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={
+                self.output_key: json.dumps([idea.model_dump() for idea in result.accepted]),
+                self.duplicates_key: json.dumps(result.duplicates),
+            }),
+        )
@@ -0,0 +1,281 @@
+"""Deterministic dislike / past-gift filter for researcher gift ideas.
+
+Instead of asking the model to "filter out items that match disliked categories",
+each recipient's disliked_categories and past_successful_gifts are compiled into
+an Aho-Corasick automaton over normalized, stemmed tokens (with a small synonym
+table), and every GiftIdea title and description is scanned in a single pass.
+This is what finally enforces the "Socks Clause" in code.
+
+A match right after a negation ("no video games included") or inside a compound
+that names something else ("stocking stuffer") does not count. The title is
+what the idea is, so one match there rejects it; the description only describes
+it, so a single passing mention there is not enough.
+"""
+
+import json
+import logging
+import re
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncGenerator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai.types import Content, Part
+
+from .custom_tools import resolve_user_id
+from .data_models import GiftIdea, RecipientProfile
+from .parsing import parse_gift_ideas
+from .profile_store import get_profile_store
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning on their own in a disliked category ("Anything Red").
+# Qualifiers such as "Heavy" in "Heavy Jewelry" are kept: they narrow the dislike.
+_MODIFIERS = frozenset({"a", "an", "the", "any", "anything", "all"})
+
+# Words that cancel a match right after them ("no video games included")
+_NEGATIONS = frozenset({"no", "not", "without", "non", "never"})
+
+# Phrases that start with a disliked (stemmed) word but name something else
+_COMPOUNDS = frozenset({("stocking", "stuffer"), ("stocking", "filler"), ("sock", "monkey"), ("tie", "dye")})
+
+# Matches needed in the description alone (without one in the title) to reject an idea
+DESCRIPTION_HITS_TO_REJECT = 2
+
+# Extra phrases that should count as the (stemmed) category on the left
+SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    "sock": ("stocking", "hosiery"),
+    "tie": ("necktie", "bow tie", "cravat"),
+    "jewelry": ("jewellery", "necklace", "bracelet", "earring", "pendant", "brooch"),
+    "perfume": ("fragrance", "cologne", "eau de parfum", "eau de toilette"),
+    "makeup": ("make up", "cosmetic", "lipstick", "mascara", "eyeshadow"),
+    "clothe": ("clothing", "apparel", "shirt", "sweater", "hoodie", "jacket"),
+    "video game": ("videogame", "game console", "playstation", "xbox", "nintendo switch"),
+    "book": ("novel", "paperback", "hardcover", "ebook", "audiobook"),
+    "candy": ("chocolate", "confectionery", "lollipop"),
+    "candle": ("wax melt",),
+    "mug": ("coffee cup", "tumbler"),
+    "gift card": ("gift certificate", "voucher"),
+    "electronic": ("gadget", "device"),
+    "office supply": ("stapler", "desk organizer", "sticky note"),
+    "sport equipment": ("dumbbell", "racket", "yoga block"),
+    "formal wear": ("suit", "tuxedo", "evening gown"),
+}
+
+
+def stem(token: str) -> str:
+    """Very small plural stripper so 'Socks', 'sock' and 'SOCKS' compare equal."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us")):
+        return token[:-1]
+    return token
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercase, tokenize and stem a piece of text."""
+    return [stem(token) for token in _TOKEN.findall(text.lower())]
+
+
+@dataclass(frozen=True)
+class FilterRule:
+    """Why an idea was rejected: the profile entry it matched."""
+
+    kind: str   # "disliked_category" or "past_gift"
+    label: str  # Original profile value, e.g. "Socks"
+
+
+class _Automaton:
+    """Aho-Corasick automaton whose alphabet is normalized tokens."""
+
+    def __init__(self, patterns: Iterable[Tuple[Tuple[str, ...], FilterRule]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[FilterRule, int]]] = [[]]
+
+        for tokens, rule in patterns:
+            state = 0
+            for token in tokens:
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][token] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            if (rule, len(tokens)) not in self._out[state]:
+                self._out[state].append((rule, len(tokens)))
+
+        # Breadth-first construction of failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(token, 0)
+                self._out[next_state].extend(self._out[self._fail[next_state]])
+
+    def matches(self, tokens: Iterable[str]) -> Iterator[Tuple[int, int, FilterRule]]:
+        """Yield (start, end, rule) for every pattern found in the token stream; `end` is exclusive."""
+        state = 0
+        for index, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for rule, length in self._out[state]:
+                yield index + 1 - length, index + 1, rule
+
+
+def _category_patterns(category: str) -> List[Tuple[str, ...]]:
+    tokens = tuple(token for token in normalize_tokens(category) if token not in _MODIFIERS)
+    if not tokens:
+        return []
+    patterns = [tokens]
+    # Synonyms of the head noun keep its qualifiers: "Heavy Jewelry" -> "heavy necklace"
+    for split in range(len(tokens)):
+        synonyms = SYNONYMS.get(" ".join(tokens[split:]))
+        if synonyms:
+            patterns.extend(tokens[:split] + tuple(normalize_tokens(synonym)) for synonym in synonyms)
+            break
+    return patterns
+
+
+@lru_cache(maxsize=4096)
+def _compile(disliked: Tuple[str, ...], past_gifts: Tuple[str, ...]) -> _Automaton:
+    patterns = []
+    for category in disliked:
+        rule = FilterRule("disliked_category", category)
+        patterns.extend((pattern, rule) for pattern in _category_patterns(category))
+    for gift in past_gifts:
+        tokens = tuple(normalize_tokens(gift))
+        if tokens:
+            patterns.append((tokens, FilterRule("past_gift", gift)))
+    return _Automaton(patterns)
+
+
+def compile_profile(profile: RecipientProfile) -> _Automaton:
+    """Compile (and memoize) the matcher for one recipient profile."""
+    return _compile(tuple(profile.disliked_categories), tuple(profile.past_successful_gifts))
+
+
+def _hits(matcher: _Automaton, tokens: Sequence[str]) -> Iterator[FilterRule]:
+    """Rules matched in `tokens`, minus negated mentions and unrelated compounds."""
+    for start, end, rule in matcher.matches(tokens):
+        before = start - 1
+        while before >= 0 and tokens[before] in _MODIFIERS:
+            before -= 1
+        if before >= 0 and tokens[before] in _NEGATIONS:
+            continue
+        if end < len(tokens) and (tokens[end - 1], tokens[end]) in _COMPOUNDS:
+            continue
+        yield rule
+
+
+def match_idea(matcher: _Automaton, idea: GiftIdea) -> Optional[Tuple[FilterRule, str]]:
+    """
+    The rule an idea breaks and where it was found ("title" or "description"), if any.
+
+    Any match in the title counts; the description needs DESCRIPTION_HITS_TO_REJECT
+    matches of the same rule.
+    """
+    rule = next(_hits(matcher, normalize_tokens(idea.gift_title)), None)
+    if rule is not None:
+        return rule, "title"
+    for rule, count in Counter(_hits(matcher, normalize_tokens(idea.description))).items():
+        if count >= DESCRIPTION_HITS_TO_REJECT:
+            return rule, "description"
+    return None
+
+
+@dataclass
+class FilterResult:
+    """Outcome of filtering a batch of gift ideas."""
+
+    accepted: List[GiftIdea] = field(default_factory=list)
+    rejected: List[dict] = field(default_factory=list)
+
+
+def filter_gift_ideas(ideas: Iterable[GiftIdea], profiles: Iterable[RecipientProfile]) -> FilterResult:
+    """
+    Drop gift ideas that match a recipient's dislikes or repeat a past gift.
+
+    Args:
+        ideas: Gift ideas from all researchers.
+        profiles: The user's recipient profiles.
+
+    Returns:
+        FilterResult with the accepted ideas and one report entry per rejected idea.
+    """
+    matchers = {profile.recipient_name.strip().lower(): compile_profile(profile) for profile in profiles}
+    result = FilterResult()
+    for idea in ideas:
+        matcher = matchers.get(idea.recipient.strip().lower())
+        found = match_idea(matcher, idea) if matcher is not None else None
+        if found is None:
+            result.accepted.append(idea)
+        else:
+            rule, where = found
+            result.rejected.append({
+                "recipient": idea.recipient,
+                "gift_title": idea.gift_title,
+                "rule": rule.kind,
+                "matched": rule.label,
+                "field": where,
+            })
+    return result
+
+
+class GiftFilterAgent(BaseAgent):
+    """
+    Workflow stage that filters researcher output before the Aggregator sees it.
+
+    Reads {recipient: researcher output} from `research_key`, drops ideas that
+    match the recipient's dislikes or past gifts, and writes the remaining ideas
+    (JSON) to `output_key` and the rejection report to `rejected_key`.
+    """
+
+    research_key: str = "research_results"
+    output_key: str = "gift_ideas"
+    rejected_key: str = "rejected_gift_ideas"
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        research = ctx.session.state.get(self.research_key) or {}
+        ideas = [
+            idea
+            for recipient, text in research.items()
+            for idea in parse_gift_ideas(text, recipient)
+        ]
+        profiles = get_profile_store().get_profiles(resolve_user_id(ctx.session.state))
+        result = filter_gift_ideas(ideas, profiles)
+        logger.info("Gift filter kept %d of %d ideas", len(result.accepted), len(ideas))
+
+        content = None
+        if result.rejected:
+            lines = [
+                f"- {item['recipient']}: '{item['gift_title']}' removed "
+                f"({'disliked' if item['rule'] == 'disliked_category' else 'already gifted'}: {item['matched']})"
+                for item in result.rejected
+            ]
+            content = Content(role="model", parts=[Part(text="Filtered out:\n" + "\n".join(lines))])
+
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=content,
+            actions=EventActions(state_delta={
+                self.output_key: json.dumps([idea.model_dump() for idea in result.accepted]),
+                self.rejected_key: json.dumps(result.rejected),
+            }),
+        )
@@ -0,0 +1,261 @@
+"""Local load generator for admission control.
+
+Sends an open-loop stream of gift requests (Poisson arrivals, one heavy
+household sending most of them) through the full agent tree with fake
+backends whose capacity is limited: past `--capacity` concurrent model calls
+every call slows down, as a shared quota would. The same arrivals are replayed
+without and with admission control, and the report compares completed-request
+latency (overall, per user class and per time window, to show whether p99
+stays stable while overloaded), shed and apology counts, and the controller's
+queue and wait-time stats.
+
+Usage:
+    python -m agent.loadgen --rate 10 --duration 30 --output loadgen.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+from google.adk.runners import InMemoryRunner
+from google.genai.types import Content, Part
+
+from .admission import AdmissionController, AdmissionPlugin, AdmissionPolicy, parse_user_weights
+from .agent import create_concierge_agent
+from .benchmark import percentiles
+from .fake_llm import FakeGiftModel, FakeSearchBackend, LatencyDistribution
+from .plan_cache import plan_cache
+from .resilience import CircuitBreaker, ResilientLlm, RetryPolicy
+from .sample_data import USER_PROFILES_DB
+from .search_cache import search_cache
+
+
+def build_arrivals(rate: float, duration: float, heavy_share: float, seed: int = 0) -> List[dict]:
+    """
+    Poisson arrivals over `duration` seconds; `heavy_share` of them come from one user.
+
+    Returns:
+        Requests with their arrival offset in seconds, user_id and message
+    """
+    rng = random.Random(seed)
+    users = sorted(USER_PROFILES_DB)
+    heavy_user, light_users = users[0], users[1:] or users[:1]
+    arrivals = []
+    at = rng.expovariate(rate)
+    while at < duration:
+        user_id = heavy_user if rng.random() < heavy_share else rng.choice(light_users)
+        parts = [
+            f"{profile.recipient_name} ${rng.choice([25, 30, 40, 50, 60, 75, 90, 100])}"
+            for profile in USER_PROFILES_DB[user_id]
+        ]
+        arrivals.append({
+            "request_id": f"load-{len(arrivals)}",
+            "at": at,
+            "user_id": user_id,
+            "heavy": user_id == heavy_user,
+            "message": f"Please find gifts for {', '.join(parts)} (user_id: {user_id})",
+        })
+        at += rng.expovariate(rate)
+    return arrivals
+
+
+def _windows(results: List[dict], duration: float, count: int) -> List[dict]:
+    """Completed-request latency percentiles by arrival time window."""
+    width = duration / count
+    completed = [r for r in results if r["outcome"] == "completed"]
+    return [
+        {
+            "from_s": round(i * width, 1),
+            **percentiles([r["latency"] for r in completed if i * width <= r["at"] < (i + 1) * width]),
+        }
+        for i in range(count)
+    ]
+
+
+async def run_load(
+    arrivals: List[dict],
+    admission: Optional[AdmissionPolicy],
+    duration: float,
+    capacity: int,
+    model_latency: str,
+    search_latency: str,
+    seed: int = 0,
+    windows: int = 6,
+) -> dict:
+    """
+    Replay arrivals against fake backends, with admission control if a policy is given.
+
+    Returns:
+        JSON-serializable report for this run
+    """
+    search_cache.clear()
+    plan_cache.clear()
+    controller = AdmissionController(admission) if admission is not None else None
+    fake_model = FakeGiftModel(
+        search_backend=FakeSearchBackend(LatencyDistribution.parse(search_latency), seed=seed),
+        latency_distribution=LatencyDistribution.parse(model_latency),
+        capacity=capacity,
+        seed=seed,
+    )
+    model = ResilientLlm(
+        model=fake_model.model,
+        inner=fake_model,
+        retry_policy=RetryPolicy(base_delay=0.05, max_delay=0.5),
+        circuit_breaker=CircuitBreaker(failure_threshold=50),
+        call_gate=controller.model_calls if controller is not None else None,
+    )
+    runner = InMemoryRunner(
+        agent=create_concierge_agent(model=model),
+        app_name="hgs-loadgen",
+        plugins=[AdmissionPlugin(controller)] if controller is not None else [],
+    )
+    results: List[dict] = []
+
+    async def run_one(request: dict, started_at: float) -> None:
+        await asyncio.sleep(max(0.0, started_at + request["at"] - time.perf_counter()))
+        session = await runner.session_service.create_session(app_name="hgs-loadgen", user_id=request["user_id"])
+        started = time.perf_counter()
+        outcome = "completed"
+        try:
+            async for event in runner.run_async(
+                user_id=request["user_id"],
+                session_id=session.id,
+                new_message=Content(role="user", parts=[Part(text=request["message"])]),
+            ):
+                if event.author == "model":
+                    # Answered by the admission plugin instead of the agents
+                    outcome = "shed"
+                elif event.author == "agent":
+                    # GracefulErrorAgent's apology
+                    outcome = "apology"
+        except Exception as e:
+            outcome = f"error: {type(e).__name__}"
+        results.append({**request, "outcome": outcome, "latency": time.perf_counter() - started})
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(run_one(request, started_at) for request in arrivals))
+    wall_time = time.perf_counter() - started_at
+
+    def latencies(heavy: Optional[bool] = None) -> List[float]:
+        return [
+            r["latency"] for r in results
+            if r["outcome"] == "completed" and (heavy is None or r["heavy"] == heavy)
+        ]
+
+    outcomes: Dict[str, int] = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    return {
+        "outcomes": dict(sorted(outcomes.items())),
+        "completed": percentiles(latencies()),
+        "completed_heavy_user": percentiles(latencies(heavy=True)),
+        "completed_other_users": percentiles(latencies(heavy=False)),
+        "completed_by_window": _windows(results, duration, windows),
+        "shed_response": percentiles([r["latency"] for r in results if r["outcome"] == "shed"]),
+        "goodput_rps": round(outcomes.get("completed", 0) / wall_time, 3) if wall_time else 0.0,
+        "wall_time_s": round(wall_time, 3),
+        "model_calls": fake_model.calls,
+        "admission": controller.stats() if controller is not None else None,
+    }
+
+
+async def run_loadgen(
+    rate: float = 10.0,
+    duration: float = 30.0,
+    heavy_share: float = 0.6,
+    capacity: int = 6,
+    model_latency: str = "lognormal:0.2,0.3",
+    search_latency: str = "lognormal:0.3,0.4",
+    policy: Optional[AdmissionPolicy] = None,
+    seed: int = 0,
+    compare: bool = True,
+) -> dict:
+    """
+    Run the load with admission control, and first without it when `compare` is set.
+
+    Returns:
+        JSON-serializable report with one section per run
+    """
+    policy = policy or AdmissionPolicy()
+    arrivals = build_arrivals(rate, duration, heavy_share, seed)
+    kwargs = dict(
+        duration=duration, capacity=capacity, model_latency=model_latency, search_latency=search_latency, seed=seed
+    )
+    report = {
+        "config": {
+            "rate": rate,
+            "duration": duration,
+            "requests": len(arrivals),
+            "heavy_share": heavy_share,
+            "capacity": capacity,
+            "model_latency": model_latency,
+            "search_latency": search_latency,
+            "seed": seed,
+            "policy": {
+                "max_sessions": policy.max_sessions,
+                "max_model_calls": policy.max_model_calls,
+                "max_queue": policy.max_queue,
+                "max_queue_per_user": policy.max_queue_per_user,
+                "max_wait": policy.max_wait,
+                "user_weights": policy.user_weights,
+            },
+        },
+    }
+    if compare:
+        report["without_admission"] = await run_load(arrivals, None, **kwargs)
+    report["with_admission"] = await run_load(arrivals, policy, **kwargs)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Overload the workflow locally, with and without admission control")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument("--heavy-share", type=float, default=0.6, help="Share of requests from one household")
+    parser.add_argument("--capacity", type=int, default=6, help="Model calls the fake backend serves at full speed")
+    parser.add_argument("--model-latency", default="lognormal:0.2,0.3")
+    parser.add_argument("--search-latency", default="lognormal:0.3,0.4")
+    parser.add_argument("--max-sessions", type=int, default=4)
+    parser.add_argument("--max-model-calls", type=int, default=6)
+    parser.add_argument("--max-queue", type=int, default=24)
+    parser.add_argument("--max-queue-per-user", type=int, default=3)
+    parser.add_argument("--max-wait", type=float, default=5.0)
+    parser.add_argument("--user-weights", default="", help='e.g. "family_smith_123=2"')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--admission-only", action="store_true", help="Skip the run without admission control")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    policy = AdmissionPolicy(
+        max_sessions=args.max_sessions,
+        max_model_calls=args.max_model_calls,
+        max_queue=args.max_queue,
+        max_queue_per_user=args.max_queue_per_user,
+        max_wait=args.max_wait,
+        user_weights=parse_user_weights(args.user_weights),
+        expected_session_seconds=2.0,
+    )
+    report = asyncio.run(run_loadgen(
+        rate=args.rate,
+        duration=args.duration,
+        heavy_share=args.heavy_share,
+        capacity=args.capacity,
+        model_latency=args.model_latency,
+        search_latency=args.search_latency,
+        policy=policy,
+        seed=args.seed,
+        compare=not args.admission_only,
+    ))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Per-stage model tiers and a latency/error-aware model router.
+
+Each workflow stage has an ordered list of model tiers (e.g. the researcher
+prefers the primary model, the concierge and aggregator a lighter one). For
+every call, `ModelRouter` picks the first tier whose recent p95 latency and
+error rate are within the stage's limits and whose circuit is not open, and
+otherwise the healthiest candidate. Observations expire after a time window, so
+a demoted model is tried again once its bad samples age out.
+
+Routing decisions are counted per stage, model and reason (`stats()`) and, when
+telemetry is enabled, exported as the `hgs.router.decisions` counter.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Sequence, Tuple
+
+from google.adk.models import BaseLlm, LlmCapabilities, LlmRequest, LlmResponse
+from pydantic import Field
+
+from .resilience import CircuitBreaker, ResilientLlm, resilient_model
+from .telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RoutingPolicy:
+    """Limits a model must stay within to keep receiving a stage's traffic."""
+
+    p95_threshold: float = 10.0
+    """Seconds; above this the next tier is preferred."""
+
+    max_error_rate: float = 0.25
+    window_seconds: float = 120.0
+    """Only observations from this many recent seconds count."""
+
+    min_samples: int = 5
+    """Fewer recent observations than this are not enough to demote a model."""
+
+
+class ModelRouter:
+    """Tracks recent latency and errors per model and chooses a model per call."""
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[Tuple[float, float, bool]]] = defaultdict(deque)
+        self._decisions: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        """Record one finished call (latency in seconds)."""
+        with self._lock:
+            self._samples[model].append((time.monotonic(), latency, ok))
+
+    def health(self, model: str, window_seconds: float) -> Tuple[int, float, float]:
+        """(sample count, p95 latency, error rate) over the window."""
+        cutoff = time.monotonic() - window_seconds
+        with self._lock:
+            samples = self._samples[model]
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            latencies = sorted(latency for _, latency, _ in samples)
+            errors = sum(1 for _, _, ok in samples if not ok)
+        if not latencies:
+            return 0, 0.0, 0.0
+        p95 = latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+        return len(latencies), p95, errors / len(latencies)
+
+    def choose(self, stage: str, candidates: Sequence[ResilientLlm], policy: RoutingPolicy) -> ResilientLlm:
+        """
+        Pick the model for the next call of a stage.
+
+        Args:
+            stage: Stage name, used for metrics
+            candidates: Models in order of preference
+            policy: Latency and error limits for this stage
+
+        Returns:
+            The chosen candidate
+        """
+        scored = []
+        for rank, candidate in enumerate(candidates):
+            count, p95, error_rate = self.health(candidate.model, policy.window_seconds)
+            circuit_open = candidate.circuit_breaker.state == "open"
+            judged = count >= policy.min_samples
+            healthy = not circuit_open and not (
+                judged and (p95 > policy.p95_threshold or error_rate > policy.max_error_rate)
+            )
+            if healthy:
+                reason = "preferred" if rank == 0 else (
+                    "circuit_open" if any(c.circuit_breaker.state == "open" for c in candidates[:rank])
+                    else "slow_or_failing"
+                )
+                return self._decide(stage, candidate, reason)
+            # Unhealthy: rank by circuit, then error rate, then latency
+            scored.append(((circuit_open, error_rate, p95, rank), candidate))
+        return self._decide(stage, min(scored, key=lambda item: item[0])[1], "least_bad")
+
+    def _decide(self, stage: str, candidate: ResilientLlm, reason: str) -> ResilientLlm:
+        with self._lock:
+            self._decisions[(stage, candidate.model, reason)] += 1
+        if reason != "preferred":
+            logger.info("Routing %s to %s (%s)", stage, candidate.model, reason)
+        telemetry = get_telemetry()
+        if telemetry is not None:
+            telemetry.record_route(stage, candidate.model, reason)
+        return candidate
+
+    def stats(self, window_seconds: float = 120.0) -> dict:
+        """Decision counts and current health per model."""
+        with self._lock:
+            decisions = [
+                {"stage": stage, "model": model, "reason": reason, "count": count}
+                for (stage, model, reason), count in sorted(self._decisions.items())
+            ]
+            models = list(self._samples)
+        health = {}
+        for model in models:
+            count, p95, error_rate = self.health(model, window_seconds)
+            health[model] = {"samples": count, "p95": round(p95, 3), "error_rate": round(error_rate, 3)}
+        return {"decisions": decisions, "models": health}
+
+
+# Process-wide router: every stage shares the health view of each model
+model_router = ModelRouter()
+
+
+class RoutedLlm(BaseLlm):
+    """
+    Model that delegates each call to one of several tiers chosen by the router.
+
+    If the chosen model fails before producing output, the call fails over once
+    to the next candidate; errors after the first chunk are raised as is.
+    """
+
+    stage: str
+    candidates: List[ResilientLlm]
+    policy: RoutingPolicy = Field(default_factory=RoutingPolicy)
+    router: ModelRouter = Field(default_factory=lambda: model_router)
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        # Requests are built once for whichever tier serves them, so only claim
+        # what every candidate supports
+        reports = [candidate.capabilities for candidate in self.candidates]
+        return LlmCapabilities(
+            output_schema_and_tools=all(report.output_schema_and_tools for report in reports)
+        )
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        chosen = self.router.choose(self.stage, self.candidates, self.policy)
+        order = [chosen] + [candidate for candidate in self.candidates if candidate is not chosen]
+
+        for attempt, candidate in enumerate(order[:2]):
+            # The request names the model to call; point it at the chosen tier
+            llm_request.model = candidate.model
+            started = time.monotonic()
+            produced = False
+            try:
+                async for response in candidate.generate_content_async(llm_request, stream=stream):
+                    produced = True
+                    yield response
+            except Exception as e:
+                self.router.record(candidate.model, time.monotonic() - started, ok=False)
+                if produced or attempt == 1 or len(order) == 1:
+                    raise
+                logger.warning("%s failed for %s, failing over: %s", candidate.model, self.stage, e)
+                continue
+            self.router.record(candidate.model, time.monotonic() - started, ok=True)
+            return
+
+
+# Model names per tier; HGS_MODEL_<TIER> overrides them
+MODEL_TIERS = {
+    "primary": os.getenv("HGS_MODEL_PRIMARY", "gemini-2.5-flash-preview-09-2025"),
+    "light": os.getenv("HGS_MODEL_LIGHT", "gemini-2.5-flash-lite"),
+}
+
+# Tier preference and latency limit per stage. Grounded research needs the
+# primary model and is slow by nature; routing and formatting are fine on the
+# light tier. Override tiers with HGS_STAGE_TIERS="researcher=primary,light;aggregator=primary".
+STAGE_TIERS = {
+    "concierge": ["light", "primary"],
+    "collector": ["light", "primary"],
+    "researcher": ["primary", "light"],
+    "aggregator": ["light", "primary"],
+}
+STAGE_POLICIES = {
+    "concierge": RoutingPolicy(p95_threshold=6.0),
+    "collector": RoutingPolicy(p95_threshold=8.0),
+    "researcher": RoutingPolicy(p95_threshold=30.0),
+    "aggregator": RoutingPolicy(p95_threshold=10.0),
+}
+
+
+def _parse_stage_tiers(spec: str) -> Dict[str, List[str]]:
+    """Parse "stage=tier,tier;stage=tier" into {stage: [tier, ...]}."""
+    parsed = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        stage, _, tiers = item.partition("=")
+        parsed[stage.strip()] = [tier.strip() for tier in tiers.split(",") if tier.strip()]
+    return parsed
+
+
+STAGE_TIERS.update(_parse_stage_tiers(os.getenv("HGS_STAGE_TIERS", "")))
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _breaker_for(model_name: str) -> CircuitBreaker:
+    """One circuit breaker per model, so an overloaded tier does not block the others."""
+    return _breakers.setdefault(model_name, CircuitBreaker())
+
+
+def stage_model(stage: str, hedge_after: Optional[float] = None) -> BaseLlm:
+    """
+    Build the model for a workflow stage from its tiers.
+
+    Args:
+        stage: "concierge", "collector", "researcher" or "aggregator"
+        hedge_after: Seconds before a hedged duplicate request (see ResilientLlm)
+
+    Returns:
+        A ResilientLlm when the stage has a single tier, otherwise a RoutedLlm
+    """
+    names = list(dict.fromkeys(MODEL_TIERS.get(tier, tier) for tier in STAGE_TIERS.get(stage, ["primary"])))
+    candidates = [
+        resilient_model(name, hedge_after=hedge_after, circuit_breaker=_breaker_for(name))
+        for name in names
+    ]
+    if len(candidates) == 1:
+        return candidates[0]
+    return RoutedLlm(
+        # Built-in tools such as google_search check this name, so use the preferred model's
+        model=candidates[0].model,
+        stage=stage,
+        candidates=candidates,
+        policy=STAGE_POLICIES.get(stage, RoutingPolicy()),
+    )
@@ -0,0 +1,255 @@
+"""Helpers for extracting structured data from model output."""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from .data_models import GiftIdea
+from .fx_rates import CURRENCY_SYMBOLS, CURRENCY_WORDS, ISO_CURRENCY_CODES
+
+_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+# Built once: validating a whole list in one call is much cheaper than
+# GiftIdea.model_validate per item
+GIFT_IDEAS_ADAPTER = TypeAdapter(List[GiftIdea])
+
+# Field names models use instead of the GiftIdea ones
+_FIELD_ALIASES = {
+    "title": "gift_title",
+    "name": "gift_title",
+    "gift": "gift_title",
+    "price": "estimated_price",
+    "link": "product_link",
+    "url": "product_link",
+}
+_PRICE_NUMBER = re.compile(
+    # "1.299,00": dot thousands with a decimal comma; tried first so it is not read as 1.29 and 9
+    r"(?P<dotted>\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?)(?![\d,])"
+    r"|\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d{1,2})?"
+)
+_CURRENCY_CODE = re.compile(r"\b[A-Za-z]{3}\b")
+
+
+def extract_json_payload(text: str) -> Optional[Any]:
+    """
+    Extract the first JSON value from a model response.
+
+    Models often wrap JSON in Markdown code fences or add a sentence before it,
+    so this tries the fenced block first and then the outermost array/object.
+
+    Args:
+        text: Raw text produced by an agent.
+
+    Returns:
+        The decoded JSON value, or None if nothing could be parsed.
+    """
+    if not text:
+        return None
+
+    candidates = [match.strip() for match in _FENCE_PATTERN.findall(text)]
+    candidates.append(text.strip())
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        for opener, closer in (("[", "]"), ("{", "}")):
+            start, end = candidate.find(opener), candidate.rfind(closer)
+            if start != -1 and end > start:
+                try:
+                    return json.loads(candidate[start:end + 1])
+                except ValueError:
+                    continue
+    return None
+
+
+def _parse_amounts(text: str) -> List[float]:
+    """Every number in a price or budget text, with thousands separators and decimal commas resolved."""
+    amounts = []
+    for match in _PRICE_NUMBER.finditer(text):
+        number = match.group()
+        if match.group("dotted"):
+            number = number.replace(".", "").replace(",", ".")
+        elif re.fullmatch(r"\d+,\d{1,2}", number):
+            # "39,99" is a decimal comma; "1,299" a thousands separator
+            number = number.replace(",", ".")
+        amounts.append(float(number.replace(",", "")))
+    return amounts
+
+
+def parse_budget(value) -> Optional[float]:
+    """
+    A brief's max_budget as a number, or None.
+
+    >>> [parse_budget(text) for text in ("$48", "48.5", "$1,000", "1.500 €")]
+    [48.0, 48.5, 1000.0, 1500.0]
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    amounts = _parse_amounts(str(value or ""))
+    return amounts[0] if amounts else None
+
+
+def parse_recipient_briefs(text: str) -> List[dict]:
+    """
+    Parse the Collector's output into a list of recipient briefs.
+
+    Args:
+        text: The Collector Agent's final response.
+
+    Returns:
+        List of brief dicts (recipient_name, max_budget, search_query, ...).
+        Entries without a recipient_name are dropped.
+    """
+    payload = extract_json_payload(text)
+    if isinstance(payload, dict):
+        # Accept {"briefs": [...]} as well as a bare array
+        payload = next((value for value in payload.values() if isinstance(value, list)), [payload])
+    if not isinstance(payload, list):
+        return []
+    return [
+        brief for brief in payload
+        if isinstance(brief, dict) and brief.get("recipient_name")
+    ]
+
+
+def parse_currency(value) -> Optional[str]:
+    """ISO code for "usd", "$", "euros" and the like, or None if unrecognised."""
+    text = str(value or "").strip()
+    if text.upper() in ISO_CURRENCY_CODES:
+        return text.upper()
+    return CURRENCY_SYMBOLS.get(text) or CURRENCY_WORDS.get(text.lower())
+
+
+def parse_price(value) -> Tuple[Optional[float], Optional[str]]:
+    """
+    A price as (amount, currency found next to it).
+
+    Accepts numbers and strings such as "$39.99", "1,299 USD", "39,99 €",
+    "1.299,00 €" or "30-40" (ranges count at their upper end so budget checks
+    stay conservative).
+
+    >>> parse_price("1.299,00 €")
+    (1299.0, 'EUR')
+    >>> parse_price("1.299 €")
+    (1299.0, 'EUR')
+    >>> parse_price("1,299.50 USD")
+    (1299.5, 'USD')
+    >>> parse_price("39,99 €")
+    (39.99, 'EUR')
+    >>> parse_price("$39.99")
+    (39.99, 'USD')
+    """
+    if isinstance(value, bool):
+        return None, None
+    if isinstance(value, (int, float)):
+        return float(value), None
+    text = str(value or "")
+    amounts = _parse_amounts(text)
+    # CURRENCY_SYMBOLS lists longer symbols first, so "C$" wins over "$"
+    currency = next((code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in text), None)
+    if currency is None:
+        currency = next(filter(None, map(parse_currency, _CURRENCY_CODE.findall(text))), None)
+    return (max(amounts) if amounts else None), currency
+
+
+def _repair_gift_idea(item: dict, recipient: Optional[str], default_currency: str) -> dict:
+    """Map aliased fields and coerce price and currency before validation."""
+    repaired = {_FIELD_ALIASES.get(key, key): value for key, value in item.items() if key not in _FIELD_ALIASES}
+    for alias, name in _FIELD_ALIASES.items():
+        if alias in item and name not in repaired:
+            repaired[name] = item[alias]
+    if recipient and not repaired.get("recipient"):
+        repaired["recipient"] = recipient
+
+    price, price_currency = parse_price(repaired.get("estimated_price"))
+    repaired["estimated_price"] = price
+    repaired["currency"] = price_currency or parse_currency(repaired.get("currency")) or default_currency
+    repaired.setdefault("description", "")
+    repaired.setdefault("product_link", "")
+    return repaired
+
+
+@dataclass
+class GiftValidation:
+    """Outcome of validating a batch of raw gift ideas."""
+
+    accepted: List[GiftIdea] = field(default_factory=list)
+    rejected: List[dict] = field(default_factory=list)
+    """{"index": position in the input, "error": reason} per dropped item."""
+
+
+def validate_gift_ideas(
+    items: Iterable[Any], recipient: Optional[str] = None, default_currency: str = "USD"
+) -> GiftValidation:
+    """
+    Validate raw gift ideas in one batch, repairing what can be repaired.
+
+    Prices such as "$39.99" and currencies such as "usd" or "€" are coerced,
+    common field aliases are mapped, and a missing recipient is filled in. The
+    batch goes through the pre-built TypeAdapter in one call; items that still
+    fail (or have no positive price) are rejected rather than re-asked from the
+    model.
+
+    Args:
+        items: Parsed JSON items from a researcher.
+        recipient: Recipient to assume for ideas that omit the field.
+        default_currency: Currency for ideas that do not name one.
+
+    Returns:
+        GiftValidation with the accepted ideas and the rejected items' reasons.
+    """
+    result = GiftValidation()
+    candidates: List[Tuple[int, dict]] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            result.rejected.append({"index": index, "error": "not an object"})
+            continue
+        repaired = _repair_gift_idea(item, recipient, default_currency)
+        if not repaired["estimated_price"] or repaired["estimated_price"] <= 0:
+            result.rejected.append({"index": index, "error": "no usable price"})
+            continue
+        candidates.append((index, repaired))
+
+    try:
+        result.accepted = GIFT_IDEAS_ADAPTER.validate_python([item for _, item in candidates])
+    except ValidationError as e:
+        failed = {}
+        for error in e.errors():
+            failed.setdefault(error["loc"][0], f"{'.'.join(map(str, error['loc'][1:]))}: {error['msg']}")
+        for position, message in sorted(failed.items()):
+            result.rejected.append({"index": candidates[position][0], "error": message})
+        # Every remaining item passed on its own, so this second call cannot fail
+        result.accepted = GIFT_IDEAS_ADAPTER.validate_python(
+            [item for position, (_, item) in enumerate(candidates) if position not in failed]
+        )
+    result.rejected.sort(key=lambda rejected: rejected["index"])
+    return result
+
+
+def dump_gift_ideas(ideas: List[GiftIdea]) -> str:
+    """Compact JSON for a list of validated gift ideas."""
+    return GIFT_IDEAS_ADAPTER.dump_json(ideas).decode()
+
+
+def parse_gift_ideas(text: str, recipient: Optional[str] = None) -> List[GiftIdea]:
+    """
+    Parse a researcher's output into GiftIdea objects.
+
+    Args:
+        text: The researcher's final response.
+        recipient: Recipient to assume for ideas that omit the field.
+
+    Returns:
+        The valid (possibly repaired) gift ideas; unusable entries are skipped.
+    """
+    payload = extract_json_payload(text)
+    if isinstance(payload, dict):
+        payload = next((value for value in payload.values() if isinstance(value, list)), [payload])
+    if not isinstance(payload, list):
+        return []
+    return validate_gift_ideas(payload, recipient).accepted
@@ -0,0 +1,169 @@
+"""Whole-plan cache for repeated gift requests.
+
+Households often repeat the same request ("Dad, $50") within minutes. Plans
+are keyed by the user's profile fingerprint and the recipient briefs they were
+researched from (names, budgets, currencies and search queries), never by the
+raw message text: a follow-up such as "$50 each" or "yes, go ahead" only means
+something in its conversation. After each run the GiftPlanningWorkflow's
+after_agent callback stores the plan under the Collector's briefs. Its
+before_agent callback can only look a plan up when the message alone
+determines the briefs, i.e. when the Collector fast path parses it completely,
+and on a hit answers with the last plan without running the collector,
+researchers or aggregator. Entries expire after a TTL, are evicted LRU, and are
+dropped when the user's profiles change in the profile store. Saying "refresh"
+(or "new ideas") bypasses the cache and replaces the entry.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.genai.types import Content, Part
+
+from .custom_tools import resolve_user_id
+from .data_models import RecipientProfile
+from .fast_collector import parse_structured_request, unparsed_words
+from .parsing import parse_budget, parse_currency, parse_recipient_briefs
+from .profile_store import ProfileStore, get_profile_store
+from .search_cache import SearchCache
+
+logger = logging.getLogger(__name__)
+
+# Final plan text written by the Aggregator (or the streaming research stage)
+PLAN_STATE_KEY = "gift_plan"
+# "<user_id>|<profile fingerprint>" of the run in progress, so after_agent stores
+# under the profiles the run started with
+PLAN_CACHE_KEY_STATE = "plan_cache_key"
+BRIEFS_STATE_KEY = "recipient_briefs"
+
+REFRESH_PATTERN = re.compile(r"\b(?:refresh(?:ed)?|new ideas|start over|no cache)\b", re.IGNORECASE)
+_USER_ID = re.compile(r"\(?\buser_id:\s*[\w-]+\)?", re.IGNORECASE)
+
+
+def profile_fingerprint(profiles: List[RecipientProfile]) -> str:
+    """Stable hash of the profile contents (order-insensitive)."""
+    payload = json.dumps(
+        sorted((profile.model_dump() for profile in profiles), key=lambda p: p["recipient_name"]),
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def canonical_briefs(briefs: List[dict]) -> str:
+    """The briefs reduced to what determines the plan, so equivalent briefs share an entry."""
+    return json.dumps(sorted(
+        (
+            str(brief.get("recipient_name") or "").strip(),
+            parse_budget(brief.get("max_budget")),
+            parse_currency(brief.get("currency")) or "USD",
+            " ".join(str(brief.get("search_query") or "").lower().split()),
+        )
+        for brief in briefs
+    ), ensure_ascii=False)
+
+
+def request_briefs(text: str, profiles: List[RecipientProfile]) -> Optional[List[dict]]:
+    """
+    The briefs the Collector fast path builds from this message alone, or None.
+
+    None when the message says anything besides names and budgets, since its
+    briefs then depend on the model and on the rest of the conversation.
+    """
+    text = REFRESH_PATTERN.sub(" ", _USER_ID.sub(" ", text or ""))
+    briefs = parse_structured_request(text, profiles)
+    if briefs is None or unparsed_words(text, profiles):
+        return None
+    return briefs
+
+
+def profile_key(user_id: str, profiles: List[RecipientProfile]) -> str:
+    """Key prefix; starts with the user id so a profile change can drop that user's entries."""
+    return f"{user_id}|{profile_fingerprint(profiles)}"
+
+
+def plan_key(prefix: str, briefs: List[dict]) -> str:
+    """Cache key of the plan researched from `briefs` under the profiles in `prefix`."""
+    digest = hashlib.sha256(canonical_briefs(briefs).encode()).hexdigest()[:24]
+    return f"{prefix}|{digest}"
+
+
+# Process-wide plan cache; PLAN_CACHE_TTL_SECONDS=0 disables it
+plan_cache = SearchCache(
+    max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(os.getenv("PLAN_CACHE_TTL_SECONDS", str(15 * 60))),
+)
+
+_watched_stores: "set[tuple]" = set()
+
+
+def _watch_profile_store(store: ProfileStore, cache: SearchCache) -> None:
+    """Drop a user's cached plans whenever their profiles change (once per store)."""
+    marker = (id(store), id(cache))
+    if marker in _watched_stores:
+        return
+    _watched_stores.add(marker)
+
+    def on_profiles_changed(user_id: str) -> None:
+        dropped = cache.invalidate_prefix(f"{user_id}|")
+        if dropped:
+            logger.info("Profiles for %s changed; dropped %d cached plans", user_id, dropped)
+
+    store.add_listener(on_profiles_changed)
+
+
+def plan_cache_callbacks(cache: SearchCache = plan_cache) -> dict:
+    """
+    Build before/after agent callbacks that serve the workflow from the plan cache.
+
+    Args:
+        cache: Cache instance to use (defaults to the shared process-wide cache)
+
+    Returns:
+        Keyword arguments to pass to the workflow agent's constructor
+    """
+
+    def before_agent(callback_context: CallbackContext) -> Optional[Content]:
+        content = callback_context.user_content
+        text = "".join(part.text or "" for part in (content.parts if content else None) or [])
+        store = get_profile_store()
+        _watch_profile_store(store, cache)
+        user_id = resolve_user_id(callback_context.state)
+        profiles = store.get_profiles(user_id)
+        prefix = profile_key(user_id, profiles)
+
+        briefs = request_briefs(text, profiles)
+        if briefs is not None and not REFRESH_PATTERN.search(text):
+            cached = cache.get(plan_key(prefix, briefs))
+            if cached is not None:
+                entry = json.loads(cached)
+                minutes = max(1, round((time.time() - entry["stored_at"]) / 60))
+                logger.info("Plan cache hit for %s", user_id)
+                return Content(role="model", parts=[Part(text=(
+                    f"{entry['plan']}\n\n_This is the plan from {minutes} min ago. "
+                    "Ask me to refresh for new search results._"
+                ))])
+
+        # Remember the profiles and clear any previous briefs and plan so after_agent
+        # stores this run's result only
+        callback_context.state[PLAN_CACHE_KEY_STATE] = prefix
+        callback_context.state[BRIEFS_STATE_KEY] = ""
+        callback_context.state[PLAN_STATE_KEY] = ""
+        return None
+
+    def after_agent(callback_context: CallbackContext) -> Optional[Content]:
+        prefix = callback_context.state.get(PLAN_CACHE_KEY_STATE)
+        plan = callback_context.state.get(PLAN_STATE_KEY)
+        briefs = parse_recipient_briefs(str(callback_context.state.get(BRIEFS_STATE_KEY) or ""))
+        if prefix and plan and briefs:
+            # Keyed by what the Collector made of the whole conversation
+            entry = {"plan": plan, "stored_at": time.time()}
+            cache.put(plan_key(prefix, briefs), json.dumps(entry, ensure_ascii=False))
+        return None
+
+    return {"before_agent_callback": before_agent, "after_agent_callback": after_agent}
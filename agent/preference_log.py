@@ -0,0 +1,316 @@
+"""Write-behind persistence for preferences learned during conversations.
+
+When a user says "Dad hated the socks" or "Mom loved the kindle", the agents
+call the record_learned_preferences tool. The tool only merges the update into
+an in-process queue (coalesced per user and recipient) and returns; a
+background thread flushes the queue in batches: each coalesced update is
+appended to a JSONL log and fsynced, then merged into the profile store, which
+also drops the user's cached plans. On startup the log is replayed into the
+store (merges are idempotent and keep the order of likes and dislikes), so
+learned preferences survive restarts even with the in-memory demo store. The
+log is compacted to one line per recipient once it has grown well past that.
+
+Nothing acknowledged is lost on graceful shutdown: close() (registered with
+atexit) flushes whatever is still queued.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .data_models import RecipientProfile
+from .profile_store import ProfileStore, get_profile_store
+
+logger = logging.getLogger(__name__)
+
+PreferenceKey = Tuple[str, str]
+"""(user_id, casefolded recipient_name)"""
+
+
+def preference_key(user_id: str, recipient_name: str) -> PreferenceKey:
+    """Key under which updates are coalesced: "Dad" and "dad " are the same recipient."""
+    return user_id, recipient_name.strip().casefold()
+
+
+def _merge_unique(existing: List[str], additions: Iterable[str]) -> List[str]:
+    """Append additions not already present (case-insensitively), keeping order."""
+    seen = {item.strip().lower() for item in existing}
+    merged = list(existing)
+    for item in additions:
+        item = item.strip()
+        if item and item.lower() not in seen:
+            seen.add(item.lower())
+            merged.append(item)
+    return merged
+
+
+def _without(items: List[str], removals: Iterable[str]) -> List[str]:
+    """Items not in removals (case-insensitively), keeping order."""
+    removed = {item.strip().lower() for item in removals}
+    return [item for item in items if item.strip().lower() not in removed]
+
+
+@dataclass
+class PreferenceUpdate:
+    """
+    Learned preferences for one recipient, coalesced across calls.
+
+    An item is never both an interest and a dislike: the most recent of the two
+    wins (within a single call, the dislike).
+    """
+
+    recipient_name: str = ""
+    """Name as first written, used for recipients without a profile yet."""
+
+    interests: List[str] = field(default_factory=list)
+    dislikes: List[str] = field(default_factory=list)
+    successful_gifts: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.interests = _without(self.interests, self.dislikes)
+
+    def merge(self, other: "PreferenceUpdate") -> None:
+        """Fold in a later update; its likes and dislikes replace the opposite entries here."""
+        self.recipient_name = self.recipient_name or other.recipient_name
+        self.interests = _merge_unique(_without(self.interests, other.dislikes), other.interests)
+        self.dislikes = _merge_unique(_without(self.dislikes, other.interests), other.dislikes)
+        self.successful_gifts = _merge_unique(self.successful_gifts, other.successful_gifts)
+
+    def apply(self, profile: RecipientProfile) -> RecipientProfile:
+        """The profile with this update merged in; a new like or dislike replaces the opposite entry."""
+        return profile.model_copy(update={
+            "persistent_interests": _merge_unique(_without(profile.persistent_interests, self.dislikes), self.interests),
+            "disliked_categories": _merge_unique(_without(profile.disliked_categories, self.interests), self.dislikes),
+            "past_successful_gifts": _merge_unique(profile.past_successful_gifts, self.successful_gifts),
+        })
+
+
+class PreferenceWriter:
+    """
+    Coalescing write-behind queue in front of the profile store and its JSONL log.
+
+    Args:
+        log_path: Append-only JSONL log (None keeps updates in memory and the store only)
+        store: Profile store receiving the merged updates (defaults to the process-wide one)
+        flush_interval: Seconds between background flushes
+        max_pending: Queued recipients that trigger an early flush
+        compact_ratio: Compact once the log has this many lines per distinct recipient
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str],
+        store: Optional[ProfileStore] = None,
+        flush_interval: float = 2.0,
+        max_pending: int = 256,
+        compact_ratio: int = 4,
+    ):
+        self.log_path = log_path
+        self._store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.compact_ratio = compact_ratio
+
+        self._pending: Dict[PreferenceKey, PreferenceUpdate] = {}
+        self._pending_lock = threading.Lock()
+        # Serializes flushes (background thread, close(), explicit flush())
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._stats = {"acknowledged": 0, "persisted": 0, "flushes": 0, "compactions": 0}
+        # Merged state of everything in the log, used to rewrite it when compacting
+        self._logged: Dict[PreferenceKey, PreferenceUpdate] = {}
+        self._log_lines = 0
+
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name="preference-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def store(self) -> ProfileStore:
+        return self._store if self._store is not None else get_profile_store()
+
+    def record(
+        self,
+        user_id: str,
+        recipient_name: str,
+        interests: Iterable[str] = (),
+        dislikes: Iterable[str] = (),
+        successful_gifts: Iterable[str] = (),
+    ) -> int:
+        """
+        Queue learned preferences for a recipient; never touches disk.
+
+        Returns:
+            Number of recipients waiting to be flushed
+        """
+        update = PreferenceUpdate(
+            recipient_name=recipient_name.strip(),
+            interests=_merge_unique([], interests),
+            dislikes=_merge_unique([], dislikes),
+            successful_gifts=_merge_unique([], successful_gifts),
+        )
+        key = preference_key(user_id, recipient_name)
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("PreferenceWriter is closed")
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = update
+            else:
+                pending.merge(update)
+            self._stats["acknowledged"] += 1
+            queued = len(self._pending)
+        if queued >= self.max_pending:
+            self._wake.set()
+        return queued
+
+    def flush(self) -> int:
+        """Persist everything queued so far; return the number of recipients written."""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self._append(batch)
+                self._apply(batch)
+            except Exception:
+                # Put the batch back (merged with anything queued meanwhile) for the next flush
+                with self._pending_lock:
+                    for key, update in self._pending.items():
+                        batch.setdefault(key, PreferenceUpdate()).merge(update)
+                    self._pending = batch
+                raise
+            self._stats["persisted"] += len(batch)
+            self._stats["flushes"] += 1
+            if self.log_path and self._log_lines >= self.compact_ratio * max(1, len(self._logged)) + 64:
+                self._compact()
+            return len(batch)
+
+    def close(self) -> None:
+        """Stop accepting updates, flush the queue and stop the background thread."""
+        with self._pending_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            return {**self._stats, "pending": len(self._pending), "log_lines": self._log_lines}
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Flushing learned preferences failed: %s: %s", type(e).__name__, e)
+                time.sleep(self.flush_interval)
+
+    def _append(self, batch: Dict[PreferenceKey, PreferenceUpdate]) -> None:
+        for key, update in batch.items():
+            self._logged.setdefault(key, PreferenceUpdate()).merge(update)
+        if not self.log_path:
+            return
+        lines = "".join(_log_line(key, update) for key, update in batch.items())
+        with open(self.log_path, "a", encoding="utf-8") as log:
+            log.write(lines)
+            log.flush()
+            os.fsync(log.fileno())
+        self._log_lines += len(batch)
+
+    def _apply(self, batch: Dict[PreferenceKey, PreferenceUpdate]) -> None:
+        store = self.store
+        profiles: Dict[PreferenceKey, RecipientProfile] = {}
+        loaded_users = set()
+        for (user_id, name_key), update in batch.items():
+            if user_id not in loaded_users:
+                loaded_users.add(user_id)
+                for profile in store.get_profiles(user_id):
+                    profiles[preference_key(user_id, profile.recipient_name)] = profile
+            key = (user_id, name_key)
+            profile = profiles.get(key) or RecipientProfile(recipient_name=update.recipient_name or name_key)
+            # Stored back so a later update for the same recipient builds on this one
+            profiles[key] = update.apply(profile)
+        # One write per batch; listeners (e.g. the plan cache) see each user once
+        store.bulk_load([(user_id, profiles[(user_id, name_key)]) for user_id, name_key in batch])
+
+    def _replay(self) -> None:
+        if not self.log_path or not os.path.exists(self.log_path):
+            return
+        batch: Dict[PreferenceKey, PreferenceUpdate] = {}
+        with open(self.log_path, encoding="utf-8") as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; it was never acknowledged as persisted
+                    continue
+                self._log_lines += 1
+                key = preference_key(record["user_id"], record["recipient_name"])
+                batch.setdefault(key, PreferenceUpdate()).merge(PreferenceUpdate(
+                    recipient_name=record["recipient_name"],
+                    interests=record.get("interests", []),
+                    dislikes=record.get("dislikes", []),
+                    successful_gifts=record.get("successful_gifts", []),
+                ))
+        if batch:
+            for key, update in batch.items():
+                self._logged.setdefault(key, PreferenceUpdate()).merge(update)
+            self._apply(batch)
+            logger.info("Replayed learned preferences for %d recipients from %s", len(batch), self.log_path)
+
+    def _compact(self) -> None:
+        """Rewrite the log with one line per recipient (atomic replace)."""
+        temp_path = f"{self.log_path}.compact"
+        with open(temp_path, "w", encoding="utf-8") as log:
+            log.write("".join(_log_line(key, update) for key, update in self._logged.items()))
+            log.flush()
+            os.fsync(log.fileno())
+        os.replace(temp_path, self.log_path)
+        logger.info("Compacted %s from %d to %d lines", self.log_path, self._log_lines, len(self._logged))
+        self._log_lines = len(self._logged)
+        self._stats["compactions"] += 1
+
+
+def _log_line(key: PreferenceKey, update: PreferenceUpdate) -> str:
+    user_id, name_key = key
+    return json.dumps({
+        "user_id": user_id,
+        "recipient_name": update.recipient_name or name_key,
+        "interests": update.interests,
+        "dislikes": update.dislikes,
+        "successful_gifts": update.successful_gifts,
+    }, ensure_ascii=False) + "\n"
+
+
+_preference_writer: Optional[PreferenceWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_preference_writer() -> PreferenceWriter:
+    """
+    Return the process-wide preference writer, replaying its log on first use.
+
+    The log lives at PREFERENCE_LOG_PATH (default learned_preferences.jsonl; set
+    it to an empty string to keep learned preferences in memory only).
+    """
+    global _preference_writer
+    with _writer_lock:
+        if _preference_writer is None:
+            _preference_writer = PreferenceWriter(
+                log_path=os.getenv("PREFERENCE_LOG_PATH", "learned_preferences.jsonl") or None,
+                flush_interval=float(os.getenv("PREFERENCE_FLUSH_SECONDS", "2")),
+            )
+            atexit.register(_preference_writer.close)
+    return _preference_writer
@@ -0,0 +1,288 @@
+"""Recipient profile storage backends.
+
+`ProfileStore` is the interface the tools use to read and write recipient
+profiles. `DictProfileStore` wraps the in-memory demo data in sample_data.py and
+`SQLiteProfileStore` keeps profiles in a local, indexed SQLite database that
+scales to hundreds of thousands of households. Both keep a bounded LRU of
+pre-serialized per-user payloads, so the hot path of get_recipient_profiles is a
+dict lookup returning an existing string.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .data_models import RecipientProfile
+from .sample_data import USER_PROFILES_DB
+
+
+def serialize_profiles(user_id: str, profiles: List[RecipientProfile]) -> str:
+    """Serialize a user's profiles into the get_recipient_profiles payload."""
+    return json.dumps({
+        "user_id": user_id,
+        "total_recipients": len(profiles),
+        "profiles": [profile.model_dump() for profile in profiles]
+    })
+
+
+class _PayloadCache:
+    """Bounded LRU of serialized per-user payloads."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[str]:
+        payload = self._entries.get(user_id)
+        if payload is not None:
+            self._entries.move_to_end(user_id)
+        return payload
+
+    def put(self, user_id: str, payload: str) -> None:
+        self._entries[user_id] = payload
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+
+
+class ProfileStore(ABC):
+    """Interface for reading and writing recipient profiles per user."""
+
+    def __init__(self, cache_size: int = 1024):
+        self._payloads = _PayloadCache(cache_size)
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[str], None]] = []
+
+    @abstractmethod
+    def get_profiles(self, user_id: str) -> List[RecipientProfile]:
+        """Return all recipient profiles for a user (empty list if unknown)."""
+
+    @abstractmethod
+    def user_ids(self, limit: Optional[int] = None) -> List[str]:
+        """Return known user IDs, optionally capped at `limit`."""
+
+    @abstractmethod
+    def _write_profiles(self, rows: Iterable[Tuple[str, RecipientProfile]]) -> List[str]:
+        """Insert or replace (user_id, profile) rows; return the affected user IDs."""
+
+    def get_profiles_json(self, user_id: str) -> Optional[str]:
+        """
+        Return the serialized profile payload for a user, or None if unknown.
+
+        Payloads are cached until the user's profiles are written again.
+        """
+        with self._lock:
+            payload = self._payloads.get(user_id)
+            if payload is not None:
+                return payload
+            profiles = self.get_profiles(user_id)
+            if not profiles:
+                return None
+            payload = serialize_profiles(user_id, profiles)
+            self._payloads.put(user_id, payload)
+            return payload
+
+    def upsert_profile(self, user_id: str, profile: RecipientProfile) -> None:
+        """Insert or replace a single recipient profile."""
+        self.bulk_load([(user_id, profile)])
+
+    def bulk_load(self, rows: Iterable[Tuple[str, RecipientProfile]]) -> int:
+        """Insert or replace many (user_id, profile) rows; return the number of users touched."""
+        with self._lock:
+            changed = self._write_profiles(rows)
+            for user_id in changed:
+                self._payloads.invalidate(user_id)
+        for user_id in changed:
+            for listener in self._listeners:
+                listener(user_id)
+        return len(changed)
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback invoked with the user_id whenever a user's profiles change."""
+        self._listeners.append(listener)
+
+    def import_jsonl(self, path: str, batch_size: int = 1000) -> int:
+        """
+        Bulk import profiles from a JSONL file.
+
+        Each line is either one profile ({"user_id": ..., "recipient_name": ..., ...})
+        or one household ({"user_id": ..., "profiles": [...]}).
+
+        Returns:
+            Number of profiles imported.
+        """
+        count = 0
+        batch: List[Tuple[str, RecipientProfile]] = []
+        for user_id, profile in _read_jsonl(path):
+            batch.append((user_id, profile))
+            if len(batch) >= batch_size:
+                self.bulk_load(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.bulk_load(batch)
+            count += len(batch)
+        return count
+
+    def export_jsonl(self, path: str) -> int:
+        """Write all households to a JSONL file (one household per line); return the user count."""
+        user_ids = self.user_ids()
+        with open(path, "w", encoding="utf-8") as f:
+            for user_id in user_ids:
+                profiles = [profile.model_dump() for profile in self.get_profiles(user_id)]
+                f.write(json.dumps({"user_id": user_id, "profiles": profiles}) + "\n")
+        return len(user_ids)
+
+
+def _read_jsonl(path: str) -> Iterator[Tuple[str, RecipientProfile]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            user_id = record.pop("user_id")
+            if "profiles" in record:
+                for profile in record["profiles"]:
+                    yield user_id, RecipientProfile.model_validate(profile)
+            else:
+                yield user_id, RecipientProfile.model_validate(record)
+
+
+class DictProfileStore(ProfileStore):
+    """Profile store backed by an in-memory dict (the demo USER_PROFILES_DB)."""
+
+    def __init__(self, profiles_db: Dict[str, List[RecipientProfile]], cache_size: int = 1024):
+        super().__init__(cache_size)
+        self._db = profiles_db
+
+    def get_profiles(self, user_id: str) -> List[RecipientProfile]:
+        return list(self._db.get(user_id, []))
+
+    def user_ids(self, limit: Optional[int] = None) -> List[str]:
+        return list(self._db)[:limit]
+
+    def _write_profiles(self, rows: Iterable[Tuple[str, RecipientProfile]]) -> List[str]:
+        changed = []
+        for user_id, profile in rows:
+            profiles = self._db.setdefault(user_id, [])
+            for i, existing in enumerate(profiles):
+                if existing.recipient_name == profile.recipient_name:
+                    profiles[i] = profile
+                    break
+            else:
+                profiles.append(profile)
+            if user_id not in changed:
+                changed.append(user_id)
+        return changed
+
+
+class SQLiteProfileStore(ProfileStore):
+    """Profile store backed by a local SQLite database indexed by user_id and recipient_name."""
+
+    def __init__(self, db_path: str, cache_size: int = 1024):
+        super().__init__(cache_size)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS recipient_profiles ("
+            "  user_id TEXT NOT NULL,"
+            "  recipient_name TEXT NOT NULL,"
+            "  profile TEXT NOT NULL,"
+            "  PRIMARY KEY (user_id, recipient_name)"
+            ");"
+            # The primary key already serves lookups by user_id; drop the index older databases have
+            "DROP INDEX IF EXISTS idx_profiles_user_id;"
+            "CREATE INDEX IF NOT EXISTS idx_profiles_recipient_name ON recipient_profiles (recipient_name);"
+        )
+
+    def get_profiles(self, user_id: str) -> List[RecipientProfile]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT profile FROM recipient_profiles WHERE user_id = ? ORDER BY rowid",
+                (user_id,),
+            ).fetchall()
+        return [RecipientProfile.model_validate_json(row[0]) for row in rows]
+
+    def find_by_recipient(self, recipient_name: str) -> List[Tuple[str, RecipientProfile]]:
+        """Return (user_id, profile) pairs for every household with this recipient name."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, profile FROM recipient_profiles WHERE recipient_name = ?",
+                (recipient_name,),
+            ).fetchall()
+        return [(user_id, RecipientProfile.model_validate_json(data)) for user_id, data in rows]
+
+    def user_ids(self, limit: Optional[int] = None) -> List[str]:
+        query = "SELECT DISTINCT user_id FROM recipient_profiles ORDER BY user_id"
+        with self._lock:
+            if limit is not None:
+                return [row[0] for row in self._conn.execute(query + " LIMIT ?", (limit,))]
+            return [row[0] for row in self._conn.execute(query)]
+
+    def _write_profiles(self, rows: Iterable[Tuple[str, RecipientProfile]]) -> List[str]:
+        records = [
+            (user_id, profile.recipient_name, profile.model_dump_json())
+            for user_id, profile in rows
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO recipient_profiles (user_id, recipient_name, profile) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, recipient_name) DO UPDATE SET profile = excluded.profile",
+                records,
+            )
+        return list(dict.fromkeys(user_id for user_id, _, _ in records))
+
+
+_profile_store: Optional[ProfileStore] = None
+
+
+def get_profile_store() -> ProfileStore:
+    """
+    Return the process-wide profile store.
+
+    Uses SQLite when PROFILE_DB_PATH is set, otherwise the demo USER_PROFILES_DB.
+    """
+    global _profile_store
+    if _profile_store is None:
+        db_path = os.getenv("PROFILE_DB_PATH")
+        _profile_store = SQLiteProfileStore(db_path) if db_path else DictProfileStore(USER_PROFILES_DB)
+    return _profile_store
+
+
+def set_profile_store(store: ProfileStore) -> None:
+    """Replace the process-wide profile store (e.g. for tests or custom backends)."""
+    global _profile_store
+    _profile_store = store
+
+
+def main() -> None:
+    """Import or export profiles: python -m agent.profile_store {import,export,seed} ..."""
+    parser = argparse.ArgumentParser(description="Manage the SQLite recipient profile store")
+    parser.add_argument("--db", default=os.getenv("PROFILE_DB_PATH", "profiles.db"))
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("import").add_argument("path", help="JSONL file to import")
+    subcommands.add_parser("export").add_argument("path", help="JSONL file to write")
+    subcommands.add_parser("seed", help="Load the demo USER_PROFILES_DB")
+    args = parser.parse_args()
+
+    store = SQLiteProfileStore(args.db)
+    if args.command == "import":
+        print(f"Imported {store.import_jsonl(args.path)} profiles into {args.db}")
+    elif args.command == "export":
+        print(f"Exported {store.export_jsonl(args.path)} households from {args.db}")
+    else:
+        rows = [(user_id, p) for user_id, profiles in USER_PROFILES_DB.items() for p in profiles]
+        store.bulk_load(rows)
+        print(f"Seeded {len(rows)} demo profiles into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Per-request token, call and deadline budgets for the gift planning workflow.
+
+Nothing else bounds what one gift plan may cost: a large household with chatty
+researchers can run for minutes. A `RequestBudget` is opened when
+GiftPlanningWorkflow starts and tracks, across every agent of that run, model
+tokens, model calls, grounded search calls and the wall-clock deadline.
+
+As the budget runs low the workflow degrades instead of overrunning:
+
+- low (less than `low_water` of any dimension left): researchers are asked for
+  fewer ideas per recipient and their answers are trimmed to match, and the
+  Aggregator skips suggesting cheaper alternatives;
+- exhausted: researchers that have not started answer with no ideas, running
+  ones are cut off at the deadline, and the Aggregator's table is built in code
+  from the ideas gathered so far (partial results).
+
+When the workflow ends, the usage report is logged and written to session
+state under `request_usage`; degraded plans are flagged to the user and not
+stored in the plan cache. Cached searches cost nothing and are not counted.
+
+Every researcher costs at least one model call and one search, and
+DynamicResearchAgent starts one per recipient brief, so each limit is a base
+(the concierge, Collector and Aggregator) plus an allowance per recipient. The
+budget opens with the base alone; once the research stage has read the briefs
+it calls `RequestBudget.set_recipients` and the limits grow to match, so a
+200-person office gets the same room per recipient as a family of three.
+
+Limits (environment; a base of 0 disables a dimension):
+    HGS_REQUEST_MAX_TOKENS=20000           HGS_REQUEST_TOKENS_PER_RECIPIENT=4000
+    HGS_REQUEST_MAX_MODEL_CALLS=10         HGS_REQUEST_CALLS_PER_RECIPIENT=3
+    HGS_REQUEST_MAX_SEARCHES=4             HGS_REQUEST_SEARCHES_PER_RECIPIENT=2
+    HGS_REQUEST_DEADLINE_SECONDS=90        HGS_REQUEST_SECONDS_PER_RECIPIENT=6
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai.types import Content, Part
+
+from .callbacks import add_callback, walk_agents
+from .context_scope import aggregator_scope
+from .custom_tools import TABLE_HEADER, budget_table_rows, evaluate_gift_budgets
+from .structured_output import answer_payload, replace_answer
+
+logger = logging.getLogger(__name__)
+
+USAGE_STATE_KEY = "request_usage"
+
+IDEAS_PER_RECIPIENT = 3
+"""What researchers are asked for while the budget is healthy."""
+
+
+@dataclass
+class BudgetLimits:
+    """Per-request limits: a base plus an allowance per recipient; a base of 0 leaves a dimension unlimited."""
+
+    max_tokens: int = 20000
+    max_model_calls: int = 10
+    max_search_calls: int = 4
+    deadline_seconds: float = 90.0
+    tokens_per_recipient: int = 4000
+    model_calls_per_recipient: int = 3
+    searches_per_recipient: int = 2
+    seconds_per_recipient: float = 6.0
+    low_water: float = 0.35
+    """Fraction of a dimension left below which the workflow starts degrading."""
+
+    @classmethod
+    def from_env(cls) -> "BudgetLimits":
+        return cls(
+            max_tokens=int(os.getenv("HGS_REQUEST_MAX_TOKENS", "20000")),
+            max_model_calls=int(os.getenv("HGS_REQUEST_MAX_MODEL_CALLS", "10")),
+            max_search_calls=int(os.getenv("HGS_REQUEST_MAX_SEARCHES", "4")),
+            deadline_seconds=float(os.getenv("HGS_REQUEST_DEADLINE_SECONDS", "90")),
+            tokens_per_recipient=int(os.getenv("HGS_REQUEST_TOKENS_PER_RECIPIENT", "4000")),
+            model_calls_per_recipient=int(os.getenv("HGS_REQUEST_CALLS_PER_RECIPIENT", "3")),
+            searches_per_recipient=int(os.getenv("HGS_REQUEST_SEARCHES_PER_RECIPIENT", "2")),
+            seconds_per_recipient=float(os.getenv("HGS_REQUEST_SECONDS_PER_RECIPIENT", "6")),
+        )
+
+    def for_recipients(self, recipients: int) -> "BudgetLimits":
+        """
+        The limits of a request with this many recipient briefs.
+
+        >>> limits = BudgetLimits().for_recipients(200)
+        >>> limits.max_model_calls, limits.max_search_calls, limits.deadline_seconds
+        (610, 404, 1290.0)
+        """
+
+        def scaled(base, per_recipient):
+            return base + per_recipient * recipients if base else base
+
+        return replace(
+            self,
+            max_tokens=scaled(self.max_tokens, self.tokens_per_recipient),
+            max_model_calls=scaled(self.max_model_calls, self.model_calls_per_recipient),
+            max_search_calls=scaled(self.max_search_calls, self.searches_per_recipient),
+            deadline_seconds=scaled(self.deadline_seconds, self.seconds_per_recipient),
+        )
+
+
+@dataclass
+class RequestBudget:
+    """Usage of one workflow run against its limits."""
+
+    configured: BudgetLimits
+    """Base and per-recipient limits; `limits` holds those of the current recipient count."""
+    recipients: int = 0
+    started: float = field(default_factory=time.monotonic)
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    model_calls: int = 0
+    search_calls: int = 0
+    per_agent: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    degradations: List[str] = field(default_factory=list)
+    """What was cut, in order, e.g. "Researcher_3: 1 idea" or "skipped cheaper alternatives"."""
+    limits: BudgetLimits = field(init=False)
+
+    def __post_init__(self):
+        self.limits = self.configured.for_recipients(self.recipients)
+
+    def set_recipients(self, recipients: int) -> None:
+        """Size the limits to the request's recipient briefs once they are known."""
+        self.recipients = recipients
+        self.limits = self.configured.for_recipients(recipients)
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def seconds_left(self) -> Optional[float]:
+        """Seconds to the deadline, or None without one."""
+        if not self.limits.deadline_seconds:
+            return None
+        return max(0.0, self.limits.deadline_seconds - self.elapsed())
+
+    def remaining(self) -> float:
+        """Smallest fraction left across all limited dimensions (1.0 when nothing is limited)."""
+        used = [
+            (self.tokens, self.limits.max_tokens),
+            (self.model_calls, self.limits.max_model_calls),
+            (self.search_calls, self.limits.max_search_calls),
+            (self.elapsed(), self.limits.deadline_seconds),
+        ]
+        return min([1.0] + [max(0.0, 1.0 - value / limit) for value, limit in used if limit])
+
+    @property
+    def level(self) -> str:
+        """"ok", "low" or "exhausted"."""
+        remaining = self.remaining()
+        if remaining <= 0.0:
+            return "exhausted"
+        return "low" if remaining < self.limits.low_water else "ok"
+
+    def ideas_per_recipient(self) -> int:
+        """Ideas to ask a researcher for: fewer as the budget shrinks, never fewer than one."""
+        remaining = self.remaining()
+        if remaining >= self.limits.low_water:
+            return IDEAS_PER_RECIPIENT
+        return max(1, round(IDEAS_PER_RECIPIENT * remaining / self.limits.low_water))
+
+    def degrade(self, note: str) -> None:
+        if note not in self.degradations:
+            logger.info("Request budget %s: %s", self.level, note)
+            self.degradations.append(note)
+
+    def record_call(self, agent_name: str, search: bool) -> None:
+        self.model_calls += 1
+        counters = self._agent(agent_name)
+        counters["model_calls"] += 1
+        if search:
+            self.search_calls += 1
+            counters["search_calls"] += 1
+
+    def record_tokens(self, agent_name: str, prompt_tokens: int, output_tokens: int) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self._agent(agent_name)["tokens"] += prompt_tokens + output_tokens
+
+    def _agent(self, agent_name: str) -> Dict[str, int]:
+        return self.per_agent.setdefault(agent_name, {"model_calls": 0, "search_calls": 0, "tokens": 0})
+
+    def report(self) -> dict:
+        """JSON-serializable usage of this request."""
+        return {
+            "tokens": {"prompt": self.prompt_tokens, "output": self.output_tokens, "total": self.tokens},
+            "model_calls": self.model_calls,
+            "search_calls": self.search_calls,
+            "elapsed_s": round(self.elapsed(), 3),
+            "recipients": self.recipients,
+            "limits": {
+                "tokens": self.limits.max_tokens,
+                "model_calls": self.limits.max_model_calls,
+                "search_calls": self.limits.max_search_calls,
+                "deadline_s": self.limits.deadline_seconds,
+            },
+            "remaining": round(self.remaining(), 3),
+            "degraded": bool(self.degradations),
+            "degradations": list(self.degradations),
+            "per_agent": self.per_agent,
+        }
+
+
+# Budgets of running workflows by invocation id (researchers share their parent's id)
+_budgets: Dict[str, RequestBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def get_request_budget(invocation_id: str) -> Optional[RequestBudget]:
+    """The budget of a running workflow, or None outside one."""
+    with _budgets_lock:
+        return _budgets.get(invocation_id)
+
+
+def start_request_budget(invocation_id: str, limits: Optional[BudgetLimits] = None) -> RequestBudget:
+    budget = RequestBudget(configured=limits or BudgetLimits.from_env())
+    with _budgets_lock:
+        # Runs that never reached finish_request_budget (e.g. they failed) are dropped eventually
+        stale = [
+            key for key, other in _budgets.items() if other.elapsed() > 2 * (other.limits.deadline_seconds or 600)
+        ]
+        for key in stale:
+            del _budgets[key]
+        _budgets[invocation_id] = budget
+    return budget
+
+
+def finish_request_budget(invocation_id: str) -> Optional[RequestBudget]:
+    with _budgets_lock:
+        return _budgets.pop(invocation_id, None)
+
+
+def request_budget_callbacks(limits: Optional[BudgetLimits] = None) -> Dict[str, Callable]:
+    """
+    Build the workflow's before/after agent callbacks that open and close the request budget.
+
+    Args:
+        limits: Limits for every request (defaults to the environment)
+
+    Returns:
+        {"before_agent_callback": ..., "after_agent_callback": ...}; the before
+        callback belongs after the plan cache's, so cached plans open no budget,
+        and the after callback before it (see attach_request_budget)
+    """
+
+    def before_agent(callback_context: CallbackContext) -> Optional[Content]:
+        start_request_budget(callback_context.invocation_id, limits)
+        return None
+
+    def after_agent(callback_context: CallbackContext) -> Optional[Content]:
+        budget = finish_request_budget(callback_context.invocation_id)
+        if budget is None:
+            return None
+        report = budget.report()
+        callback_context.state[USAGE_STATE_KEY] = report
+        logger.info(
+            "Request usage: %d tokens, %d model calls, %d searches in %.1fs%s",
+            budget.tokens, budget.model_calls, budget.search_calls, report["elapsed_s"],
+            f" (degraded: {'; '.join(budget.degradations)})" if budget.degradations else "",
+        )
+        if not budget.degradations:
+            return None
+        # Returning content also stops the later after_agent callbacks, so the
+        # plan cache does not keep this trimmed plan
+        return Content(role="model", parts=[Part(text=(
+            "_To keep this request quick, I trimmed the search: "
+            f"{'; '.join(budget.degradations)}. Ask me to refresh for a fuller plan._"
+        ))])
+
+    return {"before_agent_callback": before_agent, "after_agent_callback": after_agent}
+
+
+def _uses_search(llm_request: LlmRequest) -> bool:
+    tools = llm_request.config.tools if llm_request.config else None
+    return any(getattr(tool, "google_search", None) is not None for tool in tools or [])
+
+
+def _text_response(text: str) -> LlmResponse:
+    return LlmResponse(content=Content(role="model", parts=[Part(text=text)]))
+
+
+def researcher_budget_callbacks() -> Dict[str, Callable]:
+    """
+    before/after model callbacks enforcing the request budget for a researcher.
+
+    They belong after the search cache and context scoping callbacks, so only
+    real model calls are counted and the cleaned answer is the one trimmed.
+    """
+
+    def before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        budget = get_request_budget(callback_context.invocation_id)
+        if budget is None:
+            return None
+        if budget.level == "exhausted":
+            budget.degrade(f"{callback_context.agent_name}: skipped")
+            return _text_response("[]")
+        budget.record_call(callback_context.agent_name, _uses_search(llm_request))
+        ideas = budget.ideas_per_recipient()
+        if ideas < IDEAS_PER_RECIPIENT:
+            budget.degrade(f"{callback_context.agent_name}: {ideas} idea{'s' if ideas > 1 else ''}")
+            llm_request.append_instructions([f"Find only {ideas} gift idea{'s' if ideas > 1 else ''}, not 3."])
+        return None
+
+    def after_model(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        budget = get_request_budget(callback_context.invocation_id)
+        if budget is None or llm_response.partial:
+            return None
+        _record_usage(budget, callback_context.agent_name, llm_response)
+        ideas = budget.ideas_per_recipient()
+        if ideas >= IDEAS_PER_RECIPIENT:
+            return None
+        payload = answer_payload(llm_response)
+        if payload is not None and len(payload) > ideas:
+            # The model may still return three; keep the first ones
+            budget.degrade(f"{callback_context.agent_name}: {ideas} idea{'s' if ideas > 1 else ''}")
+            replace_answer(llm_response, payload[:ideas])
+        return None
+
+    return {"before_model_callback": before_model, "after_model_callback": after_model}
+
+
+def aggregator_budget_callbacks() -> Dict[str, Callable]:
+    """before/after model callbacks enforcing the request budget for the Aggregator."""
+
+    def before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        budget = get_request_budget(callback_context.invocation_id)
+        if budget is None:
+            return None
+        if budget.level == "exhausted":
+            budget.degrade("final table built without the reviewer")
+            return _text_response(partial_plan(callback_context.state))
+        budget.record_call(callback_context.agent_name, _uses_search(llm_request))
+        if budget.level == "low":
+            budget.degrade("skipped cheaper alternatives")
+            llm_request.append_instructions([
+                "The request budget is running low: skip step 2 (do not suggest cheaper alternatives; "
+                "just mark gifts over budget) and keep the answer short."
+            ])
+        return None
+
+    def after_model(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        budget = get_request_budget(callback_context.invocation_id)
+        if budget is not None and not llm_response.partial:
+            _record_usage(budget, callback_context.agent_name, llm_response)
+        return None
+
+    return {"before_model_callback": before_model, "after_model_callback": after_model}
+
+
+def partial_plan(state) -> str:
+    """The Aggregator's Markdown table built in code from the ideas gathered so far."""
+    scope = aggregator_scope(state)
+    checked = evaluate_gift_budgets(scope["gift_ideas"], scope["recipient_budgets"], scope["budget_currencies"])
+    if checked["rows"]:
+        lines = [TABLE_HEADER, *budget_table_rows(checked)]
+    else:
+        lines = ["_No gift ideas were found in time._"]
+    if scope["filtered_out"]:
+        lines.append("\nFiltered out: " + ", ".join(
+            f"'{item['gift_title']}' for {item['recipient']}" for item in scope["filtered_out"]
+        ))
+    return "\n".join(lines)
+
+
+def _record_usage(budget: RequestBudget, agent_name: str, llm_response: LlmResponse) -> None:
+    usage = llm_response.usage_metadata
+    if usage is not None:
+        budget.record_tokens(agent_name, usage.prompt_token_count or 0, usage.candidates_token_count or 0)
+
+
+def attach_request_budget(workflow: BaseAgent, limits: Optional[BudgetLimits] = None) -> BaseAgent:
+    """
+    Open a request budget around every run of `workflow` and enforce it in its agents.
+
+    Researchers created at run time get theirs from `budget_researcher`.
+
+    Returns:
+        The same workflow, for chaining in factories
+    """
+    callbacks = request_budget_callbacks(limits)
+    add_callback(workflow, "before_agent_callback", callbacks["before_agent_callback"])
+    add_callback(workflow, "after_agent_callback", callbacks["after_agent_callback"], first=True)
+    for node in walk_agents(workflow):
+        if isinstance(node, LlmAgent) and node.name == "AggregatorAgent":
+            _add_model_callbacks(node, aggregator_budget_callbacks())
+        elif isinstance(node, LlmAgent):
+            # Other stages (the Collector) are only counted
+            _add_model_callbacks(node, _counting_callbacks())
+    return workflow
+
+
+def budget_researcher(researcher: LlmAgent) -> LlmAgent:
+    """Enforce the request budget in a researcher built at run time."""
+    _add_model_callbacks(researcher, researcher_budget_callbacks())
+    return researcher
+
+
+def _add_model_callbacks(agent: LlmAgent, callbacks: Dict[str, Callable]) -> None:
+    add_callback(agent, "before_model_callback", callbacks["before_model_callback"])
+    add_callback(agent, "after_model_callback", callbacks["after_model_callback"])
+
+
+def _counting_callbacks() -> Dict[str, Callable]:
+    def before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        budget = get_request_budget(callback_context.invocation_id)
+        if budget is not None:
+            budget.record_call(callback_context.agent_name, _uses_search(llm_request))
+        return None
+
+    def after_model(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        budget = get_request_budget(callback_context.invocation_id)
+        if budget is not None and not llm_response.partial:
+            _record_usage(budget, callback_context.agent_name, llm_response)
+        return None
+
+    return {"before_model_callback": before_model, "after_model_callback": after_model}
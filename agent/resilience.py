@@ -0,0 +1,289 @@
+"""Retry, circuit breaking and request hedging for model calls.
+
+`ResilientLlm` wraps any ADK model and is used as the `model` of every agent in
+the workflow, so a transient 503 from Gemini at peak load is retried with
+jittered exponential backoff instead of ending the session with an apology. A
+circuit breaker shared by all agents fails fast while the backend is down, and
+optional hedged requests cut tail latency for slow calls. Every backend call,
+hedges and retries included, holds a slot of the shared model call limit
+(see admission.py) while it runs. Waiting for that slot is local congestion,
+so it is taken before the call's timeout starts and is never counted as a
+backend failure.
+"""
+
+import asyncio
+import functools
+import logging
+import random
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncGenerator, FrozenSet, Optional, Tuple
+
+from google.adk.models import BaseLlm, LlmCapabilities, LlmRequest, LlmResponse
+from google.adk.models.registry import LLMRegistry
+from google.genai.errors import APIError
+from pydantic import Field, PrivateAttr
+
+from .admission import ModelCallGate, ModelCallSlot, model_call_gate
+from .telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff bounded by attempts and an overall deadline."""
+
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    deadline: float = 60.0
+    retryable_codes: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """Transient API errors and timeouts are retried; everything else is not."""
+        if isinstance(error, APIError):
+            return error.code in self.retryable_codes
+        return isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based), using full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open circuit breaker.
+
+    After `failure_threshold` consecutive retryable failures the circuit opens and
+    calls fail immediately with CircuitOpenError. After `reset_timeout` seconds one
+    trial call is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError unless a call may proceed.
+
+        Returns:
+            True if this call is the half-open trial
+        """
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight):
+            raise CircuitOpenError("Model backend unavailable (circuit open)")
+        if state == "half-open":
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning("Circuit breaker opened after %d failures", self._failures)
+            self._opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        """Release a trial call that was cancelled before its outcome was known; the state is unchanged."""
+        self._trial_in_flight = False
+
+
+# One breaker for the whole process: every agent talks to the same backend
+shared_circuit_breaker = CircuitBreaker()
+
+
+class ResilientLlm(BaseLlm):
+    """
+    Model wrapper adding retries, a circuit breaker and optional hedged requests.
+
+    Retries only happen before the first response chunk has been yielded, so
+    streaming output is never duplicated.
+    """
+
+    inner: BaseLlm
+    retry_policy: RetryPolicy = Field(default_factory=RetryPolicy)
+    circuit_breaker: CircuitBreaker = Field(default_factory=lambda: shared_circuit_breaker)
+    hedge_after: Optional[float] = None
+    """Seconds to wait for a first response before sending a duplicate request."""
+
+    call_gate: Optional[ModelCallGate] = None
+    """Limit on concurrent backend calls shared across models (None: unlimited)."""
+
+    _stats: dict = PrivateAttr(default_factory=lambda: {"calls": 0, "retries": 0, "hedges": 0, "failures": 0})
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        # What the wrapped model supports (e.g. an output schema alongside tools)
+        return self.inner.capabilities
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        deadline = time.monotonic() + self.retry_policy.deadline
+        attempt = 0
+        self._stats["calls"] += 1
+
+        while True:
+            attempt += 1
+            trial = self.circuit_breaker.before_call()
+            slot = None
+            try:
+                # Waiting for a local call slot is congestion, not a backend failure: it is
+                # neither timed nor retried, and the deadline only counts backend time
+                queued = time.monotonic()
+                slot = await self.call_gate.acquire() if self.call_gate is not None else None
+                deadline += time.monotonic() - queued
+                remaining = max(0.0, deadline - time.monotonic())
+                responses, first = await asyncio.wait_for(self._start(llm_request, stream, slot), remaining)
+            except asyncio.CancelledError:
+                # Researcher timeouts, losing hedges and departed clients; otherwise
+                # the breaker would wait for this trial's outcome forever
+                if slot is not None:
+                    slot.release()
+                if trial:
+                    self.circuit_breaker.record_cancelled()
+                raise
+            except Exception as e:
+                if slot is not None:
+                    slot.release()
+                if not self.retry_policy.is_retryable(e):
+                    # The backend answered (e.g. a 400), so it is not down
+                    self.circuit_breaker.record_success()
+                    raise
+                self.circuit_breaker.record_failure()
+                delay = self.retry_policy.backoff(attempt)
+                if attempt >= self.retry_policy.max_attempts or time.monotonic() + delay >= deadline:
+                    self._stats["failures"] += 1
+                    logger.warning("Giving up on %s after %d attempts: %s", self.model, attempt, e)
+                    raise
+                self._stats["retries"] += 1
+                telemetry = get_telemetry()
+                if telemetry is not None:
+                    telemetry.record_retry(self.model, attempt, e)
+                logger.info("Retrying %s in %.2fs (attempt %d): %s", self.model, delay, attempt, e)
+                await asyncio.sleep(delay)
+                continue
+
+            self.circuit_breaker.record_success()
+            # Closing the stream promptly frees its model call slot
+            async with aclosing(responses):
+                if first is not None:
+                    yield first
+                async for response in responses:
+                    yield response
+            return
+
+    async def _first_response(
+        self, llm_request: LlmRequest, stream: bool, slot: Optional[ModelCallSlot] = None
+    ) -> Tuple[AsyncGenerator[LlmResponse, None], Optional[LlmResponse]]:
+        """
+        Start a call and wait for its first response (errors surface here).
+
+        Args:
+            slot: Model call slot already held for this call; released when the
+                call's responses end or it fails. Without one (hedges) a slot is
+                acquired here.
+        """
+        if self.call_gate is not None and slot is None:
+            slot = await self.call_gate.acquire()
+        try:
+            responses = self.inner.generate_content_async(llm_request, stream=stream)
+            if slot is not None:
+                responses = self.call_gate.wrap(responses, slot)
+            return responses, await responses.__anext__()
+        except StopAsyncIteration:
+            return responses, None
+        except BaseException:
+            if slot is not None:
+                slot.release()
+            raise
+
+    async def _start(
+        self, llm_request: LlmRequest, stream: bool, slot: Optional[ModelCallSlot] = None
+    ) -> Tuple[AsyncGenerator[LlmResponse, None], Optional[LlmResponse]]:
+        """Start the call, hedging with a duplicate request if the first one is slow."""
+        primary = asyncio.ensure_future(self._first_response(llm_request, stream, slot))
+        tasks = [primary]
+        try:
+            if self.hedge_after is None:
+                return await primary
+
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done:
+                return primary.result()
+
+            self._stats["hedges"] += 1
+            tasks.append(asyncio.ensure_future(
+                self._first_response(llm_request.model_copy(deep=True), stream)
+            ))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the losing (or abandoned) request
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        """Counters of calls, retries, hedges and final failures."""
+        return {**self._stats, "circuit": self.circuit_breaker.state}
+
+
+@functools.lru_cache(maxsize=None)
+def _registry_model(model_name: str) -> BaseLlm:
+    """One underlying model (and API client) per model name."""
+    return LLMRegistry.new_llm(model_name)
+
+
+def resilient_model(model_name: str, hedge_after: Optional[float] = None, **kwargs) -> ResilientLlm:
+    """
+    Wrap a model name from the ADK registry with retries and the shared circuit breaker.
+
+    Args:
+        model_name: Model name, e.g. "gemini-2.5-flash"
+        hedge_after: Seconds before a hedged duplicate request is sent (None disables hedging)
+        **kwargs: Further ResilientLlm fields (retry_policy, circuit_breaker, call_gate);
+            call_gate defaults to the shared admission control limit
+
+    Returns:
+        ResilientLlm usable as any agent's `model`
+    """
+    kwargs.setdefault("call_gate", model_call_gate())
+    return ResilientLlm(
+        model=model_name,
+        inner=_registry_model(model_name),
+        hedge_after=hedge_after,
+        **kwargs
+    )
@@ -0,0 +1,233 @@
+"""Shared cache for Gift Researcher search results.
+
+Recipients frequently share interests ("Coffee", "Tech Gadgets", "Books") and the
+same household asks again and again in December, so grounded search answers are
+cached and reused instead of paying for another model call. Entries live in an
+in-process LRU with a TTL, optionally backed by a local SQLite file so they
+survive restarts and can be shared between workers on the same host.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai.types import Content, Part
+
+from .parsing import dump_gift_ideas, extract_json_payload, parse_budget, validate_gift_ideas
+from .structured_output import answer_payload
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the budget bands used in cache keys; a $45 and a $48 budget
+# return the same kind of gifts, a $45 and a $120 budget do not.
+BUDGET_BAND_EDGES = (10, 25, 50, 75, 100, 150, 250, 500, 1000)
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(search_query: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace so equivalent queries share a key."""
+    query = _NON_WORD.sub(" ", str(search_query).lower())
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def budget_band(max_budget) -> str:
+    """
+    Map a budget to its band label.
+
+    >>> [budget_band(budget) for budget in (48, "$48", "1.500 €", "1.299,00", "$1,000", "")]
+    ['25-50', '25-50', '1000+', '1000+', '500-1000', 'any']
+    """
+    budget = parse_budget(max_budget)
+    if budget is None:
+        return "any"
+    lower = 0
+    for upper in BUDGET_BAND_EDGES:
+        if budget <= upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+class SearchCache:
+    """
+    Two-tier TTL/LRU cache for researcher search results.
+
+    The memory tier is an OrderedDict used as an LRU; the optional SQLite tier is
+    consulted on a memory miss and promoted back into memory on a hit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 6 * 60 * 60,
+        db_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(search_query: str, currency: str, max_budget) -> str:
+        """Build the cache key from the normalized query, currency and budget band."""
+        return "|".join((
+            normalize_query(search_query),
+            str(currency or "USD").upper(),
+            budget_band(max_budget),
+        ))
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        """Store a value in both tiers."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def _store(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        """Drop every entry whose key starts with prefix from both tiers; returns the in-memory count."""
+        with self._lock:
+            stale = [key for key in self._entries if key.startswith(prefix)]
+            for key in stale:
+                del self._entries[key]
+            if self._db is not None:
+                escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                self._db.execute("DELETE FROM search_cache WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+                self._db.commit()
+            return len(stale)
+
+    def clear(self) -> None:
+        """Drop all in-memory entries and reset the counters (the SQLite tier is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# Process-wide cache shared by all researcher instances
+search_cache = SearchCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(6 * 60 * 60))),
+    db_path=os.getenv("SEARCH_CACHE_DB") or None,
+)
+
+
+def _relabel(value: str, recipient_name: str) -> str:
+    """Point cached gift ideas at the current recipient (another one may have filled the entry)."""
+    ideas = extract_json_payload(value)
+    if not isinstance(ideas, list):
+        return value
+    for idea in ideas:
+        if isinstance(idea, dict):
+            idea["recipient"] = recipient_name
+    # Entries written before researchers had an output schema may need repairs
+    return dump_gift_ideas(validate_gift_ideas(ideas, recipient_name).accepted)
+
+
+def researcher_cache_callbacks(brief: dict, cache: SearchCache = search_cache) -> dict:
+    """
+    Build before/after model callbacks that serve a researcher from the search cache.
+
+    On a hit the researcher's grounded model call is skipped entirely; on a miss
+    the final text answer is stored once the model returns it.
+
+    Args:
+        brief: The recipient brief the researcher is working on
+        cache: Cache instance to use (defaults to the shared process-wide cache)
+
+    Returns:
+        Keyword arguments to pass to the researcher's LlmAgent constructor
+    """
+    key = SearchCache.make_key(
+        brief.get("search_query", ""),
+        brief.get("currency", "USD"),
+        brief.get("max_budget"),
+    )
+    recipient_name = brief.get("recipient_name", "")
+
+    def before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        logger.info("Search cache hit for %s (%s)", recipient_name, key)
+        return LlmResponse(
+            content=Content(role="model", parts=[Part(text=_relabel(cached, recipient_name))])
+        )
+
+    def after_model(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        # The answer text or the set_model_response arguments; only answers with gift ideas are cached
+        ideas = answer_payload(llm_response)
+        if ideas:
+            cache.put(key, json.dumps(ideas, ensure_ascii=False))
+        return None
+
+    return {"before_model_callback": before_model, "after_model_callback": after_model}
@@ -0,0 +1,129 @@
+"""Cold-start profile of the agent package.
+
+Starts a fresh interpreter with `-X importtime`, times the startup phases
+(importing agent.agent, building the root agent, building the App) and
+summarizes the import log by cumulative time per module and self time per
+top-level package, so slow imports show up before they reach a deployment
+with min_instances: 0.
+
+Usage:
+    python -m agent.startup_profile                 # text report
+    python -m agent.startup_profile --json --top 30
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+# Runs in the child interpreter; prints the phase timings as JSON on stdout
+_PHASES_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import agent.agent as module
+imported = time.perf_counter()
+module.get_root_agent()
+built = time.perf_counter()
+module.get_app()
+done = time.perf_counter()
+print(json.dumps({
+    "import_agent_module": imported - started,
+    "build_root_agent": built - imported,
+    "build_app": done - built,
+    "total": done - started,
+}))
+"""
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(log: str) -> List[dict]:
+    """Parse `-X importtime` stderr into [{module, self_us, cumulative_us, depth}]."""
+    entries = []
+    for line in log.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            entries.append({
+                "module": match.group(4),
+                "self_us": int(match.group(1)),
+                "cumulative_us": int(match.group(2)),
+                "depth": (len(match.group(3)) - 1) // 2,
+            })
+    return entries
+
+
+def summarize(entries: List[dict], top: int = 15) -> dict:
+    """Slowest modules by cumulative time and packages by summed self time."""
+    by_package: Dict[str, int] = defaultdict(int)
+    for entry in entries:
+        parts = entry["module"].split(".")
+        # google.* is a namespace package; group by its second level instead
+        package = ".".join(parts[:2]) if parts[0] == "google" and len(parts) > 1 else parts[0]
+        by_package[package] += entry["self_us"]
+
+    slowest = sorted(entries, key=lambda entry: entry["cumulative_us"], reverse=True)[:top]
+    return {
+        "modules_imported": len(entries),
+        "import_self_total_ms": round(sum(entry["self_us"] for entry in entries) / 1000, 1),
+        "slowest_modules": [
+            {"module": e["module"], "cumulative_ms": round(e["cumulative_us"] / 1000, 1),
+             "self_ms": round(e["self_us"] / 1000, 1)}
+            for e in slowest
+        ],
+        "packages": [
+            {"package": name, "self_ms": round(us / 1000, 1)}
+            for name, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+    }
+
+
+def profile_startup(top: int = 15) -> dict:
+    """Run the startup phases in a fresh interpreter and return the report."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PHASES_SCRIPT],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{result.stderr[-2000:]}")
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in phases.items()},
+        **summarize(parse_importtime(result.stderr), top),
+    }
+
+
+def format_report(report: dict) -> str:
+    """Human-readable version of the report."""
+    lines = ["Startup phases (ms):"]
+    lines += [f"  {name:<22} {ms:>9.1f}" for name, ms in report["phases_ms"].items()]
+    lines.append(f"\n{report['modules_imported']} modules imported, "
+                 f"{report['import_self_total_ms']:.1f} ms of import self time")
+    lines.append("\nSlowest imports (cumulative ms / self ms):")
+    lines += [
+        f"  {entry['cumulative_ms']:>9.1f} {entry['self_ms']:>9.1f}  {entry['module']}"
+        for entry in report["slowest_modules"]
+    ]
+    lines.append("\nSelf time by package (ms):")
+    lines += [f"  {entry['self_ms']:>9.1f}  {entry['package']}" for entry in report["packages"]]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Profile agent cold start (imports and construction)")
+    parser.add_argument("--top", type=int, default=15, help="Number of modules/packages to list")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = profile_startup(args.top)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
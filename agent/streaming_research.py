@@ -0,0 +1,137 @@
+"""Research stage that streams each recipient's checked gift ideas as soon as they are ready."""
+
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai.types import Content, Part
+
+from .custom_tools import TABLE_HEADER, budget_table_rows, evaluate_gift_budgets, resolve_user_id
+from .data_models import GiftIdea, RecipientProfile
+from .dynamic_research import DynamicResearchAgent, ResearchRun
+from .gift_dedup import DedupIndex, dedup_gift_ideas
+from .gift_filter import filter_gift_ideas
+from .parsing import parse_budget, parse_gift_ideas
+from .plan_cache import PLAN_STATE_KEY
+from .profile_store import get_profile_store
+
+logger = logging.getLogger(__name__)
+
+# Metadata key marking the partial result events (value: recipient name)
+PARTIAL_RESULT_KEY = "hgs_partial_result"
+
+
+@dataclass
+class StreamingRun(ResearchRun):
+    """Per-invocation state of a streaming fan-out."""
+
+    profiles: List[RecipientProfile] = field(default_factory=list)
+    accepted: List[GiftIdea] = field(default_factory=list)
+    rejected: List[dict] = field(default_factory=list)
+    dedup: DedupIndex = field(default_factory=DedupIndex)
+    duplicates: List[dict] = field(default_factory=list)
+    summary: Dict[str, int] = field(default_factory=lambda: {"Pass": 0, "Warning": 0, "Fail": 0})
+    header_sent: bool = False
+    table: List[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+
+class StreamingResearchAgent(DynamicResearchAgent):
+    """
+    Research stage for streaming mode, replacing the GiftFilter and Aggregator stages.
+
+    As each researcher finishes, its recipient's ideas are filtered against the
+    profile (dislikes, past gifts), deduplicated against the ideas already
+    streamed and budget-checked on their own, then yielded
+    as partial Markdown table rows. Time to first recommendation therefore
+    depends on the fastest recipient rather than the slowest one plus the
+    aggregator. A closing summary event reports the totals and writes the same
+    state keys as the non-streaming stages.
+    """
+
+    output_key: str = "gift_ideas"
+    rejected_key: str = "rejected_gift_ideas"
+    duplicates_key: str = "duplicate_gift_ideas"
+
+    def _start_run(self, ctx: InvocationContext, briefs: List[dict]) -> StreamingRun:
+        profiles = get_profile_store().get_profiles(resolve_user_id(ctx.session.state))
+        return StreamingRun(briefs=briefs, profiles=profiles)
+
+    def _on_researcher_done(
+        self, ctx: InvocationContext, run: StreamingRun, brief: dict, text: str
+    ) -> Optional[Event]:
+        recipient = brief["recipient_name"]
+        filtered = filter_gift_ideas(parse_gift_ideas(text, recipient), run.profiles)
+        # Products already streamed for an earlier recipient are not repeated
+        deduped = dedup_gift_ideas(filtered.accepted, run.dedup)
+        run.accepted.extend(deduped.accepted)
+        run.rejected.extend(filtered.rejected)
+        run.duplicates.extend(deduped.duplicates)
+
+        budget = parse_budget(brief.get("max_budget"))
+        lines = []
+        if budget is not None:
+            # Researchers may spell the name differently; the brief is authoritative here
+            ideas = [idea.model_copy(update={"recipient": recipient}) for idea in deduped.accepted]
+            checked = evaluate_gift_budgets(ideas, {recipient: budget}, {recipient: brief.get("currency") or "USD"})
+            for status, count in checked["summary"].items():
+                run.summary[status] += count
+            lines.extend(budget_table_rows(checked))
+        else:
+            for idea in deduped.accepted:
+                lines.append(
+                    f"| {idea.recipient} | {idea.gift_title} | {idea.estimated_price:.2f} {idea.currency} "
+                    "| - | No budget given |"
+                )
+
+        if not lines:
+            lines.append(f"| {recipient} | _No suitable ideas found_ | - | - | - |")
+        if not run.header_sent:
+            lines.insert(0, TABLE_HEADER)
+            run.header_sent = True
+        run.table.extend(lines)
+
+        logger.info(
+            "Streaming %d ideas for %s after %.2fs",
+            len(deduped.accepted), recipient, time.perf_counter() - run.started,
+        )
+        event = self._notice(ctx, "\n".join(lines))
+        event.custom_metadata = {PARTIAL_RESULT_KEY: recipient}
+        return event
+
+    def _final_event(self, ctx: InvocationContext, run: StreamingRun) -> Event:
+        missing = [brief["recipient_name"] for brief in run.briefs if brief["recipient_name"] not in run.results]
+        text = (
+            f"🎁 Done: {len(run.accepted)} gift ideas for {len(run.results)} of {len(run.briefs)} recipients "
+            f"({run.summary['Pass']} within budget, {run.summary['Warning']} slightly over, "
+            f"{run.summary['Fail']} over budget; {len(run.rejected)} filtered out, "
+            f"{len(run.duplicates)} duplicates merged)."
+        )
+        if missing:
+            text += f"\nNo results for: {', '.join(missing)}."
+        if run.rejected:
+            # Listed here rather than between the streamed rows so the table stays contiguous
+            text += "\n\nFiltered out:\n" + "\n".join(
+                f"- {item['recipient']}: '{item['gift_title']}' removed "
+                f"({'disliked' if item['rule'] == 'disliked_category' else 'already gifted'}: {item['matched']})"
+                for item in run.rejected
+            )
+
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=Content(role="model", parts=[Part(text=text)]),
+            actions=EventActions(state_delta={
+                self.results_key: run.results,
+                self.output_key: json.dumps([idea.model_dump() for idea in run.accepted]),
+                self.rejected_key: json.dumps(run.rejected),
+                self.duplicates_key: json.dumps(run.duplicates),
+                # The whole streamed plan, as the Aggregator would have written it
+                PLAN_STATE_KEY: "\n".join(run.table) + "\n\n" + text,
+            }),
+        )
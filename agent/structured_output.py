@@ -0,0 +1,113 @@
+"""Structured researcher output.
+
+Researchers are bound to `List[GiftIdea]` as their output schema, so the model
+answers with JSON in that shape (natively where the model accepts a response
+schema next to tools, otherwise through ADK's set_model_response tool) and ADK
+stores the parsed list under a per-recipient state key.
+
+Models still return prices such as "$39.99", lowercase currencies or the odd
+incomplete item. The after_model callback built here runs before ADK checks the
+answer against the schema (the answer text, or the set_model_response call's
+arguments): it validates the whole list in one batch with the pre-built
+TypeAdapter (see parsing.validate_gift_ideas), coerces what it can, drops what
+it cannot, and replaces the answer with the clean JSON. A malformed
+item therefore costs nothing instead of a failed researcher or another call.
+"""
+
+import json
+import logging
+import re
+from typing import Callable, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
+from google.genai.types import Content, Part
+
+from .parsing import dump_gift_ideas, extract_json_payload, validate_gift_ideas
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"\W+")
+
+# The tool ADK gives a model that cannot combine an output schema with other tools
+SET_MODEL_RESPONSE = "set_model_response"
+
+
+def recipient_state_key(recipient_name: str) -> str:
+    """Session state key holding one recipient's validated gift ideas, e.g. "gift_ideas_team_lead_sarah"."""
+    return "gift_ideas_" + _NON_WORD.sub("_", recipient_name.strip().lower()).strip("_")
+
+
+def answer_payload(llm_response: LlmResponse) -> Optional[list]:
+    """
+    The gift ideas a final researcher response carries, wherever the model put them.
+
+    That is the `items` argument of a set_model_response call (ADK's route to an
+    output schema when the model cannot combine one with tools) or the JSON
+    answer text. Partial and error responses, and calls to other tools, carry
+    none and give None.
+    """
+    if llm_response.partial or llm_response.error_code or not llm_response.content:
+        return None
+    parts = llm_response.content.parts or []
+    calls = [part.function_call for part in parts if part.function_call]
+    if calls:
+        answer = next((call for call in calls if call.name == SET_MODEL_RESPONSE), None)
+        if answer is None:
+            return None
+        items = (answer.args or {}).get("items")
+        return items if isinstance(items, list) else []
+    text = "".join(part.text for part in parts if part.text and not part.thought)
+    if not text:
+        return None
+    payload = extract_json_payload(text)
+    if isinstance(payload, dict):
+        payload = next((value for value in payload.values() if isinstance(value, list)), [payload])
+    return payload if isinstance(payload, list) else []
+
+
+def replace_answer(llm_response: LlmResponse, ideas: list) -> None:
+    """Put `ideas` back where answer_payload found the answer, keeping thoughts and metadata."""
+    parts = llm_response.content.parts or []
+    answer = next(
+        (part.function_call for part in parts if part.function_call and part.function_call.name == SET_MODEL_RESPONSE),
+        None,
+    )
+    if answer is not None:
+        answer.args = {**(answer.args or {}), "items": ideas}
+        return
+    thoughts = [part for part in parts if part.thought]
+    llm_response.content = Content(
+        role="model", parts=[*thoughts, Part(text=json.dumps(ideas, ensure_ascii=False))]
+    )
+
+
+def researcher_output_callback(brief: dict) -> Callable:
+    """
+    Build the after_model callback that validates and normalizes a researcher's answer.
+
+    Args:
+        brief: The recipient brief; supplies the recipient and default currency
+
+    Returns:
+        after_model callback; it edits the response in place and returns None so
+        later callbacks (e.g. the search cache) see the cleaned answer
+    """
+    recipient = brief.get("recipient_name", "")
+    currency = str(brief.get("currency") or "USD").upper()
+
+    def after_model(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        payload = answer_payload(llm_response)
+        if payload is None:
+            return None
+        validation = validate_gift_ideas(payload, recipient, currency)
+        if validation.rejected:
+            logger.info(
+                "%s: dropped %d malformed gift ideas for %s: %s",
+                callback_context.agent_name, len(validation.rejected), recipient,
+                "; ".join(item["error"] for item in validation.rejected),
+            )
+        replace_answer(llm_response, json.loads(dump_gift_ideas(validation.accepted)))
+        return None
+
+    return after_model
@@ -0,0 +1,359 @@
+"""Workflow-level OpenTelemetry spans and metrics for the gift planning agents.
+
+`instrument_agent` attaches ADK callbacks that open one span per agent run
+(concierge, collector, each Researcher_{i}, aggregator, ...) with child spans
+for every tool call and for grounded searches. Spans carry recipient count,
+token usage, search cache hits and retry counts; latency histograms and token
+counters are recorded alongside.
+
+Telemetry is off unless HGS_TELEMETRY is set:
+    HGS_TELEMETRY=console            # print spans and metrics to stdout
+    HGS_TELEMETRY=file:/tmp/hgs.jsonl  # append spans/metrics as JSON lines
+"""
+
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.plugins.base_plugin import BasePlugin
+
+from .callbacks import add_callback, walk_agents
+from .parsing import parse_recipient_briefs
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import metrics, trace
+except ImportError:  # pragma: no cover - opentelemetry is optional
+    metrics = trace = None
+
+_configured = False
+_lock = threading.Lock()
+
+# (invocation_id, agent_name) of the model call in progress; ResilientLlm only
+# sees the request, so its retries are attributed to the agent through this
+_calling_agent: ContextVar[Optional[Tuple[str, str]]] = ContextVar("hgs_calling_agent", default=None)
+
+
+def configure_telemetry(exporter: Optional[str] = None) -> bool:
+    """
+    Set up span and metric export once per process.
+
+    Args:
+        exporter: "console" or "file:<path>"; defaults to the HGS_TELEMETRY variable
+
+    Returns:
+        True if telemetry is enabled
+    """
+    global _configured
+    exporter = exporter if exporter is not None else os.getenv("HGS_TELEMETRY", "")
+    if not exporter or trace is None:
+        return False
+
+    with _lock:
+        if _configured:
+            return True
+        try:
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        except ImportError:
+            logger.warning("HGS_TELEMETRY is set but opentelemetry-sdk is not installed")
+            return False
+
+        if exporter.startswith("file:"):
+            out = open(exporter[len("file:"):], "a", encoding="utf-8")
+            span_exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+            metric_exporter = ConsoleMetricExporter(out=out, formatter=lambda data: data.to_json(indent=None) + "\n")
+        else:
+            span_exporter = ConsoleSpanExporter()
+            metric_exporter = ConsoleMetricExporter()
+
+        # Reuse a provider someone else (e.g. adk web) already installed
+        tracer_provider = trace.get_tracer_provider()
+        if not isinstance(tracer_provider, TracerProvider):
+            tracer_provider = TracerProvider()
+            trace.set_tracer_provider(tracer_provider)
+        tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+
+        if isinstance(metrics.get_meter_provider(), MeterProvider):
+            logger.warning("A MeterProvider is already installed; workflow metrics use its exporters")
+        else:
+            metrics.set_meter_provider(MeterProvider(metric_readers=[PeriodicExportingMetricReader(metric_exporter)]))
+
+        _configured = True
+        return True
+
+
+def _metric_agent_name(agent_name: str) -> str:
+    """Collapse Researcher_0..Researcher_N into one metric label to bound cardinality."""
+    return agent_name.rsplit("_", 1)[0] if agent_name.startswith("Researcher_") else agent_name
+
+
+class WorkflowTelemetry:
+    """ADK callbacks that maintain agent, tool and search spans plus metrics."""
+
+    def __init__(self):
+        self.tracer = trace.get_tracer("holiday_gift_savior")
+        meter = metrics.get_meter("holiday_gift_savior")
+        self.agent_duration = meter.create_histogram(
+            "hgs.agent.duration", unit="s", description="Wall time of one agent run"
+        )
+        self.tool_duration = meter.create_histogram(
+            "hgs.tool.duration", unit="s", description="Wall time of one tool call"
+        )
+        self.search_duration = meter.create_histogram(
+            "hgs.search.duration", unit="s", description="Wall time of one grounded search (model call)"
+        )
+        self.tokens = meter.create_counter("hgs.model.tokens", description="Model tokens by agent and type")
+        self.retries = meter.create_counter("hgs.model.retries", description="Retried model calls")
+        self.route_decisions = meter.create_counter(
+            "hgs.router.decisions", description="Model router choices by stage, model and reason"
+        )
+        self.admission_wait = meter.create_histogram(
+            "hgs.admission.wait", unit="s", description="Time a run or model call waited for a slot, by outcome"
+        )
+        self.admission_queue_depth = meter.create_up_down_counter(
+            "hgs.admission.queue_depth", description="Runs or model calls waiting for a slot"
+        )
+        self._agent_spans: Dict[Tuple[str, str], Tuple[object, float, dict]] = {}
+        self._child_spans: Dict[Tuple, Tuple[object, float]] = {}
+
+    # Agent spans -----------------------------------------------------------
+
+    def before_agent(self, callback_context):
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        span = self.tracer.start_span(
+            f"hgs.agent {callback_context.agent_name}",
+            attributes={"hgs.agent.name": callback_context.agent_name},
+        )
+        self._agent_spans[key] = (span, time.perf_counter(), {
+            "input_tokens": 0, "output_tokens": 0, "model_calls": 0, "search_cache_hits": 0, "retries": 0,
+        })
+        return None
+
+    def after_agent(self, callback_context):
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        entry = self._agent_spans.pop(key, None)
+        if entry is None:
+            return None
+        span, started, counters = entry
+        duration = time.perf_counter() - started
+
+        # Searches answered from the cache never reach after_model
+        for child_key in [k for k in self._child_spans if k[:2] == key and k[2] == "search"]:
+            search_span, _ = self._child_spans.pop(child_key)
+            search_span.set_attribute("hgs.search_cache.hit", True)
+            search_span.end()
+            counters["search_cache_hits"] += 1
+
+        briefs = callback_context.state.get("recipient_briefs")
+        if briefs:
+            span.set_attribute("hgs.recipient_count", len(parse_recipient_briefs(str(briefs))))
+        span.set_attribute("gen_ai.usage.input_tokens", counters["input_tokens"])
+        span.set_attribute("gen_ai.usage.output_tokens", counters["output_tokens"])
+        span.set_attribute("hgs.model_calls", counters["model_calls"])
+        span.set_attribute("hgs.search_cache.hits", counters["search_cache_hits"])
+        span.set_attribute("hgs.retry_count", counters["retries"])
+        span.end()
+        self.agent_duration.record(duration, {"agent": _metric_agent_name(callback_context.agent_name)})
+        return None
+
+    def _parent(self, invocation_id: str, agent_name: str):
+        entry = self._agent_spans.get((invocation_id, agent_name))
+        return trace.set_span_in_context(entry[0]) if entry else None
+
+    # Model calls (token usage, grounded search spans) ------------------------
+
+    def before_model(self, callback_context, llm_request):
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        # The model is called next in this same context
+        _calling_agent.set(key)
+        if key in self._agent_spans:
+            self._agent_spans[key][2]["model_calls"] += 1
+        tools = llm_request.config.tools if llm_request.config else None
+        if any(getattr(tool, "google_search", None) is not None for tool in tools or []):
+            span = self.tracer.start_span(
+                "hgs.tool google_search",
+                context=self._parent(*key),
+                attributes={"hgs.tool.name": "google_search"},
+            )
+            self._child_spans[(*key, "search", id(llm_request))] = (span, time.perf_counter())
+        return None
+
+    def after_model(self, callback_context, llm_response):
+        if llm_response.partial:
+            return None
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        agent_name = _metric_agent_name(callback_context.agent_name)
+        usage = llm_response.usage_metadata
+        input_tokens = (usage.prompt_token_count or 0) if usage else 0
+        output_tokens = (usage.candidates_token_count or 0) if usage else 0
+        if key in self._agent_spans:
+            counters = self._agent_spans[key][2]
+            counters["input_tokens"] += input_tokens
+            counters["output_tokens"] += output_tokens
+        if usage:
+            self.tokens.add(input_tokens, {"agent": agent_name, "type": "input"})
+            self.tokens.add(output_tokens, {"agent": agent_name, "type": "output"})
+
+        for child_key in [k for k in self._child_spans if k[:2] == key and k[2] == "search"]:
+            span, started = self._child_spans.pop(child_key)
+            span.set_attribute("hgs.search_cache.hit", False)
+            span.end()
+            self.search_duration.record(time.perf_counter() - started, {"agent": agent_name})
+        return None
+
+    def on_model_error(self, callback_context, llm_request, error):
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        for child_key in [k for k in self._child_spans if k[:2] == key and k[2] == "search"]:
+            span, _ = self._child_spans.pop(child_key)
+            span.record_exception(error)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, type(error).__name__))
+            span.end()
+        return None
+
+    # Tool spans --------------------------------------------------------------
+
+    def before_tool(self, tool, args, tool_context):
+        key = (tool_context.invocation_id, tool_context.agent_name)
+        span = self.tracer.start_span(
+            f"hgs.tool {tool.name}",
+            context=self._parent(*key),
+            attributes={"hgs.tool.name": tool.name},
+        )
+        if tool.name == "check_budget_compliance_batch":
+            span.set_attribute("hgs.gift_idea_count", len(args.get("gift_ideas") or []))
+            span.set_attribute("hgs.recipient_count", len(args.get("recipient_budgets") or {}))
+        self._child_spans[(*key, "tool", tool_context.function_call_id)] = (span, time.perf_counter())
+        return None
+
+    def after_tool(self, tool, args, tool_context, tool_response):
+        key = (tool_context.invocation_id, tool_context.agent_name, "tool", tool_context.function_call_id)
+        entry = self._child_spans.pop(key, None)
+        if entry is not None:
+            span, started = entry
+            span.end()
+            self.tool_duration.record(time.perf_counter() - started, {"tool": tool.name})
+        return None
+
+    def on_tool_error(self, tool, args, tool_context, error):
+        key = (tool_context.invocation_id, tool_context.agent_name, "tool", tool_context.function_call_id)
+        entry = self._child_spans.pop(key, None)
+        if entry is not None:
+            span, _ = entry
+            span.record_exception(error)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, type(error).__name__))
+            span.end()
+        return None
+
+    # Routing (reported by ModelRouter) ----------------------------------------
+
+    def record_route(self, stage: str, model: str, reason: str) -> None:
+        self.route_decisions.add(1, {"stage": stage, "model": model, "reason": reason})
+        span = trace.get_current_span()
+        span.set_attribute("hgs.router.model", model)
+        span.set_attribute("hgs.router.reason", reason)
+
+    # Admission (reported by AdmissionController) ------------------------------
+
+    def record_admission(self, kind: str, outcome: str, wait: float) -> None:
+        self.admission_wait.record(wait, {"kind": kind, "outcome": outcome})
+
+    def record_queue_depth(self, kind: str, delta: int) -> None:
+        self.admission_queue_depth.add(delta, {"kind": kind})
+
+    # Invocation end ------------------------------------------------------------
+
+    def end_invocation(self, invocation_id: str) -> None:
+        """
+        End spans still open when a run finishes.
+
+        The runner closes the root agent's generator once the transferred-to
+        workflow has produced the final response, so the concierge never reaches
+        its after_agent callback.
+        """
+        for key in [k for k in self._child_spans if k[0] == invocation_id]:
+            self._child_spans.pop(key)[0].end()
+        for key in [k for k in self._agent_spans if k[0] == invocation_id]:
+            span, started, counters = self._agent_spans.pop(key)
+            span.set_attribute("gen_ai.usage.input_tokens", counters["input_tokens"])
+            span.set_attribute("gen_ai.usage.output_tokens", counters["output_tokens"])
+            span.set_attribute("hgs.model_calls", counters["model_calls"])
+            span.set_attribute("hgs.retry_count", counters["retries"])
+            span.end()
+            self.agent_duration.record(time.perf_counter() - started, {"agent": _metric_agent_name(key[1])})
+
+    # Retries (reported by ResilientLlm) --------------------------------------
+
+    def record_retry(self, model: str, attempt: int, error: BaseException) -> None:
+        """Count a retry on the span of the agent whose model call failed."""
+        key = _calling_agent.get()
+        self.retries.add(1, {"model": model, "error": type(error).__name__})
+        entry = self._agent_spans.get(key) if key else None
+        if entry is None:
+            # A model called outside an instrumented agent
+            trace.get_current_span().add_event("hgs.retry", {"attempt": attempt, "error": str(error)[:200]})
+            return
+        span, _, counters = entry
+        counters["retries"] += 1
+        span.add_event("hgs.retry", {"model": model, "attempt": attempt, "error": str(error)[:200]})
+
+
+_telemetry: Optional[WorkflowTelemetry] = None
+
+
+def get_telemetry() -> Optional[WorkflowTelemetry]:
+    """Return the process-wide telemetry callbacks, or None if telemetry is disabled."""
+    global _telemetry
+    if _telemetry is None and configure_telemetry():
+        _telemetry = WorkflowTelemetry()
+    return _telemetry
+
+
+class TelemetryPlugin(BasePlugin):
+    """Runner plugin that closes an invocation's leftover spans when the run ends."""
+
+    def __init__(self, telemetry: WorkflowTelemetry):
+        super().__init__(name="hgs_telemetry")
+        self.telemetry = telemetry
+
+    async def after_run_callback(self, *, invocation_context) -> None:
+        self.telemetry.end_invocation(invocation_context.invocation_id)
+
+
+def telemetry_plugins() -> List[BasePlugin]:
+    """Plugins to register on the App/Runner (empty when telemetry is disabled)."""
+    telemetry = get_telemetry()
+    return [TelemetryPlugin(telemetry)] if telemetry is not None else []
+
+
+def instrument_agent(agent: BaseAgent) -> BaseAgent:
+    """
+    Attach telemetry callbacks to an agent and its sub-agents (no-op when disabled).
+
+    Model callbacks are placed first so they still observe calls that a later
+    callback (such as the search cache) answers without reaching the model.
+
+    Returns:
+        The same agent, for chaining in factories
+    """
+    telemetry = get_telemetry()
+    if telemetry is None:
+        return agent
+    for node in walk_agents(agent):
+        add_callback(node, "before_agent_callback", telemetry.before_agent)
+        add_callback(node, "after_agent_callback", telemetry.after_agent)
+        if isinstance(node, LlmAgent):
+            add_callback(node, "before_model_callback", telemetry.before_model, first=True)
+            add_callback(node, "after_model_callback", telemetry.after_model, first=True)
+            add_callback(node, "on_model_error_callback", telemetry.on_model_error, first=True)
+            add_callback(node, "before_tool_callback", telemetry.before_tool)
+            add_callback(node, "after_tool_callback", telemetry.after_tool)
+            add_callback(node, "on_tool_error_callback", telemetry.on_tool_error, first=True)
+    return agent
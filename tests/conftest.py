@@ -0,0 +1,29 @@
+"""Shared fixtures: a fresh in-memory profile store per test."""
+
+import copy
+from types import SimpleNamespace
+
+import pytest
+from google.genai.types import Content, Part
+
+from agent import profile_store
+from agent.profile_store import DictProfileStore
+from agent.sample_data import USER_PROFILES_DB
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """The demo households in a DictProfileStore installed as the process-wide store."""
+    fresh = DictProfileStore(copy.deepcopy(USER_PROFILES_DB))
+    monkeypatch.setattr(profile_store, "_profile_store", fresh)
+    return fresh
+
+
+@pytest.fixture
+def make_context():
+    """Factory for stand-ins of ADK's CallbackContext with the attributes the callbacks read."""
+
+    def make(text: str = "", **state) -> SimpleNamespace:
+        return SimpleNamespace(user_content=Content(role="user", parts=[Part(text=text)]), state=dict(state))
+
+    return make
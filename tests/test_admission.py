@@ -0,0 +1,140 @@
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+from google.adk.agents import BaseAgent
+from google.adk.events import Event
+from google.adk.runners import InMemoryRunner
+from google.genai.types import Content, Part
+
+from agent.admission import AdmissionController, AdmissionPlugin, AdmissionPolicy, ModelCallGate
+
+
+class SlowAgent(BaseAgent):
+    """Streams one event, then takes `seconds` before the next."""
+
+    seconds: float = 0.0
+
+    async def _run_async_impl(self, ctx) -> AsyncGenerator[Event, None]:
+        yield Event(author=self.name, content=Content(role="model", parts=[Part(text="working")]))
+        await asyncio.sleep(self.seconds)
+        yield Event(author=self.name, content=Content(role="model", parts=[Part(text="done")]))
+
+
+def policy(**kwargs):
+    return AdmissionPolicy(**{"max_sessions": 1, "max_model_calls": 2, "max_wait": 5.0, "expected_session_seconds": 0.1, **kwargs})
+
+
+async def run(runner, user_id="u1", text="Dad $50"):
+    session = await runner.session_service.create_session(app_name="test", user_id=user_id)
+    return [
+        event async for event in runner.run_async(
+            user_id=user_id, session_id=session.id, new_message=Content(role="user", parts=[Part(text=text)]),
+        )
+    ]
+
+
+def test_policy_needs_more_model_calls_than_sessions():
+    with pytest.raises(ValueError):
+        AdmissionPolicy(max_sessions=6, max_model_calls=6)
+
+
+def test_default_lease_is_a_multiple_of_the_request_deadline(monkeypatch):
+    monkeypatch.setenv("HGS_REQUEST_DEADLINE_SECONDS", "60")
+    assert AdmissionPolicy.from_env().lease_timeout == 180
+
+
+def test_cancelled_run_releases_its_slot():
+    async def scenario():
+        controller = AdmissionController(policy())
+        runner = InMemoryRunner(agent=SlowAgent(name="slow", seconds=30), app_name="test",
+                                plugins=[AdmissionPlugin(controller)])
+        # The client goes away while the run is streaming
+        streaming = asyncio.create_task(run(runner))
+        await asyncio.sleep(0.1)
+        assert controller.stats()["in_flight"] == 1
+        streaming.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await streaming
+        in_flight = controller.stats()["in_flight"]
+
+        runner.agent.seconds = 0
+        events = await asyncio.wait_for(run(runner, user_id="u2"), 2)
+        return in_flight, events, controller.stats()
+
+    in_flight, events, stats = asyncio.run(scenario())
+    assert in_flight == 0
+    assert events[-1].content.parts[0].text == "done"
+    assert stats["in_flight"] == 0 and stats["decisions"] == {"immediate": 2}
+
+
+def test_runs_over_capacity_queue_then_get_shed():
+    async def scenario():
+        controller = AdmissionController(policy(max_wait=0.2))
+        runner = InMemoryRunner(agent=SlowAgent(name="slow", seconds=0.5), app_name="test",
+                                plugins=[AdmissionPlugin(controller)])
+        return await asyncio.gather(run(runner, "u1"), run(runner, "u2")), controller.stats()
+
+    (first, second), stats = asyncio.run(scenario())
+    assert first[-1].content.parts[0].text == "done"
+    assert second[-1].author == "model" and "in line" in second[-1].content.parts[0].text
+    assert stats["decisions"] == {"immediate": 1, "timeout": 1}
+
+
+def test_each_users_queue_is_capped():
+    async def scenario():
+        controller = AdmissionController(policy(max_queue_per_user=1))
+        first = await controller.acquire("heavy", "a")
+        queued = asyncio.create_task(controller.acquire("heavy", "b"))
+        await asyncio.sleep(0)
+        shed = await controller.acquire("heavy", "c")
+        controller.release("a")
+        second = await queued
+        controller.release("b")
+        return first, shed, second
+
+    first, shed, second = asyncio.run(scenario())
+    assert first.admitted and second.admitted and second.reason == "queued"
+    assert not shed.admitted and shed.reason == "user_queue_full"
+
+
+def test_weighted_round_robin_interleaves_users():
+    async def scenario():
+        controller = AdmissionController(policy(max_queue_per_user=4, user_weights={"light": 1}))
+        await controller.acquire("heavy", "h0")
+        order = []
+
+        async def wait(user_id, key):
+            await controller.acquire(user_id, key)
+            order.append(key)
+            controller.release(key)
+
+        tasks = [asyncio.create_task(wait("heavy", f"h{i}")) for i in range(1, 4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(wait("light", "l1")))
+        await asyncio.sleep(0)
+        controller.release("h0")
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["h1", "l1", "h2", "h3"]
+
+
+def test_model_call_gate_hands_slots_over_in_order():
+    async def scenario():
+        gate = ModelCallGate(limit=1)
+        held = await gate.acquire()
+        order = []
+
+        async def call(name):
+            async with gate.slot():
+                order.append(name)
+
+        tasks = [asyncio.create_task(call(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        held.release()
+        held.release()  # releasing twice is a no-op
+        await asyncio.gather(*tasks)
+        return order, gate._in_flight
+
+    assert asyncio.run(scenario()) == (["a", "b", "c"], 0)
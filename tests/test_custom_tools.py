@@ -0,0 +1,56 @@
+from agent.custom_tools import TABLE_HEADER, budget_table_rows, evaluate_gift_budgets
+import json
+
+import pytest
+
+from agent.fx_rates import FxTable
+
+
+@pytest.fixture
+def fx(tmp_path):
+    path = tmp_path / "fx_rates.json"
+    path.write_text(json.dumps({"base": "USD", "as_of": "2025-01-01", "rates": {"USD": 1.0, "EUR": 0.5}}))
+    return FxTable(str(path))
+
+
+def idea(recipient, price, currency="USD", title="Gift"):
+    return {"recipient": recipient, "gift_title": title, "description": "", "estimated_price": price,
+            "product_link": "", "currency": currency}
+
+
+def test_budgets_given_as_text_are_parsed():
+    checked = evaluate_gift_budgets(
+        [idea("Dad", 45), idea("Mom", 1400, "EUR"), idea("Brother", 52)],
+        {"Dad": "$50", "Mom": "1.500 €", "Brother": 50},
+        {"Dad": "USD", "Mom": "EUR", "Brother": "USD"},
+    )
+    assert checked["errors"] == []
+    assert checked["summary"] == {"Pass": 2, "Warning": 1, "Fail": 0}
+    assert [row[3] for row in checked["rows"]] == [50.0, 1500.0, 50.0]
+
+
+def test_unreadable_budget_is_a_row_error():
+    checked = evaluate_gift_budgets(
+        [idea("Dad", 45), idea("mom", 30), idea("Uncle", 10)],
+        {"Dad": "whatever seems fair", "Mom": "40"},
+    )
+    assert checked["summary"] == {"Pass": 1, "Warning": 0, "Fail": 0}
+    assert [error["index"] for error in checked["errors"]] == [0, 2]
+    assert "whatever seems fair" in checked["errors"][0]["error"]
+
+
+def test_invalid_idea_and_missing_rate_do_not_abort_the_batch(fx):
+    checked = evaluate_gift_budgets(
+        [{"recipient": "Dad"}, idea("Dad", 20, "EUR"), idea("Dad", 20, "XYZ")],
+        {"Dad": 50}, {"Dad": "USD"}, fx_table=fx,
+    )
+    assert [error["index"] for error in checked["errors"]] == [0, 2]
+    assert checked["rows"][0][2] == 40.0
+    assert checked["rows"][0][7:] == [20.0, "EUR"]
+    assert checked["fx"]["base"] == "USD"
+
+
+def test_table_rows_show_the_original_price(fx):
+    checked = evaluate_gift_budgets([idea("Dad", 20, "EUR", "Kettle")], {"Dad": 50}, {"Dad": "USD"}, fx_table=fx)
+    assert TABLE_HEADER.startswith("| Recipient |")
+    assert budget_table_rows(checked) == ["| Dad | Kettle | 40.00 USD (20.00 EUR) | 50.00 USD | ✅ Pass |"]
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import AsyncGenerator
+
+from google.adk.agents import BaseAgent
+from google.adk.events import Event
+from google.adk.runners import InMemoryRunner
+from google.genai.types import Content, Part
+
+from agent.dynamic_research import DynamicResearchAgent
+
+
+class FakeResearcher(BaseAgent):
+    """Answers for its brief after `seconds`, counting how many researchers run at once."""
+
+    brief: dict
+    seconds: float = 0.05
+    running: SimpleNamespace
+
+    async def _run_async_impl(self, ctx) -> AsyncGenerator[Event, None]:
+        self.running.now += 1
+        self.running.peak = max(self.running.peak, self.running.now)
+        try:
+            await asyncio.sleep(self.brief.get("seconds", self.seconds))
+            if self.brief.get("fail"):
+                raise RuntimeError("search backend down")
+            text = f"ideas for {self.brief['recipient_name']}"
+            yield Event(author=self.name, content=Content(role="model", parts=[Part(text=text)]))
+        finally:
+            self.running.now -= 1
+
+
+def research(briefs, **kwargs):
+    running = SimpleNamespace(now=0, peak=0)
+    agent = DynamicResearchAgent(
+        name="Research",
+        researcher_factory=lambda brief, name: FakeResearcher(name=name, brief=brief, running=running),
+        **kwargs,
+    )
+
+    async def scenario():
+        runner = InMemoryRunner(agent=agent, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="u1", state={"recipient_briefs": json.dumps(briefs)})
+        events = [event async for event in runner.run_async(
+            user_id="u1", session_id=session.id, new_message=Content(role="user", parts=[Part(text="go")]))]
+        session = await runner.session_service.get_session(app_name="test", user_id="u1", session_id=session.id)
+        return events, session.state["research_results"]
+
+    events, results = asyncio.run(scenario())
+    return events, results, running.peak
+
+
+def test_one_researcher_per_brief_under_the_concurrency_cap():
+    briefs = [{"recipient_name": f"Guest {i}", "max_budget": 20} for i in range(7)]
+    _, results, peak = research(briefs, max_concurrency=2)
+    assert sorted(results) == sorted(brief["recipient_name"] for brief in briefs)
+    assert peak == 2
+
+
+def test_a_slow_or_failing_researcher_does_not_lose_the_others():
+    briefs = [
+        {"recipient_name": "Dad"},
+        {"recipient_name": "Mom", "seconds": 5},
+        {"recipient_name": "Brother", "fail": True},
+    ]
+    events, results, _ = research(briefs, max_concurrency=3, researcher_timeout=0.5)
+    assert results == {"Dad": "ideas for Dad"}
+    notices = [event.content.parts[0].text for event in events if event.author == "Research" and event.content]
+    assert any("Mom timed out" in text for text in notices)
+    assert any("Brother failed" in text for text in notices)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from agent.fast_collector import collector_fast_path, parse_structured_request, unparsed_words
+
+
+@pytest.fixture
+def smith(store):
+    return store.get_profiles("family_smith_123")
+
+
+@pytest.fixture
+def office(store):
+    return store.get_profiles("corporate_hr_789")
+
+
+def budgets(briefs):
+    return [(brief["recipient_name"], brief["max_budget"], brief["currency"]) for brief in briefs]
+
+
+def test_names_followed_by_budgets(smith):
+    briefs = parse_structured_request("Gift ideas for Dad $50, Mom €40 and my brother 30 EUR", smith)
+    assert budgets(briefs) == [("Dad", 50.0, "USD"), ("Mom", 40.0, "EUR"), ("Brother", 30.0, "EUR")]
+    assert briefs[0]["search_query"].endswith("gift")
+
+
+def test_budget_before_the_name_and_short_aliases(smith, office):
+    assert budgets(parse_structured_request("$1,000 for Dad, Mom 40", smith)) == [("Dad", 1000.0, "USD"), ("Mom", 40.0, "USD")]
+    assert budgets(parse_structured_request("Sarah 60 and Mike 45", office)) == [
+        ("Team Lead Sarah", 60.0, "USD"), ("Developer Mike", 45.0, "USD")]
+
+
+@pytest.mark.parametrize("text", [
+    "Dad and Mom $50 each",      # shared budget
+    "Dad $50, Mom",              # missing budget
+    "Dad $50, Dad $60",          # repeated name
+    "Dad 1.500 €",               # amount the fast path cannot read
+    "Dad $50, Mom 40 EUR, Brother 30",  # bare number with two currencies
+    "Grandpa $50",               # unknown recipient
+])
+def test_ambiguous_requests_go_to_the_model(smith, text):
+    assert parse_structured_request(text, smith) is None
+
+
+def test_unparsed_words_catch_stated_preferences(smith):
+    assert unparsed_words("Please find gifts for Dad $50 and Mom $40, thanks!", smith) == []
+    assert unparsed_words("Dad $50 (user_id: family_smith_123), no coffee this year", smith) == ["no", "coffee"]
+
+
+def test_collector_fast_path_answers_with_briefs(store, make_context):
+    response = collector_fast_path(make_context("Dad $50, Mom $40", profile_user_id="family_smith_123"), None)
+    assert [brief["recipient_name"] for brief in json.loads(response.content.parts[0].text)] == ["Dad", "Mom"]
+    assert collector_fast_path(make_context("Dad $50, he took up golf", profile_user_id="family_smith_123"), None) is None
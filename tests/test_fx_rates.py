@@ -0,0 +1,44 @@
+import json
+import os
+
+import pytest
+
+from agent.fx_rates import FxTable, format_amount
+
+
+def write_rates(path, as_of, **rates):
+    path.write_text(json.dumps({"base": "USD", "as_of": as_of, "rates": {"USD": 1.0, **rates}}))
+
+
+@pytest.fixture
+def rates_path(tmp_path):
+    path = tmp_path / "fx_rates.json"
+    write_rates(path, "2025-01-01", EUR=0.5, JPY=150.0)
+    return path
+
+
+def test_convert_many_uses_one_snapshot(rates_path):
+    table = FxTable(str(rates_path))
+    assert table.convert_many([20, 300, 10, 5], ["EUR", "JPY", "usd", "GBP"], ["USD", "EUR", "USD", "USD"]) == [
+        40.0, 1.0, 10.0, None]
+    assert table.stats()["conversions"] == 4
+
+
+def test_reloads_only_changed_files_and_keeps_the_last_good_table(rates_path):
+    table = FxTable(str(rates_path), refresh_interval=0)
+    write_rates(rates_path, "2025-01-02", EUR=0.25)
+    os.utime(rates_path, ns=(1, 1))
+    assert table.convert(10, "EUR", "USD") == 40.0
+    assert table.stats()["reloads"] == 1
+
+    rates_path.write_text(json.dumps({"base": "USD", "rates": {"EUR": -1}}))
+    os.utime(rates_path, ns=(2, 2))
+    assert table.snapshot().as_of == "2025-01-02"
+    # The broken version is not retried on every use
+    table.snapshot()
+    assert table.stats()["reload_errors"] == 1
+
+
+def test_format_amount():
+    assert format_amount(39.989, "usd") == "$39.99"
+    assert format_amount(40, "CHF") == "40.00 CHF"
@@ -0,0 +1,66 @@
+from agent.data_models import GiftIdea
+from agent.gift_dedup import canonical_link, dedup_gift_ideas, is_product_link
+
+
+def idea(recipient, title, price=40.0, link="", description="", currency="USD"):
+    return GiftIdea(
+        recipient=recipient, gift_title=title, description=description,
+        estimated_price=price, product_link=link, currency=currency,
+    )
+
+
+def titles(result):
+    return [(kept.recipient, kept.gift_title) for kept in result.accepted]
+
+
+def test_store_homepage_links_do_not_merge_unrelated_gifts():
+    ideas = [
+        idea("Team Lead Sarah", "Kindle Paperwhite", 140, "https://uncommongoods.com"),
+        idea("Developer Mike", "Mechanical Keyboard", 120, "https://www.uncommongoods.com/"),
+    ]
+    result = dedup_gift_ideas(ideas)
+    assert titles(result) == [("Team Lead Sarah", "Kindle Paperwhite"), ("Developer Mike", "Mechanical Keyboard")]
+    assert result.duplicates == []
+
+
+def test_product_links_merge_similar_titles_across_tracking_noise():
+    ideas = [
+        idea("Dad", "Kindle Paperwhite 16GB", 140, "https://www.amazon.com/Kindle-Paperwhite/dp/B08KTZ8249?tag=x"),
+        idea("Dad", "Amazon Kindle Paperwhite", 150, "https://amazon.com/dp/B08KTZ8249/ref=sr_1_1"),
+        idea("Dad", "Golf balls", 30, "https://golf.example.com/"),
+    ]
+    result = dedup_gift_ideas(ideas)
+    assert titles(result) == [("Dad", "Kindle Paperwhite 16GB"), ("Dad", "Golf balls")]
+    assert result.duplicates[0]["gift_title"] == "Amazon Kindle Paperwhite"
+
+
+def test_shared_product_link_with_a_different_title_is_not_trusted():
+    ideas = [
+        idea("Dad", "Espresso grinder", 60, "https://shop.example.com/gifts/for-him"),
+        idea("Dad", "Leather wallet", 45, "https://shop.example.com/gifts/for-him"),
+    ]
+    assert len(dedup_gift_ideas(ideas).accepted) == 2
+
+
+def test_is_product_link():
+    assert is_product_link(canonical_link("https://amazon.com/x/dp/B08KTZ8249"))
+    assert is_product_link(canonical_link("https://shop.example.com/products/pour-over-kettle"))
+    assert not is_product_link(canonical_link("https://uncommongoods.com"))
+    assert not is_product_link(canonical_link("https://uncommongoods.com/gifts/"))
+    assert not is_product_link("")
+
+
+def test_shared_product_stays_with_the_recipient_named_first_whatever_the_order():
+    mom = [idea("Mom", "Pour-over coffee kettle", 45), idea("Mom", "Gardening gloves", 20)]
+    dad = [idea("Dad", "Pour over coffee kettle", 44), idea("Dad", "Golf balls", 30)]
+    order = ["Dad", "Mom"]
+    for ideas in (mom + dad, dad + mom):
+        result = dedup_gift_ideas(ideas, recipient_order=order)
+        assert titles(result) == [
+            ("Dad", "Pour over coffee kettle"), ("Dad", "Golf balls"), ("Mom", "Gardening gloves"),
+        ]
+
+
+def test_only_idea_left_is_kept_even_if_shared():
+    ideas = [idea("Dad", "Pour over coffee kettle", 44), idea("Mom", "Pour-over coffee kettle", 45)]
+    assert len(dedup_gift_ideas(ideas, recipient_order=["Dad", "Mom"]).accepted) == 2
@@ -0,0 +1,59 @@
+from agent.data_models import GiftIdea, RecipientProfile
+from agent.gift_filter import filter_gift_ideas
+
+
+def profile(*disliked, past=()):
+    return RecipientProfile(recipient_name="Dad", persistent_interests=[], past_successful_gifts=list(past),
+                            disliked_categories=list(disliked))
+
+
+def idea(title, description=""):
+    return GiftIdea(recipient="Dad", gift_title=title, description=description, estimated_price=20,
+                    product_link="")
+
+
+def rejected(ideas, *profiles):
+    return [item["gift_title"] for item in filter_gift_ideas(ideas, profiles).rejected]
+
+
+def test_title_matches_stems_and_synonyms():
+    ideas = [idea("Wool SOCKS"), idea("Silk Necktie"), idea("Pour-over kettle")]
+    assert rejected(ideas, profile("Socks", "Tie")) == ["Wool SOCKS", "Silk Necktie"]
+
+
+def test_qualified_dislike_only_rejects_the_qualified_kind():
+    ideas = [idea("Minimal silver necklace"), idea("Heavy necklace"), idea("Heavy jewelry box")]
+    assert rejected(ideas, profile("Heavy Jewelry")) == ["Heavy necklace", "Heavy jewelry box"]
+
+
+def test_negated_mentions_do_not_count():
+    ideas = [
+        idea("Board game night, no video games", "Video games stay off; not a video game in sight."),
+        idea("Puzzle box without any video game"),
+        idea("Retro video game console"),
+    ]
+    assert rejected(ideas, profile("Video Games")) == ["Retro video game console"]
+
+
+def test_stocking_stuffer_is_not_socks():
+    ideas = [idea("Stocking stuffer multitool"), idea("Christmas stocking"), idea("Sock monkey plush")]
+    assert rejected(ideas, profile("Socks")) == ["Christmas stocking"]
+
+
+def test_description_only_mentions_are_weaker_evidence():
+    ideas = [
+        idea("Winter bundle", "A beanie and scarf that go well with his favourite socks."),
+        idea("Cozy bundle", "Three pairs of wool socks plus bamboo socks for the gym."),
+    ]
+    result = filter_gift_ideas(ideas, [profile("Socks")])
+    assert [item["gift_title"] for item in result.rejected] == ["Cozy bundle"]
+    assert result.rejected[0]["field"] == "description"
+
+
+def test_past_gifts_and_other_recipients():
+    other = RecipientProfile(recipient_name="Mom", disliked_categories=["Candles"])
+    ideas = [idea("Leather wallet"), GiftIdea(recipient="Mom", gift_title="Soy candle", description="",
+                                              estimated_price=20, product_link="")]
+    result = filter_gift_ideas(ideas, [profile(past=["Leather Wallet"]), other])
+    assert [(item["recipient"], item["rule"]) for item in result.rejected] == [
+        ("Dad", "past_gift"), ("Mom", "disliked_category")]
@@ -0,0 +1,64 @@
+import json
+
+from agent.plan_cache import plan_cache_callbacks, request_briefs
+from agent.search_cache import SearchCache
+
+PLAN = "| Dad | Espresso grinder | $45 |"
+
+
+def run_plan(callbacks, context, briefs, plan=PLAN):
+    """Simulate one workflow run: the Collector writes briefs, the Aggregator a plan."""
+    answer = callbacks["before_agent_callback"](context)
+    if answer is not None:
+        return answer.parts[0].text
+    context.state["recipient_briefs"] = json.dumps(briefs)
+    context.state["gift_plan"] = plan
+    callbacks["after_agent_callback"](context)
+    return None
+
+
+def test_structured_repeat_is_served_from_cache(store, make_context):
+    callbacks = plan_cache_callbacks(SearchCache())
+    profiles = store.get_profiles("family_smith_123")
+    briefs = request_briefs("Dad $50", profiles)
+
+    assert run_plan(callbacks, make_context("Dad $50"), briefs) is None
+    assert PLAN in run_plan(callbacks, make_context("Please find gifts for Dad, $50!"), briefs)
+
+
+def test_follow_up_text_never_hits_another_conversations_plan(store, make_context):
+    callbacks = plan_cache_callbacks(SearchCache())
+    dad = [{"recipient_name": "Dad", "max_budget": 50, "currency": "USD", "search_query": "golf gift"}]
+    mom = [{"recipient_name": "Mom", "max_budget": 50, "currency": "USD", "search_query": "gardening gift"}]
+
+    assert run_plan(callbacks, make_context("$50 each"), dad) is None
+    # Same words, different conversation: the Collector would produce other briefs
+    assert run_plan(callbacks, make_context("$50 each"), mom, plan="| Mom | Trowel | $20 |") is None
+    assert request_briefs("$50 each", store.get_profiles("family_smith_123")) is None
+    assert request_briefs("yes, go ahead", store.get_profiles("family_smith_123")) is None
+
+
+def test_plan_is_stored_under_the_collected_briefs(store, make_context):
+    cache = SearchCache()
+    callbacks = plan_cache_callbacks(cache)
+    profiles = store.get_profiles("family_smith_123")
+    briefs = request_briefs("Dad $50", profiles)
+
+    # A free-form turn whose Collector output matches the structured request
+    assert run_plan(callbacks, make_context("Dad again, same as last time"), briefs) is None
+    assert PLAN in run_plan(callbacks, make_context("Dad $50"), briefs)
+    # Other budgets are researched again
+    assert run_plan(callbacks, make_context("Dad $80"), request_briefs("Dad $80", profiles)) is None
+
+
+def test_refresh_and_profile_changes_bypass_the_cache(store, make_context):
+    callbacks = plan_cache_callbacks(SearchCache())
+    profiles = store.get_profiles("family_smith_123")
+    briefs = request_briefs("Dad $50", profiles)
+    run_plan(callbacks, make_context("Dad $50"), briefs)
+
+    assert run_plan(callbacks, make_context("Dad $50, refresh"), briefs) is None
+    dad = profiles[0].model_copy(update={"disliked_categories": [*profiles[0].disliked_categories, "Golf"]})
+    store.upsert_profile("family_smith_123", dad)
+    profiles = store.get_profiles("family_smith_123")
+    assert run_plan(callbacks, make_context("Dad $50"), request_briefs("Dad $50", profiles)) is None
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from agent.preference_log import PreferenceUpdate, PreferenceWriter
+from agent.sample_data import USER_PROFILES_DB
+
+
+@pytest.fixture
+def writer(tmp_path, store):
+    writers = []
+
+    def make(flush_interval=3600.0):
+        preference_writer = PreferenceWriter(str(tmp_path / "prefs.jsonl"), store=store, flush_interval=flush_interval)
+        writers.append(preference_writer)
+        return preference_writer
+
+    yield make
+    for preference_writer in writers:
+        preference_writer.close()
+
+
+def dad(store):
+    return next(p for p in store.get_profiles("family_smith_123") if p.recipient_name == "Dad")
+
+
+def test_record_is_write_behind(writer, store, tmp_path):
+    preference_writer = writer()
+    assert preference_writer.record("family_smith_123", "Dad", dislikes=["Mugs"]) == 1
+    assert "Mugs" not in dad(store).disliked_categories
+    assert not (tmp_path / "prefs.jsonl").exists()
+
+    assert preference_writer.flush() == 1
+    assert "Mugs" in dad(store).disliked_categories
+    assert len((tmp_path / "prefs.jsonl").read_text().splitlines()) == 1
+
+
+def test_updates_coalesce_case_insensitively(writer):
+    preference_writer = writer()
+    preference_writer.record("family_smith_123", "Dad", interests=["Chess"])
+    assert preference_writer.record("family_smith_123", " dad ", interests=["chess", "Kayaking"]) == 1
+    preference_writer.flush()
+    line = json.loads(open(preference_writer.log_path).readline())
+    assert line["interests"] == ["Chess", "Kayaking"]
+
+
+@pytest.mark.parametrize("flush_between", [False, True])
+def test_later_like_or_dislike_wins_and_replay_matches(writer, store, flush_between):
+    preference_writer = writer()
+    steps = [{"interests": ["Candles"]}, {"dislikes": ["candles"]}, {"interests": ["Socks"]}]
+    for step in steps:
+        preference_writer.record("family_smith_123", "Dad", **step)
+        if flush_between:
+            preference_writer.flush()
+    preference_writer.close()
+    live = dad(store)
+    assert "Socks" in live.persistent_interests and "Socks" not in live.disliked_categories
+    assert "candles" in live.disliked_categories
+    assert "Candles" not in live.persistent_interests
+
+    # A restart replays the log into fresh demo profiles
+    original = next(p for p in USER_PROFILES_DB["family_smith_123"] if p.recipient_name == "Dad")
+    store.bulk_load([("family_smith_123", original)])
+    writer()
+    assert dad(store) == live
+
+
+def test_merge_keeps_event_order():
+    update = PreferenceUpdate(interests=["Tea"])
+    update.merge(PreferenceUpdate(dislikes=["tea"]))
+    update.merge(PreferenceUpdate(interests=["TEA"]))
+    assert (update.interests, update.dislikes) == (["TEA"], [])
+    assert PreferenceUpdate(interests=["Tea"], dislikes=["Tea"]).interests == []
+
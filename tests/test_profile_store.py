@@ -0,0 +1,51 @@
+import copy
+
+import pytest
+
+from agent.data_models import RecipientProfile
+from agent.profile_store import DictProfileStore, SQLiteProfileStore
+from agent.sample_data import USER_PROFILES_DB
+
+ROWS = [(user_id, profile) for user_id, profiles in USER_PROFILES_DB.items() for profile in profiles]
+
+
+@pytest.fixture(params=["dict", "sqlite"])
+def any_store(request, tmp_path):
+    if request.param == "dict":
+        return DictProfileStore(copy.deepcopy(USER_PROFILES_DB))
+    store = SQLiteProfileStore(str(tmp_path / "profiles.db"))
+    store.bulk_load(ROWS)
+    return store
+
+
+def test_payload_is_cached_until_the_user_changes(any_store):
+    payload = any_store.get_profiles_json("family_smith_123")
+    assert any_store.get_profiles_json("family_smith_123") is payload
+    assert any_store.get_profiles_json("nobody") is None
+
+    changed = []
+    any_store.add_listener(changed.append)
+    any_store.upsert_profile("family_smith_123", RecipientProfile(recipient_name="Grandma"))
+    assert changed == ["family_smith_123"]
+    assert "Grandma" in any_store.get_profiles_json("family_smith_123")
+    # Other users keep their cached payload
+    assert any_store.get_profiles_json("corporate_hr_789") is any_store.get_profiles_json("corporate_hr_789")
+
+
+def test_upsert_replaces_by_recipient_name(any_store):
+    before = len(any_store.get_profiles("family_smith_123"))
+    any_store.upsert_profile("family_smith_123", RecipientProfile(recipient_name="Dad", persistent_interests=["Chess"]))
+    profiles = any_store.get_profiles("family_smith_123")
+    assert len(profiles) == before
+    assert next(p for p in profiles if p.recipient_name == "Dad").persistent_interests == ["Chess"]
+
+
+def test_sqlite_jsonl_round_trip(tmp_path):
+    source = SQLiteProfileStore(str(tmp_path / "a.db"))
+    source.bulk_load(ROWS)
+    assert source.export_jsonl(str(tmp_path / "households.jsonl")) == len(USER_PROFILES_DB)
+
+    target = SQLiteProfileStore(str(tmp_path / "b.db"))
+    assert target.import_jsonl(str(tmp_path / "households.jsonl"), batch_size=2) == len(ROWS)
+    assert target.get_profiles("family_smith_123") == USER_PROFILES_DB["family_smith_123"]
+    assert [user_id for user_id, _ in target.find_by_recipient("Dad")] == ["family_smith_123"]
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai.types import Content, GenerateContentConfig, GenerateContentResponseUsageMetadata, GoogleSearch, Part, Tool
+
+from agent.request_budget import (
+    BudgetLimits,
+    finish_request_budget,
+    researcher_budget_callbacks,
+    start_request_budget,
+)
+
+IDEAS = '[{"gift_title": "a"}, {"gift_title": "b"}, {"gift_title": "c"}]'
+
+
+def research(budget_id, recipients, tokens_per_call=2500):
+    """Run each researcher's model call through the budget callbacks; return their answers."""
+    callbacks = researcher_budget_callbacks()
+    answers = []
+    for i in range(recipients):
+        context = SimpleNamespace(invocation_id=budget_id, agent_name=f"Researcher_{i}", state={})
+        request = LlmRequest(config=GenerateContentConfig(tools=[Tool(google_search=GoogleSearch())]))
+        skipped = callbacks["before_model_callback"](context, request)
+        if skipped is not None:
+            answers.append(skipped.content.parts[0].text)
+            continue
+        response = LlmResponse(
+            content=Content(role="model", parts=[Part(text=IDEAS)]),
+            usage_metadata=GenerateContentResponseUsageMetadata(
+                prompt_token_count=tokens_per_call - 500, candidates_token_count=500,
+            ),
+        )
+        callbacks["after_model_callback"](context, response)
+        answers.append(response.content.parts[0].text)
+    return answers
+
+
+def test_limits_grow_with_the_recipient_count():
+    limits = BudgetLimits()
+    assert limits.for_recipients(0).max_model_calls == limits.max_model_calls
+    big = limits.for_recipients(200)
+    assert big.max_search_calls >= 200 and big.max_model_calls >= 200
+    assert big.deadline_seconds > limits.deadline_seconds
+
+
+def test_disabled_dimension_stays_unlimited():
+    limits = BudgetLimits(max_tokens=0).for_recipients(50)
+    assert limits.max_tokens == 0
+
+
+def test_corporate_household_is_researched_in_full():
+    budget = start_request_budget("corporate", BudgetLimits())
+    try:
+        budget.set_recipients(200)
+        answers = research("corporate", 200)
+    finally:
+        finish_request_budget("corporate")
+    assert answers == [IDEAS] * 200
+    assert budget.degradations == []
+    assert budget.report()["recipients"] == 200
+
+
+def test_base_limits_alone_skip_most_researchers():
+    budget = start_request_budget("unsized", BudgetLimits())
+    try:
+        answers = research("unsized", 20)
+    finally:
+        finish_request_budget("unsized")
+    assert answers.count("[]") > 10
+    assert any(note.endswith("skipped") for note in budget.degradations)
+
+
+def test_low_budget_trims_ideas():
+    budget = start_request_budget("tight", BudgetLimits(max_model_calls=10, model_calls_per_recipient=0))
+    try:
+        answers = research("tight", 8)
+    finally:
+        finish_request_budget("tight")
+    assert answers[0] == IDEAS
+    assert answers[-1].count("gift_title") < 3
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from google.adk.models import LlmRequest
+
+from agent.admission import ModelCallGate
+from agent.fake_llm import FakeLlm
+from agent.resilience import CircuitBreaker, CircuitOpenError, ResilientLlm, RetryPolicy
+
+
+def model(inner=None, **kwargs):
+    kwargs.setdefault("retry_policy", RetryPolicy(base_delay=0.01, max_delay=0.01, deadline=0.2))
+    kwargs.setdefault("circuit_breaker", CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    return ResilientLlm(model="gemini-fake", inner=inner or FakeLlm(reply="hi"), **kwargs)
+
+
+async def collect(llm):
+    return [response async for response in llm.generate_content_async(LlmRequest())]
+
+
+def test_waiting_for_a_call_slot_is_not_a_backend_failure():
+    async def scenario():
+        gate = ModelCallGate(limit=1)
+        llm = model(call_gate=gate)
+        held = await gate.acquire()
+        # Queued locally for longer than the whole retry deadline
+        call = asyncio.create_task(collect(llm))
+        await asyncio.sleep(0.5)
+        held.release()
+        responses = await call
+        return llm, gate, responses
+
+    llm, gate, responses = asyncio.run(scenario())
+    assert responses[0].content.parts[0].text == "hi"
+    assert llm.stats() == {"calls": 1, "retries": 0, "hedges": 0, "failures": 0, "circuit": "closed"}
+    assert gate._in_flight == 0
+
+
+def test_backend_errors_are_retried_and_release_their_slots():
+    gate = ModelCallGate(limit=1)
+    llm = model(FakeLlm(reply="hi", fail_first=1), call_gate=gate,
+                circuit_breaker=CircuitBreaker(failure_threshold=5))
+    responses = asyncio.run(collect(llm))
+    assert responses[0].content.parts[0].text == "hi"
+    assert llm.stats()["retries"] == 1
+    assert gate._in_flight == 0
+
+
+def test_slow_backend_times_out_and_opens_the_breaker():
+    gate = ModelCallGate(limit=1)
+    llm = model(FakeLlm(latency=1.0), call_gate=gate,
+                retry_policy=RetryPolicy(max_attempts=1, deadline=0.1))
+    with pytest.raises(TimeoutError):
+        asyncio.run(collect(llm))
+    assert llm.stats()["circuit"] == "open"
+    assert gate._in_flight == 0
+
+
+def test_cancelled_trial_lets_the_next_call_try():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    llm = model(FakeLlm(latency=1.0), circuit_breaker=breaker)
+
+    async def cancel_trial():
+        call = asyncio.create_task(collect(llm))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(cancel_trial())
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_hedged_call_releases_the_losing_slot():
+    gate = ModelCallGate(limit=2)
+    inner = FakeLlm(reply="hi", latency=0.3)
+    llm = model(inner, call_gate=gate, hedge_after=0.05,
+                retry_policy=RetryPolicy(deadline=2))
+    responses = asyncio.run(collect(llm))
+    assert responses[0].content.parts[0].text == "hi"
+    assert inner.calls == 2 and llm.stats()["hedges"] == 1
+    assert gate._in_flight == 0
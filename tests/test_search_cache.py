@@ -0,0 +1,59 @@
+import json
+import time
+
+from google.adk.models import LlmResponse
+from google.genai.types import Content, FunctionCall, Part
+
+from agent.search_cache import SearchCache, budget_band, researcher_cache_callbacks
+
+IDEA = {"recipient": "Dad", "gift_title": "Pour-over kettle", "description": "", "estimated_price": 45,
+        "product_link": "", "currency": "EUR"}
+
+
+def test_budget_bands_use_the_shared_budget_parser():
+    assert budget_band("1.500 €") == budget_band(1500) == "1000+"
+    assert budget_band("1.299,00") == "1000+"
+    assert budget_band("$1,000") == "500-1000"
+    assert budget_band("$48") == budget_band(45) == "25-50"
+    assert budget_band("whatever fits") == "any"
+
+
+def test_budgets_100x_apart_do_not_share_a_key():
+    assert SearchCache.make_key("coffee", "EUR", "1.500 €") != SearchCache.make_key("coffee", "EUR", "15 €")
+    assert SearchCache.make_key("Coffee!", "eur", "48") == SearchCache.make_key("coffee", "EUR", 45)
+
+
+def test_lru_eviction_and_ttl():
+    cache = SearchCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+
+    expired = SearchCache(ttl_seconds=0.01)
+    expired.put("a", "1")
+    time.sleep(0.02)
+    assert expired.get("a") is None
+
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SearchCache(db_path=path).put("coffee|USD|25-50", "[]")
+    cache = SearchCache(db_path=path)
+    assert cache.get("coffee|USD|25-50") == "[]"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_researcher_answers_are_cached_and_relabelled():
+    cache = SearchCache()
+    brief = {"recipient_name": "Dad", "search_query": "coffee gift", "max_budget": "50 €", "currency": "EUR"}
+    dad = researcher_cache_callbacks(brief, cache)
+    # Answer delivered through set_model_response rather than as text
+    dad["after_model_callback"](None, LlmResponse(content=Content(role="model", parts=[
+        Part(function_call=FunctionCall(name="set_model_response", args={"items": [IDEA]})),
+    ])))
+
+    mom = researcher_cache_callbacks({**brief, "recipient_name": "Mom", "max_budget": 48}, cache)
+    hit = mom["before_model_callback"](None, None)
+    assert json.loads(hit.content.parts[0].text)[0]["recipient"] == "Mom"
@@ -0,0 +1,46 @@
+import json
+from types import SimpleNamespace
+
+from google.adk.models import LlmResponse
+from google.genai.types import Content, FunctionCall, Part
+
+from agent.parsing import parse_price, validate_gift_ideas
+from agent.structured_output import recipient_state_key, researcher_output_callback
+
+RAW = [
+    {"title": "Pour-over kettle", "price": "$39.99", "url": "https://example.com/kettle"},
+    {"gift_title": "Espresso cups", "description": "Set of 4", "estimated_price": "1.299,00 €", "product_link": ""},
+    {"gift_title": "Mystery box", "estimated_price": "ask the seller", "product_link": ""},
+    "not an idea",
+]
+
+
+def test_batch_validation_repairs_and_reports_by_index():
+    result = validate_gift_ideas(RAW, recipient="Dad", default_currency="GBP")
+    assert [(idea.gift_title, idea.estimated_price, idea.currency) for idea in result.accepted] == [
+        ("Pour-over kettle", 39.99, "USD"), ("Espresso cups", 1299.0, "EUR")]
+    assert all(idea.recipient == "Dad" for idea in result.accepted)
+    assert result.rejected == [{"index": 2, "error": "no usable price"}, {"index": 3, "error": "not an object"}]
+
+
+def test_parse_price_reads_separators_and_currency():
+    assert parse_price("1.500 €") == (1500.0, "EUR")
+    assert parse_price("$1,000") == (1000.0, "USD")
+    assert parse_price(42) == (42.0, None)
+
+
+def test_callback_cleans_text_and_set_model_response_answers():
+    after_model = researcher_output_callback({"recipient_name": "Team Lead Sarah", "currency": "eur"})
+    context = SimpleNamespace(agent_name="Researcher_0")
+
+    text = LlmResponse(content=Content(role="model", parts=[Part(text="```json\n" + json.dumps(RAW) + "\n```")]))
+    assert after_model(context, text) is None
+    ideas = json.loads(text.content.parts[0].text)
+    assert [idea["recipient"] for idea in ideas] == ["Team Lead Sarah"] * 2
+
+    call = LlmResponse(content=Content(role="model", parts=[
+        Part(function_call=FunctionCall(name="set_model_response", args={"items": [{"gift": "Notebook", "price": 12}]})),
+    ]))
+    after_model(context, call)
+    assert call.content.parts[0].function_call.args["items"][0]["currency"] == "EUR"
+    assert recipient_state_key("Team Lead Sarah") == "gift_ideas_team_lead_sarah"
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.runners import InMemoryRunner
+from google.genai.types import Content, Part
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from agent import telemetry as telemetry_module
+from agent.fake_llm import FakeLlm
+from agent.resilience import CircuitBreaker, ResilientLlm, RetryPolicy
+from agent.telemetry import WorkflowTelemetry, instrument_agent
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    """Telemetry enabled with spans collected in memory."""
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    telemetry = WorkflowTelemetry()
+    telemetry.tracer = provider.get_tracer("test")
+    monkeypatch.setattr(telemetry_module, "_telemetry", telemetry)
+    return exporter
+
+
+def run_agent(agent):
+    async def run():
+        runner = InMemoryRunner(agent=agent, app_name="test")
+        session = await runner.session_service.create_session(app_name="test", user_id="u1")
+        async for _ in runner.run_async(
+            user_id="u1", session_id=session.id, new_message=Content(role="user", parts=[Part(text="hi")]),
+        ):
+            pass
+
+    asyncio.run(run())
+
+
+def flaky_agent(name, failures):
+    model = ResilientLlm(
+        model="gemini-fake",
+        inner=FakeLlm(reply="ok", fail_first=failures),
+        retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.01),
+        circuit_breaker=CircuitBreaker(failure_threshold=10),
+    )
+    return instrument_agent(LlmAgent(name=name, model=model, instruction="Say ok."))
+
+
+def agent_span(exporter, name):
+    return next(span for span in exporter.get_finished_spans() if span.name == f"hgs.agent {name}")
+
+
+def test_retries_are_counted_on_the_calling_agents_span(spans):
+    run_agent(flaky_agent("Researcher_0", failures=2))
+    span = agent_span(spans, "Researcher_0")
+    assert span.attributes["hgs.retry_count"] == 2
+    assert [event.name for event in span.events] == ["hgs.retry", "hgs.retry"]
+    assert span.attributes["hgs.model_calls"] == 1
+
+
+def test_agent_without_retries_reports_zero(spans):
+    run_agent(flaky_agent("CollectorAgent", failures=0))
+    assert agent_span(spans, "CollectorAgent").attributes["hgs.retry_count"] == 0